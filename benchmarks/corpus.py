@@ -0,0 +1,126 @@
+import argparse
+import os
+import sys
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import config
+
+"""
+
+    Generator of synthetic Cyrillic corpus for benchmarks: words of
+    random letters, which occur with Zipfian frequencies, are joined
+    into sentences and lines of random length. The same seed gives
+    the same corpus, so benchmarks do not need network or real texts.
+
+"""
+
+LETTERS = config.ALPHABETS['cyrillic'][33:]
+# words of vocabulary are drawn by blocks of this size
+WORDS_BLOCK = 1 << 16
+
+
+def make_vocabulary(size: int, rng) -> list:
+    """
+    Makes 'size' distinct random words: short words are more
+    frequent than long ones, like in natural language.
+
+    :param size: number of words
+    :param rng: numpy.random.Generator
+    :return: list of str
+    """
+    words = dict()
+    while len(words) < size:
+        lengths = numpy.minimum(rng.geometric(0.2, WORDS_BLOCK), 16)
+        letters = rng.integers(0, len(LETTERS), int(lengths.sum()))
+        text = ''.join(LETTERS[i] for i in letters.tolist())
+        ends = numpy.cumsum(lengths).tolist()
+        for begin, end in zip([0] + ends[:-1], ends):
+            words[text[begin:end]] = None
+            if len(words) == size:
+                break
+    return list(words)
+
+
+def iter_lines(size: int, vocabulary: int = 50000, line_length: int = 12,
+               exponent: float = 1.1, seed: int = 0):
+    """
+    Yields lines of synthetic corpus.
+
+    :param size: size of corpus in bytes (utf-8), the last line may
+        exceed it
+    :param vocabulary: number of distinct words
+    :param line_length: mean number of words in line
+    :param exponent: exponent of Zipf's law: frequency of word of rank
+        r is proportional to r ** -exponent
+    :param seed: seed of random numbers
+    :return: generator of str, lines without line breaks
+    """
+    rng = numpy.random.default_rng(seed)
+    words = make_vocabulary(vocabulary, rng)
+    # the first words of vocabulary are the most frequent
+    weights = numpy.arange(1, vocabulary + 1, dtype=numpy.float64) \
+        ** -exponent
+    cumulative = numpy.cumsum(weights / weights.sum())
+    written = 0
+    while written < size:
+        lengths = rng.poisson(line_length, 1024) + 1
+        codes = numpy.minimum(
+            numpy.searchsorted(cumulative, rng.random(int(lengths.sum()))),
+            vocabulary - 1).tolist()
+        # about every tenth word ends sentence
+        ends = (rng.random(len(codes)) < 0.1).tolist()
+        begin = 0
+        for length in lengths.tolist():
+            line = []
+            for i in range(begin, begin + length):
+                word = words[codes[i]]
+                if not line or ends[i - 1]:
+                    word = word.capitalize()
+                line.append(word + '.' if ends[i] else word)
+            begin += length
+            text = ' '.join(line)
+            yield text
+            written += len(text.encode('utf-8')) + 1
+            if written >= size:
+                return
+
+
+def write_corpus(path: str, size: int, **options):
+    """
+    Writes synthetic corpus (see 'iter_lines') to file 'path'.
+
+    :return: None
+    """
+    with open(path, 'w') as file:
+        for line in iter_lines(size, **options):
+            file.write(line + '\n')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    for argument, description in config.corpus_args.items():
+        parser.add_argument(argument, help=description)
+    parser_namespace, _ = parser.parse_known_args()
+
+    try:
+        size = int(float(parser_namespace.size or 1) * 2 ** 20)
+        options = {
+            'vocabulary': int(parser_namespace.vocabulary or 50000),
+            'line_length': int(parser_namespace.line_length or 12),
+            'exponent': float(parser_namespace.exponent or 1.1),
+            'seed': int(parser_namespace.seed or 0)
+        }
+    except ValueError:
+        print("Cannot parse options of corpus")
+        sys.exit(1)
+
+    if parser_namespace.output is not None:
+        write_corpus(parser_namespace.output, size, **options)
+    else:
+        for line in iter_lines(size, **options):
+            sys.stdout.write(line + '\n')
@@ -0,0 +1,679 @@
+import argparse
+import collections
+import concurrent.futures
+import io
+import itertools
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+import corpus
+import kgramstore
+import lexicon
+import model
+import modelstore
+import tokenizer
+
+try:
+    import webparser
+except ImportError:
+    # scenario 'html' is skipped without dependencies of web parser
+    webparser = None
+
+"""
+
+    Benchmarks of training and generation on synthetic corpora (see
+    corpus.py) of several sizes. Each scenario records metrics, which
+    are written to JSON file; results of previous run (baseline) may
+    be compared with the current ones to find regressions.
+
+    Runs offline: corpora are generated from fixed seed and kept in
+    work directory with models, trained on them.
+
+"""
+
+# length (in characters) of text, which is generated to measure speed
+GENERATE_LENGTH = 1 << 20
+# number and length of short texts (many sentence beginnings)
+SHORT_TEXTS = 2000
+SHORT_LENGTH = 50
+# number and length of texts of batch
+BATCH_TEXTS = 2000
+BATCH_LENGTH = 200
+# numbers of threads, which share one generator
+THREADS = (1, 4, 16)
+# numbers of processes, which train on files of corpus
+JOBS = (1, 2, 4, 8)
+# memory budget of spilled training (bytes), corpora are bigger
+SPILL_BUDGET = 1 << 20
+# lines with few words, where per-line training is the slowest
+SHORT_LINE_LENGTH = 4
+PER_LINE_LINES = 20000
+# sparse corpus: big vocabulary with flat frequencies, its model is
+# pruned, so generation often backs off to shorter contexts
+SPARSE_VOCABULARY = 200000
+SPARSE_EXPONENT = 0.9
+SPARSE_MIN_COUNT = 2
+# options of Model.prune in scenario 'prune'
+PRUNE_OPTIONS = {'min_count': 2, 'min_word_count': 2}
+# synthetic models of scenario store_scale: vocabulary (its powers
+# up to n-gram size fit into int64, so k-grams are drawn as numbers)
+# and seed of random numbers
+SCALE_VOCABULARY = 6000
+SCALE_SEED = 0
+
+
+class Measurements:
+    """
+    Metrics, measured on models of one size, and their files in
+    work directory.
+    """
+
+    def __init__(self, work_dir: str, label: str, repeat: int):
+        self.__work_dir = work_dir
+        self.__repeat = repeat
+        self.label = label
+        # metrics: name -> dict with value, unit and better direction
+        self.metrics = collections.OrderedDict()
+
+    def path(self, name: str) -> str:
+        """Path of file 'name' of this size in work directory"""
+        return os.path.join(self.__work_dir, '%s-%s' % (self.label, name))
+
+    def best(self, function, *args) -> float:
+        """
+        Runs 'function' several times.
+
+        :return: the least time of run in seconds
+        """
+        times = []
+        for _ in range(self.__repeat):
+            started = time.perf_counter()
+            function(*args)
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    def record(self, scenario: str, name: str, value: float, unit: str,
+               better: str = 'higher'):
+        """
+        Records metric 'name' of 'scenario'.
+
+        :param better: 'higher' or 'lower', direction of improvement
+        :return: None
+        """
+        key = '%s/%s/%s' % (scenario, name, self.label)
+        self.metrics[key] = {'value': value, 'unit': unit, 'better': better}
+        print('%-52s %14.6g %s' % (key, value, unit))
+
+
+class Case(Measurements):
+    """
+    Synthetic corpus of one size and models, trained on it, which
+    are shared by scenarios, and metrics, measured on them.
+    """
+
+    def __init__(self, work_dir: str, size: float, repeat: int):
+        super().__init__(work_dir, '%gMB' % size, repeat)
+        self.corpus = os.path.join(work_dir, 'corpus-%s.txt' % self.label)
+        if not os.path.exists(self.corpus):
+            corpus.write_corpus(self.corpus, int(size * 2 ** 20))
+        self.__lines = None
+        self.__model = None
+
+    def lines(self) -> list:
+        """Lines of the corpus"""
+        if self.__lines is None:
+            with open(self.corpus, 'r') as file:
+                self.__lines = file.read().splitlines()
+        return self.__lines
+
+    def model(self) -> model.Model:
+        """
+        Compact model, trained on the corpus, which is stored in
+        segmented ('model.pkl') and binary ('model.tgm') formats
+        """
+        if self.__model is None:
+            self.__model = train(self.lines(), compact=True)
+            with open(self.path('model.pkl'), 'wb') as file:
+                self.__model.store(file)
+            with open(self.path('model.tgm'), 'wb') as file:
+                self.__model.store_mapped(file)
+        return self.__model
+
+
+def train(lines: list, **options) -> model.Model:
+    """Trains model of config.N_GRAM_SIZE on 'lines' by chunks"""
+    trained = model.Model(config.N_GRAM_SIZE, **options)
+    for begin in range(0, len(lines), config.CHUNK_SIZE):
+        trained.train_lines(lines[begin:begin + config.CHUNK_SIZE])
+    return trained
+
+
+def count_tokens(texts) -> int:
+    """Number of words (and full-stops) in generated texts"""
+    return sum(len(text.split()) for text in texts)
+
+
+def load(path: str) -> model.Model:
+    """Loads model of any format from 'path'"""
+    loaded = model.Model(config.N_GRAM_SIZE)
+    with open(path, 'rb') as file:
+        loaded.load(file)
+    return loaded
+
+
+def bench_tokenizer(case: Case):
+    text_tokenizer = tokenizer.Tokenizer(lower=True, sentence_end=True)
+    lines = case.lines()
+    seconds = case.best(lambda: [text_tokenizer.split(line)
+                                 for line in lines])
+    case.record('tokenizer', 'lines_per_second', len(lines) / seconds,
+                'lines/s')
+
+
+def bench_lexicon(case: Case):
+    words = tokenizer.Tokenizer().split('\n'.join(case.lines()))
+    table = lexicon.Lexicon()
+    seconds = case.best(lambda: lexicon.Lexicon().encode(words, add=True))
+    case.record('lexicon', 'add_words_per_second', len(words) / seconds,
+                'words/s')
+    codes = table.encode(words, add=True)
+    seconds = case.best(table.encode, words)
+    case.record('lexicon', 'encode_words_per_second', len(words) / seconds,
+                'words/s')
+    seconds = case.best(table.decode, codes)
+    case.record('lexicon', 'decode_words_per_second', len(words) / seconds,
+                'words/s')
+    # baseline: dict word -> code and list of words for decoding
+    seconds = case.best(lambda: dict_encode({}, [], words))
+    case.record('lexicon', 'dict_add_words_per_second',
+                len(words) / seconds, 'words/s')
+    codes_table, words_table = {}, []
+    dict_encode(codes_table, words_table, words)
+    seconds = case.best(lambda: [codes_table[word] for word in words])
+    case.record('lexicon', 'dict_encode_words_per_second',
+                len(words) / seconds, 'words/s')
+    codes = codes.tolist()
+    seconds = case.best(lambda: ' '.join([words_table[code]
+                                          for code in codes]))
+    case.record('lexicon', 'dict_decode_words_per_second',
+                len(words) / seconds, 'words/s')
+    # memory per distinct word: arrays of lexicon, or dict with list
+    # and their str and int objects
+    case.record('lexicon', 'bytes_per_word', table.nbytes() / len(table),
+                'bytes', 'lower')
+    size = sys.getsizeof(codes_table) + sys.getsizeof(words_table) + sum(
+        sys.getsizeof(word) + sys.getsizeof(code)
+        for word, code in codes_table.items())
+    case.record('lexicon', 'dict_bytes_per_word', size / len(codes_table),
+                'bytes', 'lower')
+
+
+def dict_encode(codes_table: dict, words_table: list, words: list) -> list:
+    """
+    Encodes words with dict, new words get next codes (baseline of
+    Lexicon.encode with 'add').
+    """
+    codes = []
+    for word in words:
+        code = codes_table.get(word)
+        if code is None:
+            code = codes_table[word] = len(words_table)
+            words_table.append(word)
+        codes.append(code)
+    return codes
+
+
+def bench_html(case: Case):
+    if webparser is None:
+        print('html: web parser is not available, skipped')
+        return
+    page = '<html><body>%s</body></html>' % ''.join(
+        '<div><p>%s <b>%s</b></p><script>var x;</script></div>' % (
+            line, line) for line in case.lines())
+    size = len(page.encode('utf-8')) / 2 ** 20
+    seconds = case.best(lambda: list(webparser.extract_text(page)))
+    case.record('html', 'megabytes_per_second', size / seconds, 'MB/s')
+
+
+def bench_train(case: Case):
+    lines = case.lines()
+    words = tokenizer.Tokenizer().split('\n'.join(lines))
+    tokens = len(words)
+    for name, options in (('dict', {}), ('compact', {'compact': True}),
+                          ('spilled', {'memory_limit': SPILL_BUDGET})):
+        def run():
+            trained = train(lines, **options)
+            if 'memory_limit' in options:
+                # spilled runs are merged, when model is stored
+                with open(case.path('spilled.tgm'), 'wb') as file:
+                    trained.store_mapped(file)
+        seconds = case.best(run)
+        case.record('train', '%s_tokens_per_second' % name,
+                    tokens / seconds, 'tokens/s')
+    # memory, which trained model (k-grams and lexicon) takes,
+    # per distinct k-gram of the corpus
+    codes = lexicon.Lexicon().encode(words, add=True)
+    kgrams = sum(len(counts) for _, counts in
+                 model.count_codes(codes, 0, config.N_GRAM_SIZE))
+    for name, options in (('dict', {}), ('compact', {'compact': True})):
+        tracemalloc.start()
+        trained = train(lines, **options)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del trained
+        case.record('train', '%s_bytes_per_kgram' % name, size / kgrams,
+                    'bytes', 'lower')
+
+
+def bench_train_per_line(case: Case):
+    # lines of few words, like in poetry
+    lines = list(itertools.islice(corpus.iter_lines(
+        2 ** 62, line_length=SHORT_LINE_LENGTH), PER_LINE_LINES))
+
+    def run():
+        trained = model.Model(config.N_GRAM_SIZE)
+        for line in lines:
+            trained.train(line)
+    seconds = case.best(run)
+    case.record('train_per_line', 'lines_per_second', len(lines) / seconds,
+                'lines/s')
+
+
+def bench_train_jobs(case: Case):
+    # corpus is split into files for train.py --input-dir
+    input_dir = case.path('files')
+    if not os.path.isdir(input_dir):
+        os.mkdir(input_dir)
+        lines = case.lines()
+        step = -(-len(lines) // 8)
+        for i in range(0, len(lines), step):
+            with open(os.path.join(input_dir, '%d.txt' % (i // step)),
+                      'w') as file:
+                file.write('\n'.join(lines[i:i + step]) + '\n')
+    for jobs in JOBS:
+        # log of train.py is written to work directory
+        seconds = case.best(lambda: subprocess.run([
+            sys.executable, os.path.join(ROOT, 'train.py'),
+            '--input-dir', input_dir, '--model', case.path('jobs.pkl'),
+            '--jobs', str(jobs)], check=True,
+            cwd=os.path.dirname(input_dir)))
+        case.record('train_jobs', 'seconds_%d_jobs' % jobs, seconds, 's',
+                    'lower')
+
+
+def bench_train_stdin(case: Case):
+    # pipeline of train.py, which reads corpus from stdin
+    for jobs in JOBS:
+        def run():
+            with open(case.corpus, 'rb') as file:
+                subprocess.run([
+                    sys.executable, os.path.join(ROOT, 'train.py'),
+                    '--model', case.path('stdin.pkl'), '--compact', '1',
+                    '--jobs', str(jobs)], stdin=file, check=True,
+                    cwd=os.path.dirname(case.corpus))
+        case.record('train_stdin', 'seconds_%d_jobs' % jobs,
+                    case.best(run), 's', 'lower')
+
+
+def bench_store_load(case: Case):
+    trained = case.model()
+    seconds = case.best(lambda: trained.store(io.BytesIO()))
+    case.record('store_load', 'store_seconds', seconds, 's', 'lower')
+    # baseline: the same model in legacy format, pickled dict of
+    # k-grams and dict of words
+    with open(case.path('model.pkl'), 'rb') as file:
+        version = modelstore.read_header(file)
+        (_, words, kgrams), = modelstore.read_segments(
+            file, config.N_GRAM_SIZE, version=version, compact=False)
+    legacy = (kgrams, {word: code for code, word in enumerate(words)})
+    seconds = case.best(lambda: pickle.dump(legacy, io.BytesIO(), 2))
+    case.record('store_load', 'store_legacy_seconds', seconds, 's', 'lower')
+    with open(case.path('legacy.pkl'), 'wb') as file:
+        pickle.dump(legacy, file, 2)
+    del legacy, kgrams
+
+    def store_mapped():
+        with open(case.path('store.tgm'), 'wb') as file:
+            trained.store_mapped(file)
+    seconds = case.best(store_mapped)
+    case.record('store_load', 'store_mapped_seconds', seconds, 's', 'lower')
+    seconds = case.best(load, case.path('model.pkl'))
+    case.record('store_load', 'load_seconds', seconds, 's', 'lower')
+    seconds = case.best(load, case.path('legacy.pkl'))
+    case.record('store_load', 'load_legacy_seconds', seconds, 's', 'lower')
+    seconds = case.best(load, case.path('model.tgm'))
+    case.record('store_load', 'load_mapped_seconds', seconds, 's', 'lower')
+    for name in ('model.pkl', 'legacy.pkl', 'model.tgm'):
+        case.record('store_load', '%s_megabytes' % name.replace('.', '_'),
+                    os.path.getsize(case.path(name)) / 2 ** 20, 'MB',
+                    'lower')
+
+
+def synthetic_store(size: int) -> kgramstore.KGramStore:
+    """
+    Random k-grams of config.N_GRAM_SIZE and shorter ones: all words
+    of vocabulary and equal numbers of longer k-grams.
+
+    :param size: number of k-grams
+    :return: KGramStore
+    """
+    n = config.N_GRAM_SIZE
+    rng = numpy.random.default_rng(SCALE_SEED)
+    store = kgramstore.KGramStore(n)
+    store.extend_sorted(1, [(
+        kgramstore.pack(numpy.arange(SCALE_VOCABULARY).reshape(-1, 1), 1),
+        rng.geometric(0.01, SCALE_VOCABULARY))])
+    for k in range(2, n + 1):
+        number = (size - SCALE_VOCABULARY) // (n - 1)
+        # k-grams as numbers with SCALE_VOCABULARY digits
+        drawn = numpy.unique(rng.integers(0, SCALE_VOCABULARY ** k, number))
+        while len(drawn) < number:
+            drawn = numpy.unique(numpy.concatenate((drawn, rng.integers(
+                0, SCALE_VOCABULARY ** k, number - len(drawn)))))
+        codes = numpy.empty((number, k), dtype=kgramstore.CODE_TYPE)
+        for j in range(k - 1, -1, -1):
+            codes[:, j] = drawn % SCALE_VOCABULARY
+            drawn //= SCALE_VOCABULARY
+        del drawn
+        store.extend_sorted(k, [(kgramstore.pack(codes, k),
+                                 rng.geometric(0.5, number))])
+    return store
+
+
+def bench_store_scale(scale: Measurements, size: int):
+    """
+    Stores synthetic model of 'size' k-grams in segmented format
+    and loads it (the model is not trained, so sizes are not limited
+    by corpora).
+    """
+    store = synthetic_store(size)
+    words = ['w%d' % code for code in range(SCALE_VOCABULARY)]
+
+    def store_model():
+        with open(scale.path('model.pkl'), 'wb') as file:
+            modelstore.write_header(file)
+            modelstore.write_segment(file, 0, words, store,
+                                     config.N_GRAM_SIZE)
+    seconds = scale.best(store_model)
+    scale.record('store_scale', 'store_seconds', seconds, 's', 'lower')
+    del store
+    seconds = scale.best(load, scale.path('model.pkl'))
+    scale.record('store_scale', 'load_seconds', seconds, 's', 'lower')
+    scale.record('store_scale', 'model_pkl_megabytes',
+                 os.path.getsize(scale.path('model.pkl')) / 2 ** 20, 'MB',
+                 'lower')
+    os.remove(scale.path('model.pkl'))
+
+
+def bench_preprocess(case: Case):
+    trained = case.model()
+    seconds = case.best(trained.make_generator, True)
+    case.record('preprocess', 'eager_seconds', seconds, 's', 'lower')
+
+
+def bench_first_token(case: Case):
+    case.model()
+    # default output of train.py: k-grams are stored from dict
+    with open(case.path('dict.pkl'), 'wb') as file:
+        train(case.lines()).store(file)
+
+    def first_text(path, eager):
+        generator = load(path).make_generator(eager=eager)
+        ''.join(generator.iter_text(SHORT_LENGTH,
+                                    rng=numpy.random.default_rng(0)))
+    # the whole run of generate.py: loading, preparation, short text
+    # (eager preparation is measured by 'preprocess')
+    for name, path, eager in (('lazy', 'model.pkl', False),
+                              ('dict', 'dict.pkl', False),
+                              ('mapped', 'model.tgm', False)):
+        seconds = case.best(first_text, case.path(path), eager)
+        case.record('first_token', '%s_seconds' % name, seconds, 's',
+                    'lower')
+
+
+def bench_generate(case: Case):
+    case.model()
+    for name, path, eager in (('lazy', 'model.pkl', False),
+                              ('eager', 'model.pkl', True),
+                              ('mapped', 'model.tgm', False)):
+        generator = load(case.path(path)).make_generator(eager=eager)
+        texts = []
+
+        def run():
+            texts[:] = generator.iter_text(
+                GENERATE_LENGTH, rng=numpy.random.default_rng(0))
+        seconds = case.best(run)
+        case.record('generate', '%s_tokens_per_second' % name,
+                    count_tokens(texts) / seconds, 'tokens/s')
+    # many short texts, each begins with random k-gram
+    generator = load(case.path('model.pkl')).make_generator()
+    seconds = case.best(lambda: [''.join(generator.iter_text(
+        SHORT_LENGTH, rng=numpy.random.default_rng(i)))
+        for i in range(SHORT_TEXTS)])
+    case.record('generate', 'short_texts_per_second', SHORT_TEXTS / seconds,
+                'texts/s')
+
+
+def bench_generate_sparse(case: Case):
+    # corpus of the same size as the corpus of case
+    sparse = train(list(corpus.iter_lines(
+        os.path.getsize(case.corpus), vocabulary=SPARSE_VOCABULARY,
+        exponent=SPARSE_EXPONENT)), compact=True)
+    sparse.prune(min_count=SPARSE_MIN_COUNT)
+    with open(case.path('sparse.pkl'), 'wb') as file:
+        sparse.store(file)
+    with open(case.path('sparse.tgm'), 'wb') as file:
+        sparse.store_mapped(file)
+    for name, path, eager in (('lazy', 'sparse.pkl', False),
+                              ('eager', 'sparse.pkl', True),
+                              ('mapped', 'sparse.tgm', False)):
+        generator = load(case.path(path)).make_generator(eager=eager)
+        texts = []
+
+        def run():
+            texts[:] = generator.iter_text(
+                GENERATE_LENGTH, rng=numpy.random.default_rng(0))
+        seconds = case.best(run)
+        case.record('generate_sparse', '%s_tokens_per_second' % name,
+                    count_tokens(texts) / seconds, 'tokens/s')
+
+
+def bench_prune(case: Case):
+    case.model()
+    pruned = load(case.path('model.pkl'))
+    pruned.prune(**PRUNE_OPTIONS)
+    with open(case.path('pruned.pkl'), 'wb') as file:
+        pruned.store(file)
+    del pruned
+    # the same measurements before and after pruning
+    for name, path in (('full', 'model.pkl'), ('pruned', 'pruned.pkl')):
+        case.record('prune', '%s_megabytes' % name,
+                    os.path.getsize(case.path(path)) / 2 ** 20, 'MB',
+                    'lower')
+        seconds = case.best(load, case.path(path))
+        case.record('prune', '%s_load_seconds' % name, seconds, 's',
+                    'lower')
+        generator = load(case.path(path)).make_generator()
+        texts = []
+
+        def run():
+            texts[:] = generator.iter_text(
+                GENERATE_LENGTH, rng=numpy.random.default_rng(0))
+        seconds = case.best(run)
+        case.record('prune', '%s_tokens_per_second' % name,
+                    count_tokens(texts) / seconds, 'tokens/s')
+
+
+def bench_batch(case: Case):
+    trained = case.model()
+    seconds = case.best(lambda: list(trained.generate_batch(
+        BATCH_TEXTS, BATCH_LENGTH, random_seed=0)))
+    case.record('batch', 'texts_per_second', BATCH_TEXTS / seconds,
+                'texts/s')
+    # baseline: the same number of texts one by one, with one new
+    # generator per run like in generate_batch
+    def single():
+        generator = trained.make_generator()
+        for i in range(BATCH_TEXTS):
+            ''.join(generator.iter_text(
+                BATCH_LENGTH, rng=numpy.random.default_rng(i)))
+    seconds = case.best(single)
+    case.record('batch', 'single_texts_per_second', BATCH_TEXTS / seconds,
+                'texts/s')
+
+
+def bench_threads(case: Case):
+    generator = case.model().make_generator()
+    for threads in THREADS:
+        length = GENERATE_LENGTH // threads
+        texts = []
+
+        def run():
+            with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+                texts[:] = pool.map(lambda i: ''.join(generator.iter_text(
+                    length, rng=numpy.random.default_rng(i))),
+                    range(threads))
+        seconds = case.best(run)
+        case.record('threads', 'tokens_per_second_%d_threads' % threads,
+                    count_tokens(texts) / seconds, 'tokens/s')
+
+
+SCENARIOS = collections.OrderedDict([
+    ('tokenizer', bench_tokenizer),
+    ('lexicon', bench_lexicon),
+    ('html', bench_html),
+    ('train', bench_train),
+    ('train_per_line', bench_train_per_line),
+    ('train_jobs', bench_train_jobs),
+    ('train_stdin', bench_train_stdin),
+    ('store_load', bench_store_load),
+    ('preprocess', bench_preprocess),
+    ('first_token', bench_first_token),
+    ('generate', bench_generate),
+    ('generate_sparse', bench_generate_sparse),
+    ('prune', bench_prune),
+    ('batch', bench_batch),
+    ('threads', bench_threads)
+])
+# scenarios on synthetic models of given numbers of k-grams
+SCALE_SCENARIOS = collections.OrderedDict([
+    ('store_scale', bench_store_scale)
+])
+
+
+def compare(metrics: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compares metrics with baseline.
+
+    :param metrics: current metrics (see Case.record)
+    :param baseline: metrics of previous run
+    :param threshold: relative change, which is a regression
+    :return: list of names of metrics, which became worse by more
+        than 'threshold'
+    """
+    regressions = []
+    for key, metric in metrics.items():
+        if key not in baseline or not baseline[key]['value']:
+            continue
+        change = metric['value'] / baseline[key]['value'] - 1
+        if metric['better'] == 'lower':
+            change = -change
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(key)
+        print('%-52s %14.6g -> %14.6g %+7.1f%%%s' % (
+            key, baseline[key]['value'], metric['value'], 100 * change,
+            '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def run(namespace):
+    """
+    Runs scenarios on corpora of all sizes, writes results and
+    compares them with baseline.
+
+    :return: list of regressions
+    """
+    sizes = [float(size) for size in (namespace.sizes or '1,4').split(',')]
+    kgrams = [float(size) for size in
+              (namespace.kgrams or '1,10,50').split(',')]
+    names = list(SCENARIOS) + list(SCALE_SCENARIOS) \
+        if namespace.scenarios is None else namespace.scenarios.split(',')
+    for name in names:
+        if name not in SCENARIOS and name not in SCALE_SCENARIOS:
+            raise ValueError('unknown scenario %s' % name)
+    repeat = int(namespace.repeat or 3)
+    threshold = float(namespace.threshold or 0.1)
+    baseline = None
+    if namespace.compare is not None:
+        with open(namespace.compare, 'r') as file:
+            baseline = json.load(file)['metrics']
+
+    metrics = collections.OrderedDict()
+    with tempfile.TemporaryDirectory(prefix='benchmarks-') as temp_dir:
+        work_dir = namespace.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        for size in sizes:
+            case = Case(work_dir, size, repeat)
+            for name in names:
+                if name in SCENARIOS:
+                    SCENARIOS[name](case)
+            metrics.update(case.metrics)
+        for size in kgrams:
+            scale = Measurements(work_dir, '%gMkgrams' % size, repeat)
+            for name in names:
+                if name in SCALE_SCENARIOS:
+                    SCALE_SCENARIOS[name](scale, int(size * 10 ** 6))
+            metrics.update(scale.metrics)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sizes': sizes,
+            'kgrams': kgrams,
+            'repeat': repeat
+        },
+        'metrics': metrics
+    }
+    with open(namespace.output or 'benchmark.json', 'w') as file:
+        json.dump(results, file, indent=2)
+    if baseline is None:
+        return []
+    return compare(metrics, baseline, threshold)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    for argument, description in config.benchmark_args.items():
+        parser.add_argument(argument, help=description)
+    parser_namespace, _ = parser.parse_known_args()
+
+    try:
+        regressions = run(parser_namespace)
+    except ValueError as error:
+        print('Cannot run benchmarks: %s' % error)
+        sys.exit(1)
+    except OSError as error:
+        print('Cannot read or write results: %s' % error)
+        sys.exit(1)
+    if regressions:
+        print('%d regressions found.' % len(regressions))
+        sys.exit(1)
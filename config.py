@@ -1,9 +1,70 @@
 N_GRAM_SIZE = 5
+# number of lines, which are counted at once in training
+CHUNK_SIZE = 10000
+# number of chunks of stdin, which are counted by one worker process
+# (train.py --jobs)
+TASK_CHUNKS = 4
+# number of segments in model file, after which 'train.py --update'
+# rewrites it as one segment
+MAX_SEGMENTS = 8
+# word, which replaces words removed from lexicon by pruning
+UNKNOWN_WORD = '<unk>'
+# characters of words, which are kept by tokenizer (train.py --alphabet)
+ALPHABETS = {
+    'cyrillic': 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+                'абвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+    'latin': 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'digits': '0123456789'
+}
+DEFAULT_ALPHABETS = ('cyrillic',)
+# token of end of sentence (train.py --sentence-end) and
+# characters, which end sentence
+SENTENCE_END = '.'
+SENTENCE_END_CHARS = '.!?…'
+
+prune_args = {
+    "--min-count": """
+        (Optional argument)
+        Remove k-grams (except single words), which occur
+        less than this number of times.
+    """,
+    "--top-k": """
+        (Optional argument)
+        Keep only this number of the most frequent
+        continuations of each context.
+    """,
+    "--min-word-count": """
+        (Optional argument)
+        Replace words, which occur less than this number
+        of times, with '<unk>'.
+    """
+}
+
+metrics_args = {
+    "--metrics": """
+        (Optional argument)
+        The path to the file, to which performance metrics of the
+        run are written: wall time, peak memory and counters
+        (lines, tokens, k-grams) of each phase.
+    """,
+    "--metrics-format": """
+        (Optional argument)
+        Format of --metrics: 'json' - lines are appended to the
+        file, one per phase and one for the whole run (default),
+        'prometheus' - the file is rewritten in prometheus text format.
+    """,
+    "--profile": """
+        (Optional argument)
+        The path to the file, to which statistics of cProfile
+        are written: phases of the run are profiled.
+    """
+}
 
 generate_args = {
     "--model": """
         (Compulsory argument)
         The path to the file from which the model is loaded.
+        Both binary (see convert.py) and pickle models are accepted.
     """,
     "--seed": """
         (Optional argument) 
@@ -18,7 +79,41 @@ generate_args = {
         (Optional argument)
         The file to which the result will be recorded. 
         If there is no argument, output to stdout.
-    """
+    """,
+    "--random-seed": """
+        (Optional argument)
+        Integer seed of random numbers generator: the same seed
+        gives the same text. If not specified, text is unpredictable.
+    """,
+    "--eager": """
+        (Optional argument)
+        Compute probabilities of all contexts before generation,
+        which pays off for long sequences. By default they are
+        computed when context is met first time.
+    """,
+    "--cache-size": """
+        (Optional argument)
+        Number of contexts, which computed probabilities are
+        kept (65536 by default).
+    """,
+    "--batch": """
+        (Optional argument)
+        Number of independent sequences, started with --seed,
+        which are generated at once. Texts are separated with
+        empty line.
+    """,
+    "--seeds-file": """
+        (Optional argument)
+        The path to the file with initial words, one per line:
+        sequence is generated for each line (empty line - random
+        initial word), like with --batch.
+    """,
+    "--jobs": """
+        (Optional argument)
+        Number of worker processes, which generate parts of
+        the batch (1 by default).
+    """,
+    **metrics_args
 }
 
 train_args = {
@@ -36,8 +131,211 @@ train_args = {
         (Optional argument) 
         Change texts to lowercase.
     """,
+    "--alphabet": """
+        (Optional argument)
+        Comma separated names of alphabets (cyrillic, latin,
+        digits), which letters make words, other characters are
+        removed ('cyrillic' by default).
+    """,
+    "--sentence-end": """
+        (Optional argument)
+        Keep ends of sentences ('.', '!', '?') as words, so the
+        model learns where sentences end and begin.
+    """,
     "--webparse": """
         (Optional argument) 
         Url for site which model will train.
+    """,
+    "--crawl": """
+        (Optional argument)
+        Comma separated urls of pages, from which crawling of
+        sites is started: model trains on these pages and pages
+        of the same sites, which are linked from them.
+    """,
+    "--depth": """
+        (Optional argument)
+        Number of links from start page to the farthest
+        crawled page (2 by default).
+    """,
+    "--max-pages": """
+        (Optional argument)
+        Maximal number of crawled pages (100 by default).
+    """,
+    "--connections": """
+        (Optional argument)
+        Number of pages, which are fetched at the same
+        time (8 by default).
+    """,
+    "--per-host": """
+        (Optional argument)
+        Number of pages of one site, which are fetched at the
+        same time (4 by default).
+    """,
+    "--compact": """
+        (Optional argument)
+        Count k-grams in packed numpy arrays instead of dict,
+        which takes several times less memory on big corpora.
+    """,
+    "--memory-budget": """
+        (Optional argument)
+        Memory (in megabytes) for counted k-grams: when they take
+        more, they are sorted and spilled to disk, spilled runs are
+        merged into the model, which is stored in binary format
+        (see convert.py). Implies --compact.
+    """,
+    "--spill-dir": """
+        (Optional argument)
+        The path to the directory for k-grams spilled to disk
+        (system temporary directory by default).
+    """,
+    "--update": """
+        (Optional argument)
+        Continue training of the model, stored in --model:
+        new words and k-grams are appended to it as a segment,
+        codes of words are preserved.
+    """,
+    "--jobs": """
+        (Optional argument)
+        Number of worker processes, which count k-grams of
+        files from --input-dir or chunks of stdin in parallel
+        (1 by default).
+    """,
+    **prune_args,
+    **metrics_args
+}
+
+convert_args = {
+    "--model": """
+        (Compulsory argument)
+        The path to the model file in legacy (pickle) format.
+    """,
+    "--output": """
+        (Compulsory argument)
+        The path to the file in which the model is stored
+        in binary format, which is mapped into memory by generate.py.
+    """,
+    **prune_args,
+    **metrics_args
+}
+
+server_args = {
+    "--model": """
+        (Compulsory argument)
+        The path to the file from which the model is loaded.
+    """,
+    "--host": """
+        (Optional argument)
+        Host, on which HTTP server listens (localhost by default).
+    """,
+    "--port": """
+        (Optional argument)
+        Port, on which HTTP server listens (8080 by default).
+    """,
+    "--unix-socket": """
+        (Optional argument)
+        The path to Unix socket, on which server listens
+        instead of TCP host and port.
+    """
+}
+
+loadtest_args = {
+    "--url": """
+        (Optional argument)
+        Address of the server (http://localhost:8080 by default).
+    """,
+    "--unix-socket": """
+        (Optional argument)
+        The path to Unix socket of the server, used instead of --url.
+    """,
+    "--requests": """
+        (Optional argument)
+        Total number of requests (1000 by default).
+    """,
+    "--concurrency": """
+        (Optional argument)
+        Number of concurrent connections (16 by default).
+    """,
+    "--length": """
+        (Optional argument)
+        Length of the generated sequence in each request
+        (200 by default).
+    """,
+    "--seed": """
+        (Optional argument)
+        The initial word of each generated sequence.
+    """
+}
+
+corpus_args = {
+    "--output": """
+        (Optional argument)
+        The file to which synthetic corpus is written.
+        If there is no argument, output to stdout.
+    """,
+    "--size": """
+        (Optional argument)
+        Size of corpus in megabytes (1 by default).
+    """,
+    "--vocabulary": """
+        (Optional argument)
+        Number of distinct words (50000 by default).
+    """,
+    "--line-length": """
+        (Optional argument)
+        Mean number of words in line (12 by default).
+    """,
+    "--exponent": """
+        (Optional argument)
+        Exponent of Zipf's law of frequencies of words
+        (1.1 by default).
+    """,
+    "--seed": """
+        (Optional argument)
+        Seed of random numbers: the same seed gives the same
+        corpus (0 by default).
+    """
+}
+
+benchmark_args = {
+    "--output": """
+        (Optional argument)
+        The file to which results are written as JSON
+        (benchmark.json by default).
+    """,
+    "--sizes": """
+        (Optional argument)
+        Comma separated sizes of synthetic corpora in megabytes,
+        models of each size are benchmarked (1,4 by default).
+    """,
+    "--kgrams": """
+        (Optional argument)
+        Comma separated numbers of k-grams (in millions) of
+        synthetic models, which are stored and loaded by scenario
+        store_scale (1,10,50 by default).
+    """,
+    "--scenarios": """
+        (Optional argument)
+        Comma separated names of scenarios to run (all by default).
+    """,
+    "--repeat": """
+        (Optional argument)
+        Number of runs of each measurement, the best one is
+        taken (3 by default).
+    """,
+    "--work-dir": """
+        (Optional argument)
+        Directory for corpora and models, which are kept between
+        runs (temporary directory by default).
+    """,
+    "--compare": """
+        (Optional argument)
+        The path to results of previous run (baseline): metrics,
+        which became worse by more than --threshold, are reported
+        as regressions.
+    """,
+    "--threshold": """
+        (Optional argument)
+        Relative change of metric, which is a regression
+        (0.1 by default).
     """
 }
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+
+import config
+import model
+import debugging
+
+
+@debugging.convert_model
+def convert_model(model_path, output_path):
+    """
+
+    Converts model from legacy pickle format into binary format,
+    which generate.py maps into memory. Model is pruned before,
+    if pruning options are given.
+
+    :param model_path: path where model ('model.pkl') was stored
+    :param output_path: path where binary model will be stored
+    :return: None
+    """
+    freq_model = model.Model(config.N_GRAM_SIZE)
+    with open(model_path, "rb") as file:
+        freq_model.load(file)
+    if prune:
+        freq_model.prune(**prune)
+    # output is replaced only by completely written model
+    try:
+        with open(output_path + '.tmp', "wb") as file:
+            freq_model.store_mapped(file)
+    except ValueError:
+        os.remove(output_path + '.tmp')
+        raise
+    os.replace(output_path + '.tmp', output_path)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    for argument, description in config.convert_args.items():
+        parser.add_argument(argument, help=description)
+    parser_namespace, _ = parser.parse_known_args()
+
+    try:
+        debugging.enable_metrics(parser_namespace.metrics,
+                                 parser_namespace.metrics_format,
+                                 parser_namespace.profile)
+    except ValueError:
+        print("Unknown metrics format %s" % parser_namespace.metrics_format)
+        sys.exit(1)
+
+    try:
+        prune = model.prune_options(parser_namespace)
+    except ValueError:
+        print("Cannot parse pruning options")
+        sys.exit(1)
+
+    convert_model(parser_namespace.model, parser_namespace.output)
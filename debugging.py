@@ -1,5 +1,19 @@
+import atexit
+import collections
+import contextlib
+import cProfile
+import json
 import logging
+import os
 import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # there is no resource module on Windows, peak memory is not
+    # measured there
+    resource = None
 
 
 train_logger = logging.getLogger("TRAIN")
@@ -10,6 +24,12 @@ webparser_logger = logging.getLogger("WEBPARSER")
 webparser_logger.setLevel(logging.INFO)
 text_gen_logger = logging.getLogger("TEXTGENERATOR")
 text_gen_logger.setLevel(logging.INFO)
+convert_logger = logging.getLogger("CONVERT")
+convert_logger.setLevel(logging.INFO)
+server_logger = logging.getLogger("SERVER")
+server_logger.setLevel(logging.INFO)
+metrics_logger = logging.getLogger("METRICS")
+metrics_logger.setLevel(logging.INFO)
 
 file_handler = logging.FileHandler("logger.log")
 formatter = logging.Formatter(
@@ -20,13 +40,212 @@ train_logger.addHandler(file_handler)
 generate_logger.addHandler(file_handler)
 webparser_logger.addHandler(file_handler)
 text_gen_logger.addHandler(file_handler)
+convert_logger.addHandler(file_handler)
+server_logger.addHandler(file_handler)
+metrics_logger.addHandler(file_handler)
+
+# formats of file with metrics (--metrics-format)
+METRICS_FORMATS = ('json', 'prometheus')
+# prefix of names of metrics in prometheus format
+METRICS_PREFIX = 'textgenerator_'
+
+# metrics of the run (see 'enable_metrics'), nothing is recorded,
+# while they are disabled
+metrics = None
+
+
+def peak_rss():
+    """
+    Peak resident memory of the process in bytes: the maximum since
+    the start of the process, not since the start of a phase, None
+    if it is not measured on this platform
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class Metrics:
+    """
+    Performance metrics of the run: wall time, peak memory and
+    counters of each phase (loading, training, storing, generation),
+    which are written to file, when the process exits. Peak memory of
+    phase is peak of the process at the end of the phase, so phase,
+    which follows a heavier one, shows its peak.
+    """
+
+    def __init__(self, path: str = None, metrics_format: str = 'json',
+                 profile_path: str = None):
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(metrics_format)
+        self.__path = path
+        self.__format = metrics_format
+        self.__profile_path = profile_path
+        # phases are run under profiler, if its file is defined
+        self.__profiler = cProfile.Profile() \
+            if profile_path is not None else None
+        self.__started = time.perf_counter()
+        # number of running (nested) phases
+        self.__depth = 0
+        # finished phases: dicts, which are dumped as JSON lines
+        self.__phases = []
+        # counters (e.g. tokens) and values (e.g. size of model)
+        self.counters = collections.Counter()
+        self.gauges = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Public method
+
+        Context manager, which records wall time, peak memory (of the
+        process so far, see 'peak_rss') and counters, incremented in
+        it, as phase 'name'.
+        """
+        counters = self.counters.copy()
+        self.__depth += 1
+        if self.__profiler is not None and self.__depth == 1:
+            self.__profiler.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if self.__profiler is not None and self.__depth == 1:
+                self.__profiler.disable()
+            self.__depth -= 1
+            self.__phases.append(self.__record(
+                name, seconds, self.counters - counters))
+
+    def dump(self):
+        """
+        Public method
+
+        Appends records of phases and of the whole run to file as JSON
+        lines or rewrites file with metrics in prometheus text format,
+        writes statistics of profiler.
+
+        :return: None
+        """
+        try:
+            if self.__path is not None:
+                total = self.__record(
+                    'total', time.perf_counter() - self.__started,
+                    self.counters)
+                total['gauges'] = dict(self.gauges)
+                total['command'] = ' '.join(sys.argv)
+                if self.__format == 'json':
+                    with open(self.__path, 'a') as file:
+                        for record in self.__phases + [total]:
+                            file.write(json.dumps(record) + '\n')
+                else:
+                    with open(self.__path, 'w') as file:
+                        file.write(self.__prometheus(total))
+            if self.__profiler is not None:
+                self.__profiler.dump_stats(self.__profile_path)
+        except (PermissionError, NotADirectoryError, FileNotFoundError,
+                IsADirectoryError):
+            metrics_logger.error("Cannot write metrics, skipping.")
+            print("Cannot write metrics to %s." % (
+                self.__path or self.__profile_path))
+
+    @staticmethod
+    def __record(name: str, seconds: float, counters) -> dict:
+        """
+        Private method
+
+        :return: dict with metrics of phase 'name', which took
+            'seconds', and rates of its counters
+        """
+        return {
+            'phase': name,
+            'seconds': round(seconds, 6),
+            'peak_rss_bytes': peak_rss(),
+            'counters': dict(counters),
+            'per_second': {key: round(value / seconds, 3)
+                           for key, value in counters.items() if seconds}
+        }
+
+    def __prometheus(self, total: dict) -> str:
+        """
+        Private method
+
+        Formats metrics in prometheus text format, phases with the
+        same name are summed.
+
+        :param total: record of the whole run
+        :return: str
+        """
+        seconds = collections.Counter()
+        counters = collections.defaultdict(collections.Counter)
+        for record in self.__phases:
+            seconds[record['phase']] += record['seconds']
+            counters[record['phase']].update(record['counters'])
+        lines = ['# TYPE %sphase_seconds gauge' % METRICS_PREFIX]
+        lines += ['%sphase_seconds{phase="%s"} %s' % (
+            METRICS_PREFIX, name, value) for name, value in seconds.items()]
+        for key in sorted(total['counters']):
+            lines.append('# TYPE %s%s_total counter' % (METRICS_PREFIX, key))
+            lines += ['%s%s_total{phase="%s"} %d' % (
+                METRICS_PREFIX, key, name, phase_counters[key])
+                for name, phase_counters in counters.items()
+                if key in phase_counters]
+        for key, value in sorted(self.gauges.items()):
+            lines.append('# TYPE %s%s gauge' % (METRICS_PREFIX, key))
+            lines.append('%s%s %s' % (METRICS_PREFIX, key, value))
+        lines.append('# TYPE %sseconds gauge' % METRICS_PREFIX)
+        lines.append('%sseconds %s' % (METRICS_PREFIX, total['seconds']))
+        if total['peak_rss_bytes'] is not None:
+            lines.append('# TYPE %speak_rss_bytes gauge' % METRICS_PREFIX)
+            lines.append('%speak_rss_bytes %d' % (
+                METRICS_PREFIX, total['peak_rss_bytes']))
+        return '\n'.join(lines) + '\n'
+
+
+def enable_metrics(path: str = None, metrics_format: str = None,
+                   profile_path: str = None):
+    """
+    Enables metrics, if file for them or for statistics of profiler
+    is defined (options --metrics, --metrics-format and --profile),
+    they are written, when the process exits.
+
+    :raise ValueError: if format is unknown
+    """
+    global metrics
+    if path is None and profile_path is None:
+        return
+    metrics = Metrics(path, metrics_format or METRICS_FORMATS[0],
+                      profile_path)
+    atexit.register(metrics.dump)
+
+
+def phase(name: str):
+    """Context manager, which records phase 'name' (see Metrics.phase)"""
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.phase(name)
+
+
+def count(name: str, value: int = 1):
+    """Increments counter 'name' by 'value'"""
+    if metrics is not None:
+        metrics.counters[name] += value
+
+
+def gauge(name: str, value):
+    """Sets value 'name' (e.g. size of model)"""
+    if metrics is not None:
+        metrics.gauges[name] = value
 
 
 def scan_dir(to_wrap):
     def wrapper(path):
         train_logger.info("Scanning directory %s ..." % path)
         try:
-            to_wrap(path)
+            with phase('train'):
+                to_wrap(path)
         except (NotADirectoryError, PermissionError, FileNotFoundError):
             train_logger.error("Invalid path or no permission, terminating.")
             print('Cannot find/scan directory.')
@@ -38,7 +257,8 @@ def scan_dir(to_wrap):
 def scan_stdin(to_wrap):
     def wrapper():
         train_logger.info("Getting data from stdin...")
-        to_wrap()
+        with phase('train'):
+            to_wrap()
         train_logger.info("Done!")
 
     return wrapper
@@ -53,7 +273,9 @@ def store_model(to_wrap):
             sys.exit(1)
         train_logger.info("Storing model...")
         try:
-            to_wrap(model_path)
+            with phase('store'):
+                to_wrap(model_path)
+            gauge('model_bytes', os.path.getsize(model_path))
             train_logger.info("Model stored to %s" % model_path)
         except (PermissionError, NotADirectoryError, FileNotFoundError, 
             IsADirectoryError):
@@ -65,6 +287,26 @@ def store_model(to_wrap):
     return wrapper
 
 
+def load_model(to_wrap):
+    def wrapper(model_path):
+        train_logger.info("Loading model %s to update..." % model_path)
+        try:
+            with phase('load'):
+                to_wrap(model_path)
+        except FileNotFoundError:
+            train_logger.info("No model to update, training new one.")
+        except (PermissionError, NotADirectoryError, IsADirectoryError):
+            train_logger.error("Invalid path or no permission, terminating.")
+            print("Invalid path or no permission to %s." % model_path)
+            sys.exit(1)
+        except ValueError as error:
+            train_logger.error("Cannot update model: %s." % error)
+            print("Cannot update model %s: %s." % (model_path, error))
+            sys.exit(1)
+
+    return wrapper
+
+
 def scan_model(to_wrap):
     def wrapper(model_path):
         if model_path is None:
@@ -74,21 +316,83 @@ def scan_model(to_wrap):
             sys.exit(1)
         generate_logger.info("Loading model...")
         try:
-            to_wrap(model_path)
+            with phase('load'):
+                to_wrap(model_path)
+            gauge('model_bytes', os.path.getsize(model_path))
         except (PermissionError, NotADirectoryError, FileNotFoundError, 
             IsADirectoryError):
             generate_logger.error(
                 "Invalid path or no permission, terminating.")
             print("Invalid path or no permission to %s." % model_path)
             sys.exit(1)
+        except ValueError as error:
+            generate_logger.error("Cannot read model: %s." % error)
+            print("Cannot read model from %s: %s." % (model_path, error))
+            sys.exit(1)
         generate_logger.info("Done!")
 
     return wrapper
 
 
+def convert_model(to_wrap):
+    def wrapper(model_path, output_path):
+        if model_path is None or output_path is None:
+            convert_logger.error(
+                "Path for model or output is not defined, terminating.")
+            print('No file to convert model from/to.')
+            sys.exit(1)
+        convert_logger.info("Converting model %s..." % model_path)
+        try:
+            with phase('convert'):
+                to_wrap(model_path, output_path)
+            gauge('model_bytes', os.path.getsize(output_path))
+        except (PermissionError, NotADirectoryError, FileNotFoundError,
+                IsADirectoryError):
+            convert_logger.error("Invalid path or no permission, terminating.")
+            print("Invalid path or no permission to %s or %s." % (
+                model_path, output_path))
+            sys.exit(1)
+        except ValueError as error:
+            convert_logger.error("Cannot convert model: %s." % error)
+            print("Cannot convert model %s: %s." % (model_path, error))
+            sys.exit(1)
+        convert_logger.info("Model stored to %s" % output_path)
+
+    return wrapper
+
+
 def generate_sequence(to_wrap):
-    def wrapper(output, length, seed):
+    def wrapper(output, length, seed, random_seed, **options):
         generate_logger.info("Generating sequence.")
-        to_wrap(output, length, seed)
+        try:
+            with phase('generate'):
+                to_wrap(output, length, seed, random_seed, **options)
+        except ValueError as error:
+            generate_logger.error("Cannot generate sequence: %s." % error)
+            print("Cannot generate sequence: %s." % error)
+            sys.exit(1)
+
+    return wrapper
+
+
+def generate_batch(to_wrap):
+    def wrapper(output, length, seeds, random_seed, jobs, **options):
+        generate_logger.info("Generating batch of %d sequences "
+                             "in %d processes." % (len(seeds), jobs))
+        try:
+            with phase('generate'):
+                to_wrap(output, length, seeds, random_seed, jobs, **options)
+        except (NotADirectoryError, PermissionError, FileNotFoundError,
+                IsADirectoryError):
+            generate_logger.error(
+                "Invalid path or no permission for storing output, "
+                "terminating.")
+            print('Cannot find dir %s or permission denied!' % output)
+            sys.exit(1)
+        except ValueError as error:
+            generate_logger.error("Cannot generate batch: %s." % error)
+            print("Cannot generate batch: %s." % error)
+            sys.exit(1)
+        generate_logger.info("Batch is generated.")
 
     return wrapper
@@ -1,9 +1,14 @@
 import argparse
+import itertools
+import multiprocessing
 import os
 import sys
 
+import numpy
+
 import config
 import model
+import textgenerator
 import debugging
 
 
@@ -21,11 +26,60 @@ def scan_model(model_path):
 
 
 @debugging.generate_sequence
-def generate_sequence(output, length, seed):
+def generate_sequence(output, length, seed, random_seed, **options):
+    """
+    Generate sequence to the 'output' with 'length', started with 'seed',
+    'random_seed' makes sequence reproducible, 'options' are options
+    of generator (see Model.make_generator)
     """
-    Generate sequence to the 'output' with 'length', started with 'seed'
+    freq_model.generate_text(output, length, seed, random_seed, **options)
+
+
+@debugging.generate_batch
+def generate_batch(output, length, seeds, random_seed, jobs, **options):
     """
-    freq_model.generate_text(output, length, seed)
+    Generate sequence for each of 'seeds' to the 'output' (stdout if
+    it is not defined), texts are separated with empty line. Chunks of
+    the batch are generated by 'jobs' worker processes.
+    """
+    if jobs > 1:
+        tasks = [(chunk, seed_sequence, length) for chunk, seed_sequence
+                 in textgenerator.split_batch(seeds, random_seed)]
+        with multiprocessing.Pool(
+                jobs, initializer=start_worker,
+                initargs=(parser_namespace.model, options)) as pool:
+            write_texts(output, itertools.chain.from_iterable(
+                pool.imap(generate_chunk, tasks)))
+    else:
+        write_texts(output, freq_model.generate_batch(
+            seeds, length, random_seed, **options))
+
+
+def write_texts(output, texts):
+    """Writes 'texts' as soon as they are generated"""
+    if output is None:
+        for text in texts:
+            sys.stdout.write(text + '\n')
+        return
+    with open(output, 'w') as output_file:
+        for text in texts:
+            output_file.write(text + '\n')
+
+
+def start_worker(model_path, options):
+    """Loads model and makes generator in worker process"""
+    global worker_generator
+    worker_model = model.Model(config.N_GRAM_SIZE)
+    with open(model_path, "rb") as file:
+        worker_model.load(file)
+    worker_generator = worker_model.make_generator(**options)
+
+
+def generate_chunk(task):
+    """Generates texts of chunk of the batch in worker process"""
+    chunk, seed_sequence, length = task
+    return worker_generator.generate_batch(
+        chunk, length, numpy.random.default_rng(seed_sequence))
 
 
 if __name__ == '__main__':
@@ -37,13 +91,66 @@ if __name__ == '__main__':
         parser.add_argument(argument, help=description)
     parser_namespace, _ = parser.parse_known_args()
 
+    try:
+        debugging.enable_metrics(parser_namespace.metrics,
+                                 parser_namespace.metrics_format,
+                                 parser_namespace.profile)
+    except ValueError:
+        print("Unknown metrics format %s" % parser_namespace.metrics_format)
+        sys.exit(1)
+
     try:
         parser_namespace.length = int(parser_namespace.length)
     except (ValueError, TypeError):
         print("Cannot parse sequence's length")
         sys.exit(1)
 
+    try:
+        if parser_namespace.random_seed is not None:
+            parser_namespace.random_seed = int(parser_namespace.random_seed)
+    except ValueError:
+        print("Cannot parse random seed")
+        sys.exit(1)
+
+    try:
+        generator_options = {
+            'eager': parser_namespace.eager is not None,
+            'cache_size': int(parser_namespace.cache_size or
+                              textgenerator.CACHE_SIZE)
+        }
+    except ValueError:
+        print("Cannot parse cache size")
+        sys.exit(1)
+
+    # seeds of batch of sequences
+    seeds = None
+    if parser_namespace.seeds_file is not None:
+        try:
+            with open(parser_namespace.seeds_file, "r") as file:
+                seeds = [line.strip() or None for line in file]
+        except OSError:
+            print("Cannot read seeds from %s" % parser_namespace.seeds_file)
+            sys.exit(1)
+    elif parser_namespace.batch is not None:
+        try:
+            seeds = [parser_namespace.seed] * int(parser_namespace.batch)
+        except ValueError:
+            print("Cannot parse batch size")
+            sys.exit(1)
+
+    try:
+        jobs = int(parser_namespace.jobs or 1)
+    except ValueError:
+        print("Cannot parse number of jobs")
+        sys.exit(1)
+
     scan_model(parser_namespace.model)
 
-    generate_sequence(parser_namespace.output,
-                      parser_namespace.length, parser_namespace.seed)
+    if seeds is not None:
+        generate_batch(parser_namespace.output, parser_namespace.length,
+                       seeds, parser_namespace.random_seed, jobs,
+                       **generator_options)
+    else:
+        generate_sequence(parser_namespace.output,
+                          parser_namespace.length, parser_namespace.seed,
+                          parser_namespace.random_seed, **generator_options)
@@ -0,0 +1,615 @@
+import collections
+import itertools
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy
+
+# word codes are stored as big-endian unsigned 32-bit integers, so
+# byte-wise order of packed k-grams is the same as order of tuples
+CODE_TYPE = numpy.dtype('>u4')
+COUNT_TYPE = numpy.dtype('int64')
+CODE_MAX = numpy.iinfo(CODE_TYPE).max
+# size of blocks in which k-grams are unpacked while iterating
+ITER_BLOCK = 1 << 16
+# number of k-grams, which are read from all spilled runs at once
+MERGE_BLOCK = 1 << 18
+# approximate size of pending k-gram (tuple and dict entry) in bytes
+PENDING_BYTES = 256
+
+
+def pack(rows, k: int):
+    """
+    Packs k-grams (sequence of tuples or 2d array of codes) into
+    fixed-width keys: one contiguous bytes field per k-gram.
+    """
+    codes = numpy.ascontiguousarray(
+        numpy.asarray(rows, dtype=CODE_TYPE).reshape(-1, k))
+    key_type = numpy.dtype((numpy.void, CODE_TYPE.itemsize * k))
+    return codes.view(key_type).ravel()
+
+
+def unpack(keys, k: int):
+    """Unpacks fixed-width keys into 2d array of codes"""
+    return keys.view(CODE_TYPE).reshape(-1, k)
+
+
+def sort_keys(kgrams):
+    """
+    Gives keys of k-grams (2d array of codes), which are ordered
+    as tuples: single int64 numbers when codes fit into it, else
+    packed k-grams (see 'pack'). Int64 keys are sorted much faster.
+    """
+    k = kgrams.shape[1]
+    base = int(kgrams.max()) + 1 if kgrams.size else 1
+    if base ** k >= 2 ** 63:
+        return pack(kgrams, k)
+    keys = numpy.zeros(len(kgrams), dtype=numpy.int64)
+    for column in kgrams.T:
+        keys *= base
+        keys += column
+    return keys
+
+
+def group_counts(keys, counts):
+    """
+    Sorts keys and sums counts of equal keys.
+
+    :param keys: array of keys (may contain duplicates)
+    :param counts: array of their frequencies
+    :return: indices of first entrances of unique keys in sorted
+        order and sums of their frequencies
+    """
+    order = numpy.argsort(keys)
+    keys = keys[order]
+    first = numpy.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    starts = numpy.flatnonzero(first)
+    if not len(starts):
+        return starts, numpy.empty(0, dtype=COUNT_TYPE)
+    counts = numpy.add.reduceat(numpy.asarray(counts)[order], starts)
+    return order[starts], counts.astype(COUNT_TYPE)
+
+
+def merge_counts(keys, counts):
+    """
+    Sorts packed keys and sums counts of equal keys.
+
+    :param keys: array of packed k-grams (may contain duplicates)
+    :param counts: array of their frequencies
+    :return: sorted unique keys and their frequencies
+    """
+    firsts, counts = group_counts(keys, counts)
+    return keys[firsts], counts
+
+
+def merge_sorted(keys, counts, new_keys, new_counts):
+    """
+    Merges two sorted runs of unique packed k-grams of the same
+    length in one pass: frequencies of common k-grams are summed,
+    other k-grams are placed at their sorted positions.
+
+    :param keys: sorted unique packed k-grams
+    :param counts: array of their frequencies
+    :param new_keys: other sorted unique packed k-grams
+    :param new_counts: array of their frequencies
+    :return: sorted unique keys and their frequencies
+    """
+    positions = numpy.searchsorted(keys, new_keys)
+    found = positions < len(keys)
+    found[found] = keys[positions[found]] == new_keys[found]
+    counts = counts.astype(COUNT_TYPE)
+    counts[positions[found]] += new_counts[found]
+    added = numpy.flatnonzero(~found)
+    # new k-grams are shifted by the new k-grams before them
+    inserted = numpy.zeros(len(keys) + len(added), dtype=bool)
+    inserted[positions[added] + numpy.arange(len(added))] = True
+    merged_keys = numpy.empty(len(inserted), dtype=keys.dtype)
+    merged_keys[inserted] = new_keys[added]
+    merged_keys[~inserted] = keys
+    merged_counts = numpy.empty(len(inserted), dtype=COUNT_TYPE)
+    merged_counts[inserted] = new_counts[added]
+    merged_counts[~inserted] = counts
+    return merged_keys, merged_counts
+
+
+def merge_runs(runs, block_size: int = MERGE_BLOCK):
+    """
+    K-way merge of sorted runs of packed k-grams of the same length:
+    each step reads blocks of all runs and takes them up to the
+    smallest of their last keys, so everything not greater than it
+    is already read, and counts taken k-grams at once.
+
+    :param runs: list of (keys, counts): sorted unique packed k-grams
+        and their frequencies (arrays or RunFile)
+    :param block_size: number of k-grams read from all runs at once
+    :return: generator of sorted unique keys and their frequencies,
+        keys of each block are greater than keys of previous ones
+    """
+    runs = [(keys, counts) for keys, counts in runs if len(keys)]
+    positions = [0] * len(runs)
+    # blocks of runs, which are read, but not taken yet
+    blocks = [None] * len(runs)
+    while runs:
+        size = max(1, block_size // len(runs))
+        for i, (keys, counts) in enumerate(runs):
+            if blocks[i] is None or not len(blocks[i][0]):
+                end = min(positions[i] + size, len(keys))
+                blocks[i] = keys[positions[i]:end], counts[positions[i]:end]
+                positions[i] = end
+        # runs, which are not read to the end, limit the step
+        bounds = [block[0][-1:] for block, position, (keys, _)
+                  in zip(blocks, positions, runs) if position < len(keys)]
+        bound = numpy.sort(numpy.concatenate(bounds))[0] if bounds else None
+        taken_keys, taken_counts = [], []
+        for i, (keys, counts) in enumerate(blocks):
+            cut = len(keys) if bound is None else \
+                numpy.searchsorted(keys, bound, 'right')
+            taken_keys.append(keys[:cut])
+            taken_counts.append(counts[:cut])
+            blocks[i] = keys[cut:], counts[cut:]
+        keys = numpy.concatenate(taken_keys)
+        if len(keys):
+            k = keys.dtype.itemsize // CODE_TYPE.itemsize
+            kgrams, counts = count_kgrams(
+                unpack(keys, k), numpy.concatenate(taken_counts))
+            yield pack(kgrams, k), counts
+        unread = [i for i, (keys, _) in enumerate(runs)
+                  if positions[i] < len(keys) or len(blocks[i][0])]
+        runs = [runs[i] for i in unread]
+        positions = [positions[i] for i in unread]
+        blocks = [blocks[i] for i in unread]
+
+
+def count_kgrams(kgrams, counts):
+    """
+    Sorts k-grams and sums counts of equal ones.
+
+    :param kgrams: 2d array of codes, one k-gram per row
+    :param counts: array of their frequencies
+    :return: sorted unique k-grams and their frequencies
+    """
+    kgrams = numpy.asarray(kgrams)
+    firsts, counts = group_counts(sort_keys(kgrams), counts)
+    return kgrams[firsts], counts
+
+
+def from_items(kgrams, n: int):
+    """
+    Packs k-grams of dict-like 'kgrams' (tuple of codes -> frequency)
+    into KGramStore, k-grams of each length are counted at once.
+
+    :param n: length of n-gram
+    :return: KGramStore
+    """
+    store = KGramStore(n)
+    rows = collections.defaultdict(list)
+    counts = collections.defaultdict(list)
+    for kgram, count in kgrams.items():
+        rows[len(kgram)].append(kgram)
+        counts[len(kgram)].append(count)
+    for k in rows:
+        store.add_many(numpy.array(rows[k]).reshape(-1, k),
+                       numpy.array(counts[k], dtype=COUNT_TYPE))
+    return store
+
+
+class RunFile:
+    """
+    Sorted array, spilled to disk by KGramStore. Slices are read
+    from file, so read blocks do not stay in memory as pages of
+    memory mapped file do.
+    """
+
+    def __init__(self, path: str, array):
+        self.__path = path
+        self.__size = len(array)
+        self.dtype = array.dtype
+        array.tofile(path)
+
+    def mapped(self):
+        """Gives whole array mapped into memory"""
+        if not self.__size:
+            return numpy.empty(0, dtype=self.dtype)
+        return numpy.memmap(self.__path, dtype=self.dtype, mode='r',
+                            shape=(self.__size,))
+
+    def __getitem__(self, index: slice):
+        begin, end, _ = index.indices(self.__size)
+        return numpy.fromfile(self.__path, dtype=self.dtype,
+                              count=max(end - begin, 0),
+                              offset=begin * self.dtype.itemsize)
+
+    def __len__(self) -> int:
+        return self.__size
+
+
+class KGramStore:
+    """
+    Compact storage of k-gram frequencies.
+
+    K-grams of each length k are packed into fixed-width keys
+    (k big-endian 32-bit codes) and kept in sorted numpy arrays
+    with frequencies in parallel array, which takes 4 * k + 8 bytes
+    per k-gram instead of a tuple of ints in a dict.
+
+    New k-grams are counted in a small dict, which is sorted when
+    it grows to 'buffer_size' entries. Sorted k-grams are kept as
+    levels: runs of decreasing sizes, each new run is merged with
+    the levels which are not much bigger than it, so each k-gram
+    is copied a logarithmic number of times. Levels are merged into
+    the arrays before k-grams are read.
+    Reading methods behave like the dict, used by Model:
+    keys are tuples of codes, values are frequencies.
+
+    If 'memory_limit' is set, arrays, which grow bigger than it,
+    are spilled to disk as sorted run and counting starts over.
+    Runs are merged, when k-grams are read (see 'blocks').
+    """
+
+    def __init__(self, n: int, buffer_size: int = 1 << 20,
+                 memory_limit: int = None, spill_dir: str = None):
+        # length of n-gram
+        self.__max_gram = n
+        # number of pending k-grams which triggers merge
+        self.__buffer_size = buffer_size
+        # size of arrays in bytes, which triggers spill to disk
+        self.__memory_limit = memory_limit
+        if memory_limit is not None:
+            self.__buffer_size = min(
+                buffer_size, max(1, memory_limit // PENDING_BYTES))
+        # directory, where temporary directory for runs is created
+        self.__spill_dir = spill_dir
+        self.__directory = None
+        # spilled runs: list of (keys, counts) RunFile for each k
+        self.__runs = []
+        # sorted packed k-grams and their frequencies, index is k - 1
+        self.__keys = [pack([], k) for k in range(1, n + 1)]
+        self.__counts = [
+            numpy.empty(0, dtype=COUNT_TYPE) for _ in range(n)]
+        # sorted runs, which are not merged into arrays yet: list
+        # of (keys, counts) in decreasing order of sizes for each k
+        self.__levels = [[] for _ in range(n)]
+        # k-grams counted since the last merge
+        self.__pending = collections.defaultdict(int)
+
+    def add(self, kgram: tuple, count: int = 1):
+        """
+        Public method
+
+        Increases frequency of 'kgram' by 'count'.
+
+        :param kgram: tuple of word codes
+        :param count: number of new entrances
+        :return: None
+        """
+        self.__pending[kgram] += count
+        if len(self.__pending) >= self.__buffer_size:
+            self.flush()
+
+    def add_many(self, kgrams, counts):
+        """
+        Public method
+
+        Increases frequencies of k-grams of the same length at once.
+
+        :param kgrams: 2d array of word codes, one k-gram per row
+        :param counts: array of frequencies to add
+        :return: None
+        """
+        kgrams = numpy.asarray(kgrams)
+        if not kgrams.size:
+            return
+        self.__merge(*count_kgrams(kgrams, counts))
+        self.__check_memory()
+
+    def add_counted(self, kgrams, counts):
+        """
+        Public method
+
+        Like 'add_many', but k-grams are already sorted and unique
+        (see 'count_kgrams'), so they are merged without sorting.
+
+        :param kgrams: sorted 2d array of word codes, one k-gram per row
+        :param counts: array of frequencies to add
+        :return: None
+        """
+        if not len(kgrams):
+            return
+        self.__merge(kgrams, counts)
+        self.__check_memory()
+
+    def flush(self):
+        """
+        Public method
+
+        Merges pending k-grams into sorted arrays.
+
+        :return: None
+        """
+        if not self.__pending:
+            return
+        by_length = collections.defaultdict(lambda: ([], []))
+        for kgram, count in self.__pending.items():
+            kgrams, counts = by_length[len(kgram)]
+            kgrams.append(kgram)
+            counts.append(count)
+        self.__pending = collections.defaultdict(int)
+        for kgrams, counts in by_length.values():
+            self.__merge(*count_kgrams(kgrams, counts))
+        self.__check_memory()
+
+    def extend_sorted(self, k: int, blocks):
+        """
+        Public method
+
+        Appends k-grams, which are greater than stored k-grams of the
+        same length (e.g. read from sorted file), without sorting:
+        arrays are concatenated once.
+
+        :param k: length of k-grams
+        :param blocks: iterable of sorted unique packed k-grams and
+            their frequencies
+        :return: None
+        """
+        blocks = list(blocks)
+        if not blocks:
+            return
+        self.__consolidate(k)
+        keys, counts = zip(*blocks)
+        self.__keys[k - 1] = numpy.concatenate(
+            (self.__keys[k - 1],) + keys)
+        self.__counts[k - 1] = numpy.concatenate(
+            (self.__counts[k - 1],) + counts).astype(COUNT_TYPE, copy=False)
+        self.__check_memory()
+
+    def blocks(self, k: int):
+        """
+        Public method
+
+        Gives k-grams of length 'k' in order of keys, spilled runs
+        are merged with k-grams in memory by blocks, so they are
+        never loaded at once.
+
+        :param k: length of k-grams
+        :return: generator of sorted unique packed k-grams and
+            their frequencies
+        """
+        self.flush()
+        self.__consolidate(k)
+        sources = [run[k - 1] for run in self.__runs]
+        sources.append((self.__keys[k - 1], self.__counts[k - 1]))
+        if len(sources) == 1:
+            if len(sources[0][0]):
+                yield sources[0]
+            return
+        yield from merge_runs(sources)
+
+    def spilled(self) -> int:
+        """Number of runs, spilled to disk"""
+        return len(self.__runs)
+
+    def nbytes(self) -> int:
+        """Size of arrays with k-grams and frequencies in bytes"""
+        return sum(keys.nbytes + counts.nbytes
+                   for keys, counts in itertools.chain(
+                       zip(self.__keys, self.__counts), *self.__levels))
+
+    def get(self, kgram: tuple, default=None):
+        self.flush()
+        k = len(kgram)
+        if not 0 < k <= self.__max_gram:
+            return default
+        self.__consolidate(k)
+        key = pack([kgram], k)
+        found = False
+        frequency = 0
+        # frequency is summed over runs and arrays in memory
+        sources = [(keys.mapped(), counts.mapped())
+                   for keys, counts in (run[k - 1] for run in self.__runs)]
+        sources.append((self.__keys[k - 1], self.__counts[k - 1]))
+        for keys, counts in sources:
+            position = numpy.searchsorted(keys, key)[0]
+            if position < len(keys) and keys[position] == key[0]:
+                found = True
+                frequency += int(counts[position])
+        return frequency if found else default
+
+    def continuations(self, contexts: list):
+        """
+        Public method
+
+        Gives words, which follow each of 'contexts', with bisection:
+        k-grams with the same beginning are neighbours in sorted
+        arrays, so all contexts are searched at once.
+
+        :param contexts: non-empty list of tuples of codes of the
+            same length
+        :return: codes of continuations (in increasing order in each
+            context), frequencies of k-grams context + continuation
+            and offsets of continuations of each context
+        """
+        self.__collect()
+        k = len(contexts[0]) + 1
+        offsets = numpy.zeros(len(contexts) + 1, dtype=numpy.int64)
+        if not 1 < k <= self.__max_gram:
+            return (numpy.empty(0, dtype=CODE_TYPE),
+                    numpy.empty(0, dtype=COUNT_TYPE), offsets)
+        keys = self.__keys[k - 1]
+        bounds = pack([tuple(context) + (0,) for context in contexts] +
+                      [tuple(context) + (CODE_MAX,) for context in contexts],
+                      k)
+        begins = numpy.searchsorted(keys, bounds[:len(contexts)], 'left')
+        ends = numpy.searchsorted(keys, bounds[len(contexts):], 'right')
+        numpy.cumsum(ends - begins, out=offsets[1:])
+        if len(contexts) == 1:
+            index = slice(begins[0], ends[0])
+        else:
+            index = numpy.arange(offsets[-1]) + numpy.repeat(
+                begins - offsets[:-1], ends - begins)
+        return (unpack(keys[index], k)[:, -1], self.__counts[k - 1][index],
+                offsets)
+
+    def random_kgram(self, point: float) -> tuple:
+        """
+        Public method
+
+        Gives k-gram of the store, all k-grams are equiprobable.
+
+        :param point: uniformly distributed number in [0, 1)
+        :return: tuple of codes
+        :raise ValueError: if there are no k-grams
+        """
+        self.__collect()
+        if not len(self):
+            raise ValueError('model has no k-grams')
+        index = int(point * len(self))
+        for k, keys in enumerate(self.__keys, 1):
+            if index < len(keys):
+                return tuple(unpack(keys[index:index + 1], k)[0].tolist())
+            index -= len(keys)
+
+    def items(self):
+        for k in range(1, self.__max_gram + 1):
+            for keys, counts in self.blocks(k):
+                for begin in range(0, len(keys), ITER_BLOCK):
+                    rows = unpack(keys[begin:begin + ITER_BLOCK], k).tolist()
+                    block = counts[begin:begin + ITER_BLOCK].tolist()
+                    for row, count in zip(rows, block):
+                        yield tuple(row), count
+
+    def keys(self):
+        for kgram, _ in self.items():
+            yield kgram
+
+    def __iter__(self):
+        return self.keys()
+
+    def __getitem__(self, kgram: tuple) -> int:
+        # missing k-grams are met zero times, like in collections.Counter
+        return self.get(kgram, 0)
+
+    def __contains__(self, kgram: tuple) -> bool:
+        return self.get(kgram) is not None
+
+    def __len__(self) -> int:
+        self.flush()
+        for k in range(1, self.__max_gram + 1):
+            self.__consolidate(k)
+        if self.__runs:
+            return sum(len(keys) for k in range(1, self.__max_gram + 1)
+                       for keys, _ in self.blocks(k))
+        return sum(len(keys) for keys in self.__keys)
+
+    def __getstate__(self):
+        # pickled store keeps all k-grams in memory
+        self.__collect()
+        # memory limit is not stored, loaded store keeps k-grams in memory
+        state = self.__dict__.copy()
+        for name in ('memory_limit', 'spill_dir', 'directory', 'runs',
+                     'levels'):
+            del state['_KGramStore__' + name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__memory_limit = self.__spill_dir = self.__directory = None
+        self.__runs = []
+        self.__levels = [[] for _ in range(self.__max_gram)]
+
+    def __collect(self):
+        """
+        Private method
+
+        Merges pending k-grams, levels and spilled runs into arrays
+        in memory.
+
+        :return: None
+        """
+        self.flush()
+        for k in range(1, self.__max_gram + 1):
+            self.__consolidate(k)
+        if not self.__runs:
+            return
+        for k in range(1, self.__max_gram + 1):
+            blocks = list(self.blocks(k))
+            if blocks:
+                keys, counts = zip(*blocks)
+                self.__keys[k - 1] = numpy.concatenate(keys)
+                self.__counts[k - 1] = numpy.concatenate(counts)
+        self.__runs = []
+
+    def __check_memory(self):
+        """
+        Private method
+
+        Spills arrays to disk as sorted run, if they take more
+        than 'memory_limit' bytes.
+
+        :return: None
+        """
+        if self.__memory_limit is None or \
+                self.nbytes() <= self.__memory_limit:
+            return
+        if self.__directory is None:
+            self.__directory = tempfile.mkdtemp(
+                prefix='kgrams-', dir=self.__spill_dir)
+            # runs are removed together with the store
+            weakref.finalize(self, shutil.rmtree, self.__directory, True)
+        run = []
+        for k in range(1, self.__max_gram + 1):
+            self.__consolidate(k)
+            path = os.path.join(self.__directory,
+                                'run%d-%d' % (len(self.__runs), k))
+            run.append((RunFile(path + '.keys', self.__keys[k - 1]),
+                        RunFile(path + '.counts', self.__counts[k - 1])))
+            self.__keys[k - 1] = pack([], k)
+            self.__counts[k - 1] = numpy.empty(0, dtype=COUNT_TYPE)
+        self.__runs.append(run)
+
+    def __consolidate(self, k: int):
+        """
+        Private method
+
+        Merges levels of k-grams of length 'k' into arrays, from the
+        smallest level to the biggest one.
+
+        :param k: length of k-grams
+        :return: None
+        """
+        levels = self.__levels[k - 1]
+        if not levels:
+            return
+        keys, counts = levels.pop()
+        while levels:
+            keys, counts = merge_sorted(*levels.pop(), keys, counts)
+        self.__keys[k - 1], self.__counts[k - 1] = merge_sorted(
+            self.__keys[k - 1], self.__counts[k - 1], keys, counts)
+
+    def __merge(self, kgrams, counts):
+        """
+        Private method
+
+        Adds sorted unique k-grams of the same length as a new level:
+        while the smallest level is not more than twice bigger than
+        the new one, they are merged (see 'merge_sorted'), so sizes of
+        levels decrease at least twice. Level, which grew as big as
+        a half of arrays, is merged into them.
+
+        :param kgrams: sorted 2d array of codes, one k-gram per row
+        :param counts: array of their frequencies
+        :return: None
+        """
+        k = kgrams.shape[1]
+        keys = pack(kgrams, k)
+        counts = numpy.asarray(counts, dtype=COUNT_TYPE)
+        levels = self.__levels[k - 1]
+        while levels and len(levels[-1][0]) <= 2 * len(keys):
+            keys, counts = merge_sorted(*levels.pop(), keys, counts)
+        if 2 * len(keys) >= len(self.__keys[k - 1]):
+            self.__keys[k - 1], self.__counts[k - 1] = merge_sorted(
+                self.__keys[k - 1], self.__counts[k - 1], keys, counts)
+        else:
+            levels.append((keys, counts))
@@ -0,0 +1,303 @@
+import numpy
+
+"""
+
+    Lexicon of the model: words and their codes (numbers in order
+    of occurrence).
+
+    Words are stored in one contiguous utf-8 buffer, each word is
+    followed by line break, with array of offsets of words. Codes
+    of words are found through open addressing hash table (array of
+    codes), hashes of words are computed from their bytes with numpy,
+    so whole lists of words are encoded and decoded at once.
+
+"""
+
+SEPARATOR = ord('\n')
+# multiplier of polynomial hash of bytes of word
+HASH_BASE = numpy.uint64(0x100000001b3)
+# hash table is grown twice, when it is filled more than by half
+INITIAL_CAPACITY = 1 << 4
+
+
+def split_bytes(data):
+    """
+    Finds words in array of utf-8 bytes, each word is followed
+    by separator.
+
+    :param data: numpy array of uint8
+    :return: starts of words and their lengths with separator
+    """
+    ends = numpy.flatnonzero(data == SEPARATOR) + 1
+    starts = numpy.zeros(len(ends), dtype=numpy.int64)
+    starts[1:] = ends[:-1]
+    return starts, ends - starts
+
+
+def hash_words(data, starts, lengths):
+    """
+    Polynomial hashes of words (see 'split_bytes'), computed
+    modulo 2 ** 64 and mixed, so lower bits are uniform.
+
+    :return: numpy array of uint64
+    """
+    if not len(starts):
+        return numpy.empty(0, dtype=numpy.uint64)
+    positions = numpy.arange(len(data)) - numpy.repeat(starts, lengths)
+    powers = numpy.full(int(lengths.max()), HASH_BASE)
+    powers[0] = 1
+    powers = numpy.cumprod(powers, dtype=numpy.uint64)
+    hashes = numpy.add.reduceat(
+        data.astype(numpy.uint64) * powers[positions], starts)
+    hashes ^= hashes >> numpy.uint64(31)
+    hashes *= numpy.uint64(0x9e3779b97f4a7c15)
+    hashes ^= hashes >> numpy.uint64(29)
+    return hashes
+
+
+def grow(array, size: int):
+    """Gives 'array' or its copy with capacity for 'size' elements"""
+    if size <= len(array):
+        return array
+    grown = numpy.empty(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class Lexicon:
+    """
+    Compact dict-like table: word -> code.
+
+    Takes utf-8 bytes of words and from 28 to 36 bytes per word
+    (depending on fill of hash table) instead of a Python string
+    and dict entry per word.
+    """
+
+    def __init__(self, words: list = ()):
+        # number of words
+        self.__size = 0
+        # utf-8 words with separators, arrays have spare capacity
+        self.__buffer = numpy.empty(INITIAL_CAPACITY, dtype=numpy.uint8)
+        # offsets[code] is start of word, offsets[size] is end of buffer
+        self.__offsets = numpy.zeros(INITIAL_CAPACITY, dtype=numpy.int64)
+        # lengths of words in characters and hashes of their bytes
+        self.__lengths = numpy.empty(INITIAL_CAPACITY, dtype=numpy.int32)
+        self.__hashes = numpy.empty(INITIAL_CAPACITY, dtype=numpy.uint64)
+        # hash table: codes of words, -1 in empty slots
+        self.__slots = numpy.full(INITIAL_CAPACITY, -1, dtype=numpy.int32)
+        self.extend(words)
+
+    def encode(self, words: list, add: bool = False):
+        """
+        Public method
+
+        Gives codes of words.
+
+        :param words: list of words
+        :param add: add unknown words to lexicon, they get codes
+            in order of their first occurrence
+        :return: numpy array of codes, -1 for unknown words
+        """
+        if not words:
+            return numpy.empty(0, dtype=numpy.int64)
+        data = numpy.frombuffer(
+            ('\n'.join(words) + '\n').encode('utf-8'), dtype=numpy.uint8)
+        starts, lengths = split_bytes(data)
+        hashes = hash_words(data, starts, lengths)
+        codes = self.__find(data, starts, lengths, hashes)
+        if add:
+            missing = numpy.flatnonzero(codes < 0)
+            if len(missing):
+                self.extend(dict.fromkeys(
+                    words[i] for i in missing.tolist()))
+                codes[missing] = self.__find(
+                    data, starts[missing], lengths[missing],
+                    hashes[missing])
+        return codes
+
+    def extend(self, words):
+        """
+        Public method
+
+        Appends new words (which are not in lexicon yet) with next
+        codes, without checking them.
+
+        :param words: iterable of words
+        :return: None
+        """
+        words = list(words)
+        if not words:
+            return
+        data = numpy.frombuffer(
+            ('\n'.join(words) + '\n').encode('utf-8'), dtype=numpy.uint8)
+        starts, lengths = split_bytes(data)
+        size, end = self.__size, self.__offsets[self.__size]
+        new_size = size + len(words)
+        self.__buffer = grow(self.__buffer, end + len(data))
+        self.__buffer[end:end + len(data)] = data
+        self.__offsets = grow(self.__offsets, new_size + 1)
+        self.__offsets[size + 1:new_size + 1] = end + starts + lengths
+        self.__lengths = grow(self.__lengths, new_size)
+        self.__lengths[size:new_size] = numpy.fromiter(
+            map(len, words), dtype=numpy.int32, count=len(words))
+        self.__hashes = grow(self.__hashes, new_size)
+        self.__hashes[size:new_size] = hash_words(data, starts, lengths)
+        self.__size = new_size
+        if 2 * new_size > len(self.__slots):
+            capacity = len(self.__slots)
+            while 2 * new_size > capacity:
+                capacity *= 2
+            self.__slots = numpy.full(capacity, -1, dtype=numpy.int32)
+            self.__insert(numpy.arange(new_size))
+        else:
+            self.__insert(numpy.arange(size, new_size))
+
+    def decode(self, codes, separator: str = ' ') -> str:
+        """
+        Public method
+
+        Gives words with 'codes', joined with 'separator', bytes of all
+        words are gathered at once and decoded once.
+
+        :param codes: sequence of codes
+        :param separator: string between words
+        :return: str
+        """
+        codes = numpy.asarray(codes, dtype=numpy.int64)
+        if not len(codes):
+            return ''
+        starts = self.__offsets[codes]
+        lengths = self.__offsets[codes + 1] - starts
+        ends = numpy.cumsum(lengths)
+        positions = numpy.arange(ends[-1]) + numpy.repeat(
+            starts - ends + lengths, lengths)
+        # the last separator is dropped
+        text = self.__buffer[positions[:-1]].tobytes().decode('utf-8')
+        return text if separator == '\n' else text.replace('\n', separator)
+
+    def words(self, first_code: int = 0) -> list:
+        """
+        Public method
+
+        :param first_code: code of the first word to take
+        :return: words with codes from 'first_code', in order of codes
+        """
+        if first_code >= self.__size:
+            return []
+        begin, end = self.__offsets[first_code], self.__offsets[self.__size]
+        return self.__buffer[begin:end - 1].tobytes().decode(
+            'utf-8').split('\n')
+
+    def length(self, code: int) -> int:
+        """Length of word with 'code' in characters"""
+        return int(self.__lengths[code])
+
+    def nbytes(self) -> int:
+        """Size of arrays of lexicon in bytes"""
+        return int(self.__offsets[self.__size]) + 20 * self.__size + \
+            self.__slots.nbytes
+
+    def get(self, word: str, default=None):
+        code = int(self.encode([word])[0])
+        return default if code < 0 else code
+
+    def __getitem__(self, word: str) -> int:
+        code = self.get(word)
+        if code is None:
+            raise KeyError(word)
+        return code
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __getstate__(self):
+        # hash table is rebuilt after unpickling
+        return self.words(),
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __find(self, data, starts, lengths, hashes):
+        """
+        Private method
+
+        Looks words up in hash table: all words are probed at
+        once, until each one meets its code or empty slot.
+
+        :param data: utf-8 bytes of words (see 'split_bytes')
+        :param starts: starts of words in 'data'
+        :param lengths: lengths of words with separator
+        :param hashes: hashes of words
+        :return: numpy array of codes, -1 for unknown words
+        """
+        codes = numpy.full(len(starts), -1, dtype=numpy.int64)
+        mask = len(self.__slots) - 1
+        pending = numpy.arange(len(starts))
+        positions = (hashes & numpy.uint64(mask)).astype(numpy.int64)
+        while len(pending):
+            found = self.__slots[positions].astype(numpy.int64)
+            empty = found < 0
+            candidate = ~empty
+            candidate[candidate] = \
+                self.__hashes[found[candidate]] == hashes[pending[candidate]]
+            candidate[candidate] = self.__equal(
+                found[candidate], data,
+                starts[pending[candidate]], lengths[pending[candidate]])
+            codes[pending[candidate]] = found[candidate]
+            rest = ~(empty | candidate)
+            pending = pending[rest]
+            positions = (positions[rest] + 1) & mask
+        return codes
+
+    def __equal(self, codes, data, starts, lengths):
+        """
+        Private method
+
+        Compares bytes of words with 'codes' and words in 'data'
+
+        :return: numpy array of bool
+        """
+        begins = self.__offsets[codes]
+        equal = self.__offsets[codes + 1] - begins == lengths
+        if not equal.any():
+            return equal
+        begins, starts, lengths = \
+            begins[equal], starts[equal], lengths[equal]
+        ends = numpy.cumsum(lengths)
+        positions = numpy.arange(ends[-1])
+        words = self.__buffer[positions + numpy.repeat(
+            begins - ends + lengths, lengths)]
+        if ends[-1] < len(data):
+            data = data[positions + numpy.repeat(
+                starts - ends + lengths, lengths)]
+        # else all words of 'data' are compared, they go in order
+        equal[equal] = numpy.logical_and.reduceat(
+            words == data, ends - lengths)
+        return equal
+
+    def __insert(self, codes):
+        """
+        Private method
+
+        Inserts codes of words into hash table with linear probing,
+        all codes are inserted at once.
+
+        :param codes: numpy array of codes
+        :return: None
+        """
+        mask = len(self.__slots) - 1
+        positions = (self.__hashes[codes] &
+                     numpy.uint64(mask)).astype(numpy.int64)
+        while len(codes):
+            free = numpy.flatnonzero(self.__slots[positions] < 0)
+            # the first code of each free slot takes it
+            _, first = numpy.unique(positions[free], return_index=True)
+            taken = free[first]
+            self.__slots[positions[taken]] = codes[taken]
+            rest = numpy.ones(len(codes), dtype=bool)
+            rest[taken] = False
+            codes = codes[rest]
+            positions = (positions[rest] + 1) & mask
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import sys
+import time
+import urllib.parse
+
+import config
+
+"""
+
+    Load test for server.py: sends requests through several concurrent
+    keep-alive connections and reports latency percentiles and
+    requests per second.
+
+"""
+
+
+async def open_connection(namespace):
+    if namespace.unix_socket is not None:
+        return await asyncio.open_unix_connection(namespace.unix_socket)
+    url = urllib.parse.urlsplit(namespace.url or 'http://localhost:8080')
+    return await asyncio.open_connection(url.hostname, url.port or 80)
+
+
+async def client(namespace, queries, latencies):
+    """Sends requests one by one through one connection"""
+    reader, writer = await open_connection(namespace)
+    try:
+        while queries:
+            query = queries.pop()
+            started = time.perf_counter()
+            writer.write(('GET /generate?%s HTTP/1.1\r\n'
+                          'Host: localhost\r\n\r\n' % query).encode())
+            await writer.drain()
+            length = 0
+            status = (await reader.readline()).split()[1]
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b''):
+                    break
+                if header.lower().startswith(b'content-length:'):
+                    length = int(header.split(b':')[1])
+            await reader.readexactly(length)
+            if status != b'200':
+                raise RuntimeError('Server responded %s' % status.decode())
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+def percentile(values: list, rank: float) -> float:
+    return values[min(len(values) - 1, int(rank * len(values)))]
+
+
+async def run(namespace):
+    requests = int(namespace.requests or 1000)
+    concurrency = int(namespace.concurrency or 16)
+    parameters = {'length': int(namespace.length or 200)}
+    if namespace.seed is not None:
+        parameters['seed'] = namespace.seed
+    queries = [urllib.parse.urlencode(dict(parameters, rng=i))
+               for i in range(requests)]
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*[client(namespace, queries, latencies)
+                           for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print('requests: %d, concurrency: %d' % (len(latencies), concurrency))
+    print('p50: %.2f ms, p99: %.2f ms' % (
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000))
+    print('requests/second: %.1f' % (len(latencies) / elapsed))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    for argument, description in config.loadtest_args.items():
+        parser.add_argument(argument, help=description)
+    parser_namespace, _ = parser.parse_known_args()
+
+    try:
+        asyncio.run(run(parser_namespace))
+    except (ConnectionError, ValueError, RuntimeError) as error:
+        print('Load test failed: %s' % error)
+        sys.exit(1)
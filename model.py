@@ -1,27 +1,119 @@
 import collections
+import heapq
 import pickle
-import re
-
-import textgenerator
 
+import numpy
 
-def find_kgrams(words, k):
-    return zip(*[tuple(words[i:],) for i in range(k)])
+import config
+import debugging
+import kgramstore
+import lexicon
+import modelfile
+import modelstore
+import textgenerator
+import tokenizer
+
+
+def prune_options(namespace) -> dict:
+    """
+    Parses pruning options (see config.prune_args) of command line.
+
+    :param namespace: parsed arguments of train.py or convert.py
+    :return: keyword arguments of Model.prune, empty if pruning
+        is not asked
+    :raise ValueError: if some option is not a number
+    """
+    options = {}
+    if namespace.min_count is not None:
+        options['min_count'] = int(namespace.min_count)
+    if namespace.top_k is not None:
+        options['top_k'] = int(namespace.top_k)
+    if namespace.min_word_count is not None:
+        options['min_word_count'] = int(namespace.min_word_count)
+    return options
+
+
+def encode_texts(texts, text_tokenizer: tokenizer.Tokenizer) -> tuple:
+    """
+    Splits texts into words and encodes them with separate lexicon,
+    e.g. in worker process (see Model.continue_text).
+
+    :param texts: iterable of str
+    :param text_tokenizer: tokenizer of the model
+    :return: words of the lexicon in order of codes and array of codes
+        of words of all texts
+
+    THIS FUNCTION IS USED IN TRAIN.PY
+    """
+    vocabulary = lexicon.Lexicon()
+    codes = [vocabulary.encode(text_tokenizer.split(text), add=True)
+             for text in texts]
+    return vocabulary.words(), numpy.concatenate(
+        [numpy.empty(0, dtype=numpy.int64)] + codes)
+
+
+def count_codes(codes, carried: int, n: int) -> list:
+    """
+    Counts k-grams of text, given as array of codes: all windows of
+    length 1..n, except ones which consist of the first 'carried'
+    codes only (words of the previous lines, see
+    Model.continue_text), so each k-gram of text is counted once.
+
+    :param codes: array of codes
+    :param carried: number of carried codes at the beginning
+    :param n: length of n-gram
+    :return: list of sorted unique k-grams (2d array of codes) and
+        their frequencies, for each length
+
+    THIS FUNCTION IS USED IN TRAIN.PY
+    """
+    counted = []
+    for k in range(1, n + 1):
+        # skip windows, which consist of carried words only
+        first = max(0, carried - k + 1)
+        if len(codes) - k + 1 <= first:
+            continue
+        windows = numpy.lib.stride_tricks.sliding_window_view(
+            codes, k)[first:]
+        counted.append(kgramstore.count_kgrams(
+            windows, numpy.ones(len(windows), dtype=numpy.int64)))
+        debugging.count('kgrams', len(windows))
+    return counted
 
 
 class Model:
 
-    def __init__(self, n: int):
+    def __init__(self, n: int, compact: bool = False,
+                 text_tokenizer: tokenizer.Tokenizer = None,
+                 memory_limit: int = None, spill_dir: str = None):
         # length of n-gram
         self.__max_gram = n
-        # stores kgrams with frequencies
-        self.__k_grams = collections.defaultdict(int)
-        # dict: word -> code (int)
-        self.__lexicon = collections.defaultdict(int)
-        # total unique words
-        self.__word_counter = 0
-        # buffer to compute all k-grams
-        self.__word_buffer = collections.deque()
+        # splits texts into words
+        self.__tokenizer = text_tokenizer or tokenizer.Tokenizer()
+        # size of counted k-grams in bytes, after which they are
+        # spilled to disk (see KGramStore), and directory for them
+        self.__memory_limit = memory_limit
+        self.__spill_dir = spill_dir
+        # stores kgrams with frequencies: dict or packed numpy arrays,
+        # only arrays are spilled to disk
+        self.__compact = compact or memory_limit is not None
+        if self.__compact:
+            self.__k_grams = self.__new_store()
+        else:
+            self.__k_grams = collections.defaultdict(int)
+        # words and their codes (numbers in order of occurrence)
+        self.__lexicon = lexicon.Lexicon()
+        # codes of last (max_gram - 1) words, which begin k-grams of
+        # next line
+        self.__word_buffer = collections.deque(maxlen=n - 1)
+        # model loaded from binary format, mapped into memory
+        self.__mapped = None
+        # number of segments in loaded file and number of words,
+        # stored in it (see 'store_update')
+        self.__segments = 0
+        self.__stored_words = 0
+        # version of format of loaded file, updates are written in it
+        self.__segment_version = modelstore.VERSION
 
     def train(self, line: str):
         """
@@ -39,11 +131,153 @@ class Model:
 
         THIS FUNCTION IS USED IN TRAIN.PY
         """
-        generator = self.__word_generator(line)
-        for kgram in generator:
-            for lexeme in kgram:
-                self.__check_lexicon(lexeme)
-            self.__member_entrance(kgram)
+        for kgram in self.__word_generator(line):
+            self.__add_kgram(kgram, 1)
+
+    def train_lines(self, lines):
+        """
+        Public method
+
+        Bulk version of 'train' for a chunk of lines (or whole document).
+
+        Words of all lines are encoded once into array of codes,
+        then k-grams of each length are taken as sliding windows over
+        this array and counted at once with sort (see 'count_codes').
+        Each k-gram of the text is counted once; last (max_gram - 1)
+        words are carried to the next call, so k-grams span chunks.
+
+        :param lines: iterable of lines to train this model
+        :return: None
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        codes = self.__lexicon.encode(
+            self.__tokenizer.split('\n'.join(lines)), add=True)
+        self.add_counted(count_codes(*self.continue_text(codes),
+                                     self.__max_gram))
+
+    def continue_text(self, codes, words: list = None) -> tuple:
+        """
+        Public method
+
+        Prepends words, carried from the previous lines, to the new
+        text and carries last (max_gram - 1) words of the text.
+
+        :param codes: array of codes of words of the text
+        :param words: lexicon of 'codes' (see 'encode_texts'), its
+            words are added to lexicon of the model in order of codes
+            and 'codes' are translated; None if 'codes' are codes
+            of this model
+        :return: array of codes with carried ones and number of
+            carried codes (arguments of 'count_codes')
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        if words is not None:
+            codes = self.__lexicon.encode(words, add=True)[codes]
+        carried = list(self.__word_buffer)
+        self.__word_buffer.extend(
+            codes[max(0, len(codes) - self.__max_gram + 1):].tolist())
+        debugging.count('tokens', len(codes))
+        return numpy.concatenate(
+            (numpy.array(carried, dtype=numpy.int64), codes)), len(carried)
+
+    def add_counted(self, counted):
+        """
+        Public method
+
+        Increases frequencies of k-grams, counted by 'count_codes'.
+
+        :param counted: list of sorted unique k-grams and frequencies
+        :return: None
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        for kgrams, frequencies in counted:
+            self.__add_kgrams(kgrams, frequencies)
+
+    def prune(self, min_count: int = 1, top_k: int = None,
+              min_word_count: int = 1):
+        """
+        Public method
+
+        Shrinks model: words, which occur less than 'min_word_count'
+        times, are replaced with config.UNKNOWN_WORD (codes of words
+        are renumbered) and frequencies of k-grams, which became
+        equal, are summed. Then k-grams longer than one word, which
+        occur less than 'min_count' times, are removed, and only
+        'top_k' the most frequent continuations of each context are
+        kept. Probabilities of continuations are computed from the
+        remaining frequencies, so they stay normalized.
+
+        :param min_count: minimal frequency of k-gram
+        :param top_k: maximal number of continuations of context
+        :param min_word_count: minimal frequency of word
+        :return: None
+        :raise ValueError: if model is in binary format or no word
+            occurs 'min_word_count' times
+
+        THIS FUNCTION IS USED IN TRAIN.PY AND CONVERT.PY
+        """
+        self.__check_not_mapped()
+        kgrams = self.__k_grams.items()
+        if min_word_count > 1:
+            kgrams = self.__prune_lexicon(min_word_count).items()
+        if min_count > 1:
+            kgrams = [(kgram, frequency) for kgram, frequency in kgrams
+                      if len(kgram) == 1 or frequency >= min_count]
+        if top_k is not None:
+            continuations = collections.defaultdict(list)
+            for kgram, frequency in kgrams:
+                continuations[kgram[:-1]].append((frequency, kgram))
+            kgrams = []
+            for context, variants in continuations.items():
+                if context:
+                    variants = heapq.nlargest(top_k, variants)
+                kgrams += [(kgram, frequency) for frequency, kgram in variants]
+        kgrams = list(kgrams)
+        if self.__compact:
+            self.__k_grams = self.__new_store()
+        else:
+            self.__k_grams = collections.defaultdict(int)
+        for kgram, frequency in kgrams:
+            self.__add_kgram(kgram, frequency)
+        self.reset_context()
+        # codes have changed, so pruned model is stored as a whole
+        self.__segments = self.__stored_words = 0
+
+    def reset_context(self):
+        """
+        Public method
+
+        Forgets words, carried from the previous lines, so k-grams
+        of the next line do not span two documents.
+
+        :return: None
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        self.__word_buffer.clear()
+
+    def merge(self, other):
+        """
+        Public method
+
+        Adds k-gram frequencies of 'other' model (shard, trained on
+        other documents) to this model. Words of 'other' are added
+        to this lexicon in order of their codes, so merging shards in
+        order of documents gives the same codes as training on them
+        one by one.
+
+        :param other: Model with the same length of n-gram
+        :return: None
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        codes = self.__lexicon.encode(other.__lexicon.words(),
+                                      add=True).tolist()
+        for kgram, frequency in other.__k_grams.items():
+            self.__add_kgram(tuple(codes[code] for code in kgram), frequency)
 
     def store(self, file):
         """
@@ -52,32 +286,106 @@ class Model:
         This method stores model: dictionary with words and their
         codes (number in order of occurrence in input stream).
 
-        This method uses 'pickle' to dump model.
+        This method writes segmented model file (see 'modelstore')
+        with the only segment, which may be extended with
+        'store_update' later.
 
         :param file: file where frequency model will be dumped
         :return: None
 
         THIS FUNCTION IS USED IN TRAIN.PY
         """
-        return pickle.dump((self.__k_grams, self.__lexicon), file, 2)
+        modelstore.write_header(file)
+        modelstore.write_segment(file, 0, self.__lexicon.words(),
+                                 self.__k_grams, self.__max_gram)
 
-    def load(self, file):
+    def store_update(self, file):
+        """
+        Public method
+
+        This method appends segment with words and k-grams, which
+        were added since model was loaded with 'lexicon_only', to
+        segmented model file. Cost depends only on size of update.
+
+        :param file: segmented model file, opened for appending
+        :return: None
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        modelstore.write_segment(file, self.__stored_words,
+                                 self.__lexicon.words(self.__stored_words),
+                                 self.__k_grams, self.__max_gram,
+                                 self.__segment_version)
+
+    def stored_segments(self) -> int:
+        """
+        Public method
+
+        :return: number of segments in loaded segmented model file
+            (0 if model was loaded from file of other format)
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        return self.__segments
+
+    def store_mapped(self, file):
+        """
+        Public method
+
+        This method stores model in binary format (see 'modelfile'),
+        which is loaded without unpickling and preprocessing.
+
+        :param file: binary file where model will be written
+        :return: None
+
+        THIS FUNCTION IS USED IN CONVERT.PY
+        """
+        self.__check_not_mapped()
+        modelfile.write(file, self.__k_grams, self.__lexicon,
+                        self.__max_gram, self.__spill_dir)
+
+    def load(self, file, lexicon_only: bool = False):
         """
         Public method
 
         This method loads model: dictionary with words and their
         codes (number in order of occurrence in input stream).
 
-        This method uses 'pickle' to load model.
+        Model in binary format is mapped into memory, segmented model
+        is summed over its segments, otherwise it is loaded with
+        'pickle' (legacy format). Loaded k-grams are kept in
+        KGramStore: blocks of segments are appended to it as they are
+        read, legacy dict is packed once, so generators are made
+        without packing the model again (see make_generator).
 
         :param file: file where frequency model was dumped
+        :param lexicon_only: load only lexicon of segmented model to
+            continue training and store update (see 'store_update'),
+            models of other formats are loaded completely
         :return: None
 
-        THIS FUNCTION IS USED IN GENERATE.PY
+        THIS FUNCTION IS USED IN GENERATE.PY AND TRAIN.PY
         """
-        self.__k_grams, self.__lexicon = pickle.load(file)
-
-    def generate_text(self, output: str, length: int, seed: str):
+        if modelfile.is_mapped_model(file):
+            if lexicon_only:
+                raise ValueError('binary model cannot be updated, '
+                                 'train on model in pickle format')
+            self.__mapped = modelfile.MappedModel(file)
+            self.__max_gram = self.__mapped.max_gram
+            return
+        if modelstore.is_segmented_model(file):
+            self.__segment_version = modelstore.read_header(file)
+            self.__load_segments(file, lexicon_only)
+        else:
+            kgrams, table = pickle.load(file)
+            # legacy lexicon is dict: word -> code
+            self.__lexicon = lexicon.Lexicon(
+                sorted(table, key=table.__getitem__))
+            self.__k_grams = self.__packed(kgrams)
+            self.__compact = True
+
+    def generate_text(self, output: str, length: int, seed: str,
+                      random_seed: int = None, **options):
         """
         Public method
 
@@ -90,67 +398,225 @@ class Model:
             will be outputed
         :param length: length of generated sequence
         :param seed: word, from which sequence will be started
+        :param random_seed: seed of random numbers generator, the same
+            seed gives the same text (unpredictable text by default)
+        :param options: options of TextGenerator (see make_generator)
         :return: None
 
         THIS FUNCTION IS USED IN GENERATE.PY
         """
-        generator = textgenerator.TextGenerator(
-            self.__k_grams, self.__lexicon, self.__max_gram)
-        generator.generate_text(length, output, seed)
+        self.make_generator(**options).generate_text(
+            length, output, seed, numpy.random.default_rng(random_seed))
+
+    def iter_text(self, length: int, seed: str = None, rng=None):
+        """
+        Public method
+
+        Iterator over generated text, which is yielded in chunks
+        (see TextGenerator.iter_text).
+
+        :param length: length of generated sequence
+        :param seed: word, from which sequence will be started
+        :param rng: numpy.random.Generator
+        :return: generator of str
+        """
+        return self.make_generator().iter_text(length, seed, rng)
+
+    def generate_batch(self, seeds, length: int, random_seed: int = None,
+                       **options):
+        """
+        Public method
+
+        Generates many independent sequences with one TextGenerator:
+        batch is split into chunks (see textgenerator.split_batch),
+        sequences of chunk are generated in lockstep.
+
+        :param seeds: list of words, from which sequences are started
+            (None - random beginning), or number of sequences
+        :param length: length of each sequence
+        :param random_seed: seed of random numbers generator, the same
+            seed gives the same texts (unpredictable texts by default)
+        :param options: options of TextGenerator (see make_generator)
+        :return: generator of str, texts in order of seeds
+        """
+        if isinstance(seeds, int):
+            seeds = [None] * seeds
+        generator = self.make_generator(**options)
+        for chunk, seed_sequence in textgenerator.split_batch(
+                seeds, random_seed):
+            yield from generator.generate_batch(
+                chunk, length, numpy.random.default_rng(seed_sequence))
+
+    def make_generator(self, eager: bool = False,
+                       cache_size: int = textgenerator.CACHE_SIZE):
+        """
+        Public method
+
+        Initialises TextGenerator with this model, then the generator
+        may be used for many texts.
+
+        :param eager: build sampling tables of all contexts at once,
+            instead of building them lazily, when they are met
+        :param cache_size: number of lazily built tables, which are
+            kept (None - all of them)
+        :return: TextGenerator
+
+        THIS FUNCTION IS USED IN SERVER.PY
+        """
+        if self.__mapped is not None:
+            return textgenerator.TextGenerator(
+                self.__mapped, self.__mapped.lexicon, self.__max_gram)
+        return textgenerator.TextGenerator(
+            self.__k_grams, self.__lexicon, self.__max_gram,
+            cache_size, eager)
+
+    def __check_not_mapped(self):
+        """
+        Private method
+
+        K-grams of model in binary format are not loaded into memory,
+        so it is not pruned and stored again.
+
+        :raise ValueError: if model is loaded from binary format
+        """
+        if self.__mapped is not None:
+            raise ValueError('model is already in binary format, '
+                             'convert model in pickle format')
+
+    def __load_segments(self, file, lexicon_only: bool):
+        """
+        Private method
+
+        Reads segments of segmented model file: words are added to
+        lexicon, frequencies of k-grams are summed
+
+        :param file: segmented model file, positioned after magic
+        :param lexicon_only: skip k-grams
+        :return: None
+        """
+        segments = modelstore.read_segments(
+            file, self.__max_gram, not lexicon_only, self.__segment_version,
+            compact=True)
+        for first_code, words, kgrams in segments:
+            # words of segment follow words of previous segments
+            self.__lexicon.extend(words)
+            if not lexicon_only and not self.__segments:
+                # frequencies of the base segment are taken as they are
+                self.__k_grams = self.__packed(kgrams)
+                self.__compact = True
+            elif not lexicon_only:
+                # sorted k-grams of update are merged by blocks
+                kgrams = self.__packed(kgrams)
+                for k in range(1, self.__max_gram + 1):
+                    for keys, frequencies in kgrams.blocks(k):
+                        self.__k_grams.add_counted(
+                            kgramstore.unpack(keys, k), frequencies)
+            self.__segments += 1
+        self.__stored_words = len(self.__lexicon)
+
+    def __prune_lexicon(self, min_word_count: int):
+        """
+        Private method
+
+        Replaces rare words with config.UNKNOWN_WORD, kept words are
+        renumbered in order of their codes
+
+        :param min_word_count: minimal frequency of word
+        :return: dict: k-gram -> frequency with new codes
+        :raise ValueError: if no word is kept
+        """
+        unknown = self.__lexicon.get(config.UNKNOWN_WORD)
+        codes, kept = {}, []
+        for code, lexeme in enumerate(self.__lexicon.words()):
+            if code == unknown or \
+                    self.__k_grams.get((code,), 0) < min_word_count:
+                continue
+            codes[code] = len(kept)
+            kept.append(lexeme)
+        if not any(lexeme != config.SENTENCE_END for lexeme in kept):
+            # model would generate only unknown words
+            raise ValueError('no word occurs %d times' % min_word_count)
+        unknown_code = len(kept)
+        kgrams = collections.defaultdict(int)
+        for kgram, frequency in self.__k_grams.items():
+            kgrams[tuple(codes.get(code, unknown_code)
+                         for code in kgram)] += frequency
+        self.__lexicon = lexicon.Lexicon(kept + [config.UNKNOWN_WORD])
+        return kgrams
 
     def __word_generator(self, line: str):
         """
         Private method
 
-        This is generator, used in method 'train', it yields all k-grams,
-        including last (max_gram - 1) words from the last line.
-        Also, is split line and removes non-alphabetic characters.
+        This is generator, used in method 'train', it yields k-grams
+        (tuples of codes), which end in words of the new line. They
+        may begin in last (max_gram - 1) words of the previous lines,
+        so each k-gram of the text is yielded exactly once.
+        Also, is split line, removes non-alphabetic characters and
+        adds new words to lexicon.
 
         :param line: new line in the text to parse
         :return:
         """
-        while len(self.__word_buffer) >= self.__max_gram:
-            self.__word_buffer.popleft()
-        words = re.sub('[^А-Яа-яЁёЪъ ]+', '', line).split()
-        self.__word_buffer.extend(words)
-        words = list(self.__word_buffer.copy())
-        for k in range(1, min(self.__max_gram, len(words)) + 1):
-            for kgram in find_kgrams(words, k):
-                yield kgram
-
-    def __get_code(self, lexeme: str) -> int:
+        carried = list(self.__word_buffer)
+        codes = carried + self.__lexicon.encode(
+            self.__tokenizer.split(line), add=True).tolist()
+        debugging.count('tokens', len(codes) - len(carried))
+        for end in range(len(carried), len(codes)):
+            for k in range(1, min(self.__max_gram, end + 1) + 1):
+                yield tuple(codes[end - k + 1:end + 1])
+        self.__word_buffer.extend(codes[len(carried):])
+
+    def __packed(self, kgrams) -> kgramstore.KGramStore:
         """
         Private method
 
-        Gives code of lexeme in lexicon
+        :param kgrams: dict-like: tuple of codes -> frequency
+        :return: 'kgrams' as KGramStore, packed if they are in dict
+        """
+        if isinstance(kgrams, kgramstore.KGramStore):
+            return kgrams
+        return kgramstore.from_items(kgrams, self.__max_gram)
 
-        :param lexeme: str
-        :return: int: entrance code of word in model
+    def __new_store(self) -> kgramstore.KGramStore:
         """
-        return self.__lexicon.get(lexeme)
+        Private method
 
-    def __check_lexicon(self, lexeme: str):
+        :return: empty KGramStore with memory limit of the model
+        """
+        return kgramstore.KGramStore(
+            self.__max_gram, memory_limit=self.__memory_limit,
+            spill_dir=self.__spill_dir)
+
+    def __add_kgrams(self, kgrams, frequencies):
         """
         Private method
 
-        Updates lexicon and word_counter if new word was found
+        Increases frequencies of k-grams of the same length in storage
 
-        :param lexeme: next lexeme in the text
+        :param kgrams: sorted 2d array of unique codes, one k-gram per row
+        :param frequencies: array of numbers of new entrances
         :return: None
         """
-        if self.__get_code(lexeme) is None:
-            self.__lexicon[lexeme] = self.__word_counter
-            self.__word_counter += 1
-
-    def __member_entrance(self, k_gram):
+        if self.__compact:
+            self.__k_grams.add_counted(kgrams, frequencies)
+            return
+        # columns are zipped into tuples of codes
+        for kgram, frequency in zip(zip(*kgrams.T.tolist()),
+                                    frequencies.tolist()):
+            self.__k_grams[kgram] += frequency
+
+    def __add_kgram(self, kcode: tuple, frequency: int):
         """
         Private method
 
-        Updates frequency if k-gram was found before
+        Increases frequency of k-gram (tuple of codes) in storage
 
-        :param k_gram: current k-gram in the text
+        :param kcode: k-gram as tuple of codes
+        :param frequency: number of new entrances
         :return: None
         """
-        code_combination = [self.__get_code(lexeme) for lexeme in k_gram]
-        kcode = tuple(code_combination,)
-        self.__k_grams[kcode] += 1
+        if self.__compact:
+            self.__k_grams.add(kcode, frequency)
+        else:
+            self.__k_grams[kcode] += frequency
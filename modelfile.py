@@ -0,0 +1,376 @@
+import bisect
+import collections
+import mmap
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+import config
+import kgramstore
+
+"""
+
+    Binary model format, which is read through mmap without copying.
+
+    File starts with header: magic, format version, length of n-gram
+    and number of sections. It is followed by table of sections
+    (offset and size in bytes of each one) and by sections themselves,
+    aligned to 8 bytes. Sections go in the following order:
+
+        word offsets    uint64[words + 1], offsets of words in string table
+        string table    utf-8 encoded words, ordered by code
+        word order      uint32[words], codes sorted by utf-8 of words
+        unigrams        uint32[unigrams], codes of all 1-grams
+
+    and then for each length of context k from 1 to n - 1:
+
+        contexts        uint32[contexts, k] big-endian, sorted
+        offsets         uint64[contexts + 1], continuations of context
+        words           uint32[continuations], codes of continuations
+        cumulative      uint64[continuations], cumulative frequencies
+                        of continuations in their context
+
+    All numbers, except context codes, are little-endian.
+
+"""
+
+MAGIC = b'TGMODEL\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIII')
+SECTION = struct.Struct('<QQ')
+ALIGNMENT = 8
+
+OFFSET_TYPE = numpy.dtype('<u8')
+WORD_TYPE = numpy.dtype('<u4')
+
+
+def is_mapped_model(file) -> bool:
+    """Checks if binary 'file' starts with magic of this format"""
+    position = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(position)
+    return magic == MAGIC
+
+
+def sorted_blocks(kgrams, max_gram: int) -> list:
+    """
+    Gives k-grams of each length as blocks of sorted packed keys.
+
+    :param kgrams: dict-like: tuple of codes -> frequency, KGramStore
+        gives its blocks (merged from spilled runs) without copying
+    :param max_gram: length of n-gram
+    :return: list of iterables of (keys, frequencies), index is
+        length of k-grams - 1
+    """
+    if isinstance(kgrams, kgramstore.KGramStore):
+        return [kgrams.blocks(k) for k in range(1, max_gram + 1)]
+    rows = collections.defaultdict(list)
+    counts = collections.defaultdict(list)
+    for kgram, count in kgrams.items():
+        rows[len(kgram)].append(kgram)
+        counts[len(kgram)].append(count)
+    return [[kgramstore.merge_counts(
+        kgramstore.pack(rows.pop(k, []), k),
+        numpy.array(counts.pop(k, []), dtype=OFFSET_TYPE))]
+        for k in range(1, max_gram + 1)]
+
+
+def write_tables(blocks, k: int, unknown, files):
+    """
+    Writes sampling table of contexts of length 'k' block by block,
+    so whole table is never kept in memory. Context, which continues
+    from the previous block, keeps its cumulative frequency.
+
+    :param blocks: sorted blocks of (k + 1)-grams (see 'sorted_blocks')
+    :param k: length of context
+    :param unknown: code of word, k-grams with which are skipped
+    :param files: files for contexts, offsets, words and cumulative
+    :return: None
+    """
+    contexts_file, offsets_file, words_file, cumulative_file = files
+    # last context of previous block, its cumulative frequency
+    # and number of written continuations
+    previous, carry, total = None, 0, 0
+    for keys, frequencies in blocks:
+        codes = kgramstore.unpack(keys, k + 1)
+        if unknown is not None:
+            kept = (codes != unknown).all(axis=1)
+            codes, frequencies = codes[kept], frequencies[kept]
+        if not len(codes):
+            continue
+        frequencies = frequencies.astype(OFFSET_TYPE)
+        contexts = numpy.ascontiguousarray(codes[:, :k])
+        # continuations of the same context are neighbours after sort
+        first = numpy.ones(len(codes), dtype=bool)
+        first[1:] = (contexts[1:] != contexts[:-1]).any(axis=1)
+        first[0] = previous is None or (contexts[0] != previous).any()
+        starts = numpy.flatnonzero(first)
+        cumulative = numpy.cumsum(frequencies, dtype=OFFSET_TYPE)
+        # make cumulative frequencies start over in every context
+        before = cumulative[starts] - frequencies[starts]
+        # the first continuations may belong to context of previous block
+        continued = starts[0] if len(starts) else len(codes)
+        cumulative[continued:] -= numpy.repeat(
+            before, numpy.diff(numpy.append(starts, len(codes))))
+        cumulative[:continued] += OFFSET_TYPE.type(carry)
+        contexts_file.write(contexts[starts].tobytes())
+        offsets_file.write((starts + total).astype(OFFSET_TYPE).tobytes())
+        words_file.write(codes[:, k].astype(WORD_TYPE).tobytes())
+        cumulative_file.write(cumulative.tobytes())
+        previous, carry = contexts[-1].copy(), int(cumulative[-1])
+        total += len(codes)
+    offsets_file.write(numpy.array([total], dtype=OFFSET_TYPE).tobytes())
+
+
+def write(file, kgrams, lexicon, max_gram: int, temp_dir: str = None):
+    """
+    Writes model in binary format to 'file'.
+
+    Sampling tables are built from sorted blocks of k-grams into
+    temporary files and copied to 'file' one after another, so
+    k-grams, spilled to disk by KGramStore, are never loaded at once.
+
+    :param file: binary file opened for writing
+    :param kgrams: dict-like: tuple of codes -> frequency
+    :param lexicon: Lexicon of the model
+    :param max_gram: length of n-gram
+    :param temp_dir: directory for temporary files (system one
+        by default)
+    :return: None
+    """
+    words = [word.encode('utf-8') for word in lexicon.words()]
+    size = len(words)
+    word_offsets = numpy.zeros(size + 1, dtype=OFFSET_TYPE)
+    numpy.cumsum([len(word) for word in words], out=word_offsets[1:])
+    word_order = numpy.array(
+        sorted(range(size), key=words.__getitem__), dtype=WORD_TYPE)
+    strings = numpy.frombuffer(b''.join(words), dtype=numpy.uint8)
+
+    # pruned words stay in lexicon, but are never generated
+    unknown = lexicon.get(config.UNKNOWN_WORD)
+    blocks = sorted_blocks(kgrams, max_gram)
+    sections = [tempfile.TemporaryFile(dir=temp_dir)
+                for _ in range(1 + 4 * (max_gram - 1))]
+    try:
+        for keys, _ in blocks[0]:
+            unigrams = kgramstore.unpack(keys, 1)[:, 0].astype(WORD_TYPE)
+            if unknown is not None:
+                unigrams = unigrams[unigrams != unknown]
+            sections[0].write(unigrams.tobytes())
+        for k in range(1, max_gram):
+            write_tables(blocks[k], k, unknown,
+                         sections[4 * k - 3:4 * k + 1])
+        sections = [word_offsets, strings, word_order] + sections
+
+        position = HEADER.size + SECTION.size * len(sections)
+        table = []
+        for section in sections:
+            position += -position % ALIGNMENT
+            nbytes = section.nbytes if isinstance(section, numpy.ndarray) \
+                else section.tell()
+            table.append((position, nbytes))
+            position += nbytes
+
+        file.write(HEADER.pack(MAGIC, VERSION, max_gram, len(sections)))
+        for entry in table:
+            file.write(SECTION.pack(*entry))
+        for section, (offset, _) in zip(sections, table):
+            file.write(b'\x00' * (offset - file.tell()))
+            if isinstance(section, numpy.ndarray):
+                file.write(section.tobytes())
+            else:
+                section.seek(0)
+                shutil.copyfileobj(section, file)
+    finally:
+        for section in sections:
+            if not isinstance(section, numpy.ndarray):
+                section.close()
+
+
+class MappedWords:
+    """
+    Decoding table of the mapped model: code -> word.
+    """
+
+    def __init__(self, offsets, strings):
+        self.__offsets = offsets
+        self.__strings = strings
+
+    def __getitem__(self, code) -> str:
+        begin, end = self.__offsets[code], self.__offsets[code + 1]
+        return self.__strings[begin:end].tobytes().decode('utf-8')
+
+    def decode(self, codes, separator: str = ' ') -> str:
+        """Gives words with 'codes', joined with 'separator'"""
+        return separator.join(map(self.__getitem__, codes))
+
+    def length(self, code: int) -> int:
+        """Length of word with 'code' in characters"""
+        return len(self[code])
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
+
+
+class MappedLexicon:
+    """
+    Lexicon of the mapped model: word -> code,
+    words are searched with bisection over codes sorted by words.
+    """
+
+    def __init__(self, words: MappedWords, order):
+        self.__words = words
+        self.__order = order
+
+    def get(self, word: str, default=None):
+        position = bisect.bisect_left(
+            self.__order, word, key=self.__words.__getitem__)
+        if position < len(self.__order):
+            code = int(self.__order[position])
+            if self.__words[code] == word:
+                return code
+        return default
+
+    def __getitem__(self, word: str) -> int:
+        code = self.get(word)
+        if code is None:
+            raise KeyError(word)
+        return code
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    def __len__(self) -> int:
+        return len(self.__order)
+
+
+class MappedModel:
+    """
+    Model, stored in binary format and mapped into memory.
+
+    Arrays are views of the mapped file, so loading does not read
+    or copy data and pages are shared between processes, which
+    map the same file. Sampling tables are ready for TextGenerator.
+    """
+
+    def __init__(self, file):
+        self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, max_gram, size = HEADER.unpack_from(self.__map)
+        if magic != MAGIC:
+            raise ValueError('File is not a text generator model')
+        if version != VERSION:
+            raise ValueError('Unsupported model format version %d' % version)
+        # length of n-gram
+        self.max_gram = max_gram
+        table = [SECTION.unpack_from(self.__map,
+                                     HEADER.size + SECTION.size * i)
+                 for i in range(size)]
+        sections = iter(table)
+
+        def section(dtype):
+            offset, length = next(sections)
+            return numpy.frombuffer(self.__map, dtype=dtype,
+                                    count=length // dtype.itemsize,
+                                    offset=offset)
+
+        self.words = MappedWords(section(OFFSET_TYPE),
+                                 section(numpy.dtype('u1')))
+        self.lexicon = MappedLexicon(self.words, section(WORD_TYPE))
+        self.__unigrams = section(WORD_TYPE)
+        # sampling tables, index is length of context - 1
+        self.__contexts, self.__offsets = [], []
+        self.__continuations, self.__cumulative = [], []
+        for k in range(1, max_gram):
+            key_type = numpy.dtype(
+                (numpy.void, kgramstore.CODE_TYPE.itemsize * k))
+            self.__contexts.append(section(key_type))
+            self.__offsets.append(section(OFFSET_TYPE))
+            self.__continuations.append(section(WORD_TYPE))
+            self.__cumulative.append(section(OFFSET_TYPE))
+        # total number of k-grams of all lengths
+        self.__size = len(self.__unigrams) + sum(
+            len(words) for words in self.__continuations)
+
+    def get(self, context: tuple, default=None):
+        """
+        Public method
+
+        Gives continuations of 'context' with their
+        cumulative frequencies.
+
+        :param context: tuple of codes
+        :return: (words, cumulative) or 'default' if context is unknown
+        """
+        k = len(context)
+        if not 0 < k < self.max_gram:
+            return default
+        contexts = self.__contexts[k - 1]
+        key = kgramstore.pack([context], k)
+        position = numpy.searchsorted(contexts, key)[0]
+        if position == len(contexts) or contexts[position] != key[0]:
+            return default
+        offsets = self.__offsets[k - 1]
+        begin, end = offsets[position], offsets[position + 1]
+        return (self.__continuations[k - 1][begin:end],
+                self.__cumulative[k - 1][begin:end])
+
+    def get_many(self, contexts: list, default=None) -> list:
+        """
+        Public method
+
+        Gives continuations of 'contexts' like 'get', all contexts
+        are searched at once.
+
+        :param contexts: non-empty list of tuples of codes of the
+            same length
+        :return: list of (words, cumulative) or 'default'
+        """
+        k = len(contexts[0])
+        if not 0 < k < self.max_gram:
+            return [default] * len(contexts)
+        stored = self.__contexts[k - 1]
+        keys = kgramstore.pack(contexts, k)
+        positions = numpy.searchsorted(stored, keys)
+        found = positions < len(stored)
+        found[found] = stored[positions[found]] == keys[found]
+        offsets = self.__offsets[k - 1]
+        begins, ends = offsets[positions[found]], \
+            offsets[positions[found] + 1]
+        tables = [default] * len(contexts)
+        for i, begin, end in zip(numpy.flatnonzero(found).tolist(),
+                                 begins.tolist(), ends.tolist()):
+            tables[i] = (self.__continuations[k - 1][begin:end],
+                         self.__cumulative[k - 1][begin:end])
+        return tables
+
+    def random_kgram(self, point: float) -> tuple:
+        """
+        Public method
+
+        Gives k-gram of the model, all k-grams are equiprobable.
+
+        :param point: uniformly distributed number in [0, 1)
+        :return: tuple of codes
+        :raise ValueError: if there are no k-grams
+        """
+        if not len(self):
+            raise ValueError('model has no k-grams')
+        index = int(point * self.__size)
+        if index < len(self.__unigrams):
+            return int(self.__unigrams[index]),
+        index -= len(self.__unigrams)
+        for k in range(1, self.max_gram):
+            continuations = self.__continuations[k - 1]
+            if index < len(continuations):
+                offsets = self.__offsets[k - 1]
+                position = numpy.searchsorted(offsets, index, 'right') - 1
+                context = kgramstore.unpack(
+                    self.__contexts[k - 1][position:position + 1], k)
+                return tuple(context[0].tolist()) + (
+                    int(continuations[index]),)
+            index -= len(continuations)
+
+    def __len__(self) -> int:
+        return self.__size
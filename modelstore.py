@@ -0,0 +1,309 @@
+import collections
+import pickle
+import struct
+import zlib
+
+import numpy
+
+import kgramstore
+import modelfile
+
+"""
+
+    Segmented model file, which grows by appending delta segments.
+
+    File starts with magic (its last byte is version of format) and is
+    followed by segments. Each segment has header: code of its first
+    word, size (in bytes) of frame of words and if k-grams are stored
+    in KGramStore. Header is followed by frames:
+
+        words       zlib compressed utf-8 words, which were added to
+                    lexicon by this segment, in order of codes,
+                    separated with line breaks
+        k-grams     frequencies of k-grams, counted by this segment,
+                    as blocks (see 'encode_block'), each block has
+                    header: length of k-grams, their number and size
+                    of the block in bytes; block with zero length
+                    of k-grams ends the frame
+
+    K-grams go by length, sorted, so blocks are written and read one
+    by one and neither the whole model nor its serialized copy are
+    kept in memory.
+
+    The first segment is the base model, each next one is an update.
+    Frequencies of the model are sums over all segments. Sizes in
+    headers allow to read lexicon without reading k-grams.
+
+    Segments of version 0 have two pickled frames instead: (first
+    code, list of words) and dict-like k-grams. Such files are read
+    and updated in their format.
+
+"""
+
+VERSION = 1
+MAGIC = b'TGSEGMT' + bytes([VERSION])
+LEGACY_SEGMENT = struct.Struct('<QQ')
+SEGMENT = struct.Struct('<QQ?')
+BLOCK = struct.Struct('<BII')
+# number of k-grams in block
+BLOCK_SIZE = 1 << 16
+# level of zlib compression of blocks
+COMPRESS_LEVEL = 1
+# maximal number of bytes of varint of 64-bit number
+VARINT_BYTES = 10
+
+
+def is_segmented_model(file) -> bool:
+    """Checks if binary 'file' starts with magic of this format"""
+    position = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(position)
+    return len(magic) == len(MAGIC) and magic[:-1] == MAGIC[:-1] \
+        and magic[-1] <= VERSION
+
+
+def write_header(file):
+    file.write(MAGIC)
+
+
+def read_header(file) -> int:
+    """
+    Reads magic of segmented 'file'.
+
+    :return: version of format
+    """
+    return file.read(len(MAGIC))[-1]
+
+
+def encode_varints(values) -> bytes:
+    """
+    Encodes non-negative integers as varints: 7 bits per byte,
+    starting from the lowest ones, high bit is set in all bytes
+    of number, except the last one. Bytes are filled by their
+    index in number, for numbers which are long enough.
+
+    :param values: array of integers
+    :return: bytes
+    """
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    sizes = numpy.ones(len(values), dtype=numpy.int64)
+    for shift in range(7, 7 * VARINT_BYTES, 7):
+        longer = values >= numpy.uint64(1 << shift)
+        if not longer.any():
+            break
+        sizes += longer
+    positions = numpy.cumsum(sizes) - sizes
+    data = numpy.empty(int(sizes.sum()), dtype=numpy.uint8)
+    while len(values):
+        last = sizes == 1
+        data[positions] = (values & numpy.uint64(0x7f)).astype(numpy.uint8)
+        data[positions[~last]] |= 0x80
+        values, sizes, positions = \
+            values[~last] >> numpy.uint64(7), sizes[~last] - 1, \
+            positions[~last] + 1
+    return data.tobytes()
+
+
+def decode_varints(data: bytes):
+    """
+    Decodes varints (see 'encode_varints').
+
+    :return: array of uint64
+    """
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+    ends = numpy.flatnonzero(data < 0x80) + 1
+    starts = numpy.zeros(len(ends), dtype=numpy.int64)
+    starts[1:] = ends[:-1]
+    first = data[starts]
+    values = (first & 0x7f).astype(numpy.uint64)
+    # numbers, which have more bytes, and position of next byte
+    pending = numpy.flatnonzero(first & 0x80)
+    positions = starts[pending] + 1
+    shift = numpy.uint64(7)
+    while len(pending):
+        data_bytes = data[positions]
+        values[pending] |= (data_bytes & 0x7f).astype(numpy.uint64) << shift
+        longer = (data_bytes & 0x80).astype(bool)
+        pending, positions = pending[longer], positions[longer] + 1
+        shift += numpy.uint64(7)
+    return values
+
+
+def encode_block(kgrams, counts) -> bytes:
+    """
+    Encodes sorted unique k-grams and their frequencies.
+
+    Each column of codes is delta-encoded: code is stored as
+    difference with code of the previous k-gram, if they have the
+    same prefix before this column (so difference is not negative),
+    else as it is. Codes go column by column, then frequencies, all
+    numbers are varints, compressed with zlib.
+
+    :param kgrams: sorted 2d array of codes, one k-gram per row
+    :param counts: array of their frequencies
+    :return: bytes
+    """
+    kgrams = kgrams.astype(numpy.int64)
+    columns = []
+    # if prefix of k-gram before current column differs from previous
+    changed = numpy.zeros(len(kgrams), dtype=bool)
+    changed[0] = True
+    for column in kgrams.T:
+        deltas = column.copy()
+        deltas[1:] -= column[:-1]
+        columns.append(numpy.where(changed, column, deltas))
+        changed[1:] |= column[1:] != column[:-1]
+    columns.append(counts)
+    return zlib.compress(encode_varints(numpy.concatenate(columns)),
+                         COMPRESS_LEVEL)
+
+
+def decode_block(data: bytes, k: int, size: int):
+    """
+    Decodes block of 'size' k-grams of length 'k' (see 'encode_block').
+
+    :return: sorted 2d array of codes and array of frequencies
+    """
+    values = decode_varints(zlib.decompress(data)).astype(numpy.int64)
+    kgrams = numpy.empty((size, k), dtype=kgramstore.CODE_TYPE)
+    changed = numpy.zeros(size, dtype=bool)
+    changed[0] = True
+    indices = numpy.arange(size)
+    for j in range(k):
+        deltas = values[j * size:(j + 1) * size]
+        # sums of deltas since the last stored code
+        starts = numpy.maximum.accumulate(numpy.where(changed, indices, 0))
+        sums = numpy.cumsum(deltas)
+        column = sums - sums[starts] + deltas[starts]
+        kgrams[:, j] = column
+        changed[1:] |= column[1:] != column[:-1]
+    return kgrams, values[k * size:]
+
+
+def write_segment(file, first_code: int, words: list, kgrams,
+                  max_gram: int, version: int = VERSION):
+    """
+    Appends segment to 'file' at its current position.
+
+    :param file: binary file opened for writing
+    :param first_code: code of the first word in 'words'
+    :param words: words, added to lexicon, in order of codes
+    :param kgrams: dict-like: tuple of codes -> frequency or KGramStore
+    :param max_gram: length of n-gram
+    :param version: version of format of the file
+    :return: None
+    """
+    if version == 0:
+        words_frame = pickle.dumps((first_code, words), 2)
+        kgrams_frame = pickle.dumps(kgrams, 2)
+        file.write(LEGACY_SEGMENT.pack(len(words_frame), len(kgrams_frame)))
+        file.write(words_frame)
+        file.write(kgrams_frame)
+        return
+    words_frame = zlib.compress('\n'.join(words).encode('utf-8'),
+                                COMPRESS_LEVEL)
+    file.write(SEGMENT.pack(first_code, len(words_frame),
+                            isinstance(kgrams, kgramstore.KGramStore)))
+    file.write(words_frame)
+    for k, blocks in enumerate(modelfile.sorted_blocks(kgrams, max_gram), 1):
+        for keys, counts in blocks:
+            for begin in range(0, len(keys), BLOCK_SIZE):
+                rows = kgramstore.unpack(keys[begin:begin + BLOCK_SIZE], k)
+                block = encode_block(rows, counts[begin:begin + BLOCK_SIZE])
+                file.write(BLOCK.pack(k, len(rows), len(block)))
+                file.write(block)
+    file.write(BLOCK.pack(0, 0, 0))
+
+
+def read_blocks(file, decode: bool = True):
+    """
+    Reads blocks of k-grams of segment up to the end of its frame.
+
+    :param file: binary file, positioned at the first block
+    :param decode: if False, blocks are skipped
+    :return: generator of (k, k-grams, frequencies) (see 'decode_block')
+    """
+    while True:
+        k, size, length = BLOCK.unpack(file.read(BLOCK.size))
+        if not k:
+            return
+        if decode:
+            yield (k,) + decode_block(file.read(length), k, size)
+        else:
+            file.seek(length, 1)
+
+
+def collect_blocks(blocks, max_gram: int, compact: bool):
+    """
+    Collects decoded blocks into dict or KGramStore: blocks of each
+    length are appended to store at once, when they are read.
+
+    :param blocks: generator of blocks (see 'read_blocks')
+    :param max_gram: length of n-gram
+    :param compact: collect into KGramStore
+    :return: dict-like: tuple of codes -> frequency
+    """
+    if not compact:
+        kgrams = collections.defaultdict(int)
+        for _, rows, counts in blocks:
+            # columns are zipped into tuples of codes
+            kgrams.update(zip(zip(*rows.T.tolist()), counts.tolist()))
+        return kgrams
+    kgrams = kgramstore.KGramStore(max_gram)
+    length, packed = None, []
+    for k, rows, counts in blocks:
+        if k != length and packed:
+            kgrams.extend_sorted(length, packed)
+            packed = []
+        length = k
+        packed.append((kgramstore.pack(rows, k), counts))
+    if packed:
+        kgrams.extend_sorted(length, packed)
+    return kgrams
+
+
+def read_segments(file, max_gram: int, with_kgrams: bool = True,
+                  version: int = VERSION, compact: bool = None):
+    """
+    Reads segments of 'file', which is positioned after magic.
+
+    :param file: binary file opened for reading
+    :param max_gram: length of n-gram
+    :param with_kgrams: if False, frames of k-grams are skipped
+        and None is yielded instead of them
+    :param version: version of format of the file (see 'read_header')
+    :param compact: collect k-grams into KGramStore (True) or dict
+        (False), None - as they were stored; pickled segments of
+        version 0 are yielded as they are
+    :return: generator of (first_code, words, kgrams)
+    """
+    while True:
+        if version == 0:
+            header = file.read(LEGACY_SEGMENT.size)
+            if len(header) < LEGACY_SEGMENT.size:
+                return
+            words_size, kgrams_size = LEGACY_SEGMENT.unpack(header)
+            first_code, words = pickle.loads(file.read(words_size))
+            if with_kgrams:
+                kgrams = pickle.loads(file.read(kgrams_size))
+            else:
+                file.seek(kgrams_size, 1)
+                kgrams = None
+            yield first_code, words, kgrams
+            continue
+        header = file.read(SEGMENT.size)
+        if len(header) < SEGMENT.size:
+            return
+        first_code, words_size, stored_compact = SEGMENT.unpack(header)
+        text = zlib.decompress(file.read(words_size)).decode('utf-8')
+        words = text.split('\n') if text else []
+        blocks = read_blocks(file, with_kgrams)
+        if with_kgrams:
+            kgrams = collect_blocks(
+                blocks, max_gram,
+                stored_compact if compact is None else compact)
+        else:
+            kgrams = None
+            for _ in blocks:
+                pass
+        yield first_code, words, kgrams
@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import urllib.parse
+
+import numpy
+
+import config
+import model
+import debugging
+
+"""
+
+    Generation server: loads model once and serves many requests.
+
+    Request is HTTP GET with parameters in query string:
+
+        /generate?length=200&seed=word&rng=42
+
+    'length' is compulsory (not negative, longer texts are cut to
+    MAX_LENGTH words), 'seed' is the initial word and 'rng' is seed
+    of random numbers, which makes generated text reproducible.
+    Response is generated text (text/plain, utf-8) or error message
+    with status 400 (bad request), 404 (unknown path) or 500 (text
+    cannot be generated, e.g. model has no known words). Connections
+    are kept alive, so a client may send many requests through one.
+
+"""
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           500: 'Internal Server Error'}
+# maximal length of text in one response
+MAX_LENGTH = 100000
+
+
+@debugging.scan_model
+def scan_model(model_path):
+    """
+
+    Loads stored model.
+
+    :param model_path: path where model ('model.pkl') was stored
+    :return: None
+    """
+    with open(model_path, "rb") as file:
+        freq_model.load(file)
+
+
+def respond(target: str):
+    """
+    Generates text for request with 'target' (path and query string)
+
+    :return: HTTP status and text of response
+    """
+    url = urllib.parse.urlsplit(target)
+    if url.path != '/generate':
+        return 404, 'Unknown path %s.\n' % url.path
+    query = urllib.parse.parse_qs(url.query)
+    try:
+        length = int(query['length'][0])
+        rng = numpy.random.default_rng(
+            int(query['rng'][0]) if 'rng' in query else None)
+    except (KeyError, ValueError):
+        return 400, 'Cannot parse length or rng.\n'
+    if length < 0:
+        return 400, 'Length must not be negative.\n'
+    seed = query.get('seed', [None])[0]
+    try:
+        return 200, ''.join(generator.iter_text(
+            min(length, MAX_LENGTH), seed, rng))
+    except ValueError as error:
+        debugging.server_logger.error("Cannot generate text: %s" % error)
+        return 500, 'Cannot generate text: %s.\n' % error
+
+
+async def handle_connection(reader, writer):
+    """Serves requests of one connection until client closes it"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            keep_alive = True
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                if header.lower().startswith(b'connection:'):
+                    keep_alive = b'close' not in header.lower()
+            try:
+                method, target, _ = request_line.decode('latin-1').split()
+            except ValueError:
+                status, text = 400, 'Cannot parse request.\n'
+            else:
+                # generation runs in thread pool, so the loop keeps
+                # accepting new requests meanwhile
+                try:
+                    status, text = await loop.run_in_executor(
+                        None, respond, target)
+                except Exception:
+                    # the connection is kept, error is reported to client
+                    debugging.server_logger.exception("Request failed.")
+                    status, text = 500, 'Internal error.\n'
+            body = text.encode('utf-8')
+            writer.write((
+                'HTTP/1.1 %d %s\r\n'
+                'Content-Type: text/plain; charset=utf-8\r\n'
+                'Content-Length: %d\r\n'
+                'Connection: %s\r\n\r\n' % (
+                    status, REASONS[status], len(body),
+                    'keep-alive' if keep_alive else 'close')
+            ).encode('latin-1') + body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        debugging.server_logger.warning("Connection lost.")
+    finally:
+        writer.close()
+
+
+async def serve(namespace):
+    if namespace.unix_socket is not None:
+        server = await asyncio.start_unix_server(
+            handle_connection, path=namespace.unix_socket)
+        address = namespace.unix_socket
+    else:
+        host = namespace.host or 'localhost'
+        port = int(namespace.port or 8080)
+        server = await asyncio.start_server(handle_connection, host, port)
+        address = '%s:%d' % (host, port)
+    debugging.server_logger.info("Serving on %s." % address)
+    print('Serving on %s.' % address)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+
+    freq_model = model.Model(config.N_GRAM_SIZE)
+
+    parser = argparse.ArgumentParser()
+    for argument, description in config.server_args.items():
+        parser.add_argument(argument, help=description)
+    parser_namespace, _ = parser.parse_known_args()
+
+    scan_model(parser_namespace.model)
+    # preprocessing is done once for all requests
+    generator = freq_model.make_generator()
+
+    try:
+        asyncio.run(serve(parser_namespace))
+    except KeyboardInterrupt:
+        debugging.server_logger.info("Server stopped.")
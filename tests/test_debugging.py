@@ -0,0 +1,42 @@
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import debugging
+
+
+class PeakMemoryTest(unittest.TestCase):
+
+    def dump(self, metrics_format: str) -> str:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics')
+            metrics = debugging.Metrics(path, metrics_format)
+            with metrics.phase('generate'):
+                metrics.counters['tokens'] += 3
+            metrics.dump()
+            with open(path) as file:
+                return file.read()
+
+    def test_measured(self):
+        records = [json.loads(line) for line in
+                   self.dump('json').splitlines()]
+        self.assertTrue(all(record['peak_rss_bytes'] > 0
+                            for record in records))
+        self.assertIn('peak_rss_bytes', self.dump('prometheus'))
+
+    def test_not_measured(self):
+        # there is no resource module on Windows
+        with unittest.mock.patch.object(debugging, 'resource', None):
+            records = [json.loads(line) for line in
+                       self.dump('json').splitlines()]
+            self.assertEqual([record['peak_rss_bytes'] for record in records],
+                             [None, None])
+            text = self.dump('prometheus')
+        self.assertNotIn('peak_rss_bytes', text)
+        self.assertIn('textgenerator_tokens_total{phase="generate"} 3', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import config
+import model
+import textgenerator
+from tests.test_model import make_lines
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BatchJobsTest(unittest.TestCase):
+    """generate.py --batch gives the same texts with any --jobs"""
+
+    def setUp(self):
+        # generate.py writes its log into working directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.model = model.Model(config.N_GRAM_SIZE)
+        self.model.train_lines(make_lines(2000))
+        with open(self.path('model.pkl'), 'wb') as file:
+            self.model.store(file)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def generate(self, *arguments) -> str:
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'generate.py'),
+             '--model', self.path('model.pkl'), '--length', '60',
+             '--random-seed', '11', '--output', self.path('texts.txt')]
+            + list(arguments),
+            cwd=self.directory.name, check=True, stdout=subprocess.DEVNULL)
+        with open(self.path('texts.txt')) as file:
+            return file.read()
+
+    def test_jobs(self):
+        # several chunks of batch
+        batch = str(2 * textgenerator.BATCH_SIZE + 10)
+        serial = self.generate('--batch', batch, '--jobs', '1')
+        # the same texts as Model.generate_batch
+        self.assertEqual(serial, ''.join(
+            text + '\n' for text in self.model.generate_batch(
+                int(batch), 60, random_seed=11)))
+        for jobs in ('2', '3'):
+            with self.subTest(jobs=jobs):
+                self.assertEqual(
+                    self.generate('--batch', batch, '--jobs', jobs), serial)
+
+    def test_seeds_file(self):
+        with open(self.path('seeds.txt'), 'w') as file:
+            file.write('мороз\n\nдень\n' * textgenerator.BATCH_SIZE)
+        serial = self.generate('--seeds-file', self.path('seeds.txt'))
+        self.assertEqual(self.generate(
+            '--seeds-file', self.path('seeds.txt'), '--jobs', '2'), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
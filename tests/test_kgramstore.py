@@ -0,0 +1,45 @@
+import io
+import random
+import tempfile
+import unittest
+
+import model
+
+
+def make_lines(number: int, seed: int = 0) -> list:
+    """Lines of random words of vocabulary of 300 words"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('абвгдеёжзийклмнопрстуфхцчшщэюя')
+                          for _ in range(rng.randint(1, 8)))
+                  for _ in range(300)]
+    return [' '.join(rng.choice(vocabulary)
+                     for _ in range(rng.randint(0, 15)))
+            for _ in range(number)]
+
+
+class SpillTest(unittest.TestCase):
+
+    def store_mapped(self, trained: model.Model) -> bytes:
+        file = io.BytesIO()
+        trained.store_mapped(file)
+        return file.getvalue()
+
+    def test_spilled_model_is_identical(self):
+        lines = make_lines(800)
+        with tempfile.TemporaryDirectory() as spill_dir:
+            spilled = model.Model(4, memory_limit=20000,
+                                  spill_dir=spill_dir)
+            for begin in range(0, len(lines), 50):
+                spilled.train_lines(lines[begin:begin + 50])
+            self.assertGreater(spilled._Model__k_grams.spilled(), 1)
+            stored = self.store_mapped(spilled)
+        for compact in (False, True):
+            with self.subTest(compact=compact):
+                trained = model.Model(4, compact=compact)
+                for begin in range(0, len(lines), 50):
+                    trained.train_lines(lines[begin:begin + 50])
+                self.assertEqual(self.store_mapped(trained), stored)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import pickle
+import random
+import unittest
+import unittest.mock
+
+import numpy
+
+import lexicon
+
+
+def make_words(number: int, seed: int = 0) -> list:
+    """Distinct random words of different lengths and alphabets"""
+    rng = random.Random(seed)
+    letters = 'абвгдеёжзийклмнопрстуфхцчшщэюяabcxyz0123456789'
+    words = set()
+    while len(words) < number:
+        words.add(''.join(rng.choice(letters)
+                          for _ in range(rng.randint(1, 12))))
+    return sorted(words, key=lambda word: rng.random())
+
+
+class LexiconTest(unittest.TestCase):
+
+    def check(self, table: lexicon.Lexicon, words: list):
+        """Lexicon has exactly 'words', their codes are indices"""
+        self.assertEqual(len(table), len(words))
+        self.assertEqual(table.words(), words)
+        self.assertEqual(table.encode(words).tolist(),
+                         list(range(len(words))))
+        for code, word in enumerate(words):
+            self.assertEqual(table[word], code)
+            self.assertEqual(table.length(code), len(word))
+
+    def test_codes_in_order_of_occurrence(self):
+        table = lexicon.Lexicon()
+        codes = table.encode(['день', 'мороз', 'день', 'и', 'мороз'],
+                             add=True)
+        self.assertEqual(codes.tolist(), [0, 1, 0, 2, 1])
+        codes = table.encode(['солнце', 'и', 'ещё', 'солнце'], add=True)
+        self.assertEqual(codes.tolist(), [3, 2, 4, 3])
+        self.check(table, ['день', 'мороз', 'и', 'солнце', 'ещё'])
+
+    def test_unknown_words(self):
+        table = lexicon.Lexicon(['мороз', 'и'])
+        self.assertEqual(table.encode(['и', 'солнце', 'морозы']).tolist(),
+                         [1, -1, -1])
+        self.assertNotIn('солнце', table)
+        self.assertIsNone(table.get('мор'))
+        with self.assertRaises(KeyError):
+            table['солнце']
+        # lookup does not add words
+        self.assertEqual(len(table), 2)
+
+    def test_growth(self):
+        words = make_words(5000)
+        table = lexicon.Lexicon()
+        # batches of different sizes, hash table is grown many times
+        begin = 0
+        for size in (1, 2, 5, 8, 13, 100, 371, 1500, 3000):
+            table.encode(words[begin:begin + size], add=True)
+            begin += size
+            slots = table._Lexicon__slots
+            # capacity is power of two, filled not more than by half
+            self.assertEqual(len(slots) & (len(slots) - 1), 0)
+            self.assertLessEqual(2 * len(table), len(slots))
+            self.check(table, words[:begin])
+        self.assertEqual(begin, len(words))
+
+    def test_hash_collisions(self):
+        words = make_words(300)
+        # all words have the same hash, so they are found only by
+        # comparison of bytes after linear probing
+        same_hash = unittest.mock.patch.object(
+            lexicon, 'hash_words',
+            lambda data, starts, lengths: numpy.full(
+                len(starts), 7, dtype=numpy.uint64))
+        with same_hash:
+            table = lexicon.Lexicon(words[:100])
+            table.encode(words[100:], add=True)
+            self.check(table, words)
+            self.assertEqual(table.encode(['нет', words[0]]).tolist(),
+                             [-1, 0])
+
+    def test_prefixes(self):
+        # words, which are prefixes of each other, are different
+        words = ['а', 'аа', 'ааа', 'ab', 'a', 'б', 'аб']
+        table = lexicon.Lexicon()
+        self.assertEqual(table.encode(words, add=True).tolist(),
+                         list(range(len(words))))
+        self.check(table, words)
+
+    def test_decode(self):
+        words = make_words(1000, seed=1)
+        table = lexicon.Lexicon(words)
+        rng = numpy.random.default_rng(0)
+        codes = rng.integers(0, len(words), 3000)
+        self.assertEqual(table.decode(codes),
+                         ' '.join(words[code] for code in codes))
+        self.assertEqual(table.decode(codes, '\n'),
+                         '\n'.join(words[code] for code in codes))
+        self.assertEqual(table.decode([]), '')
+        self.assertEqual(table.words(400), words[400:])
+        self.assertEqual(table.words(len(words)), [])
+
+    def test_pickle(self):
+        words = make_words(200, seed=2)
+        table = pickle.loads(pickle.dumps(lexicon.Lexicon(words)))
+        self.check(table, words)
+        table.encode(['новое'], add=True)
+        self.assertEqual(table['новое'], len(words))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import collections
+import random
+import unittest
+
+import model
+import tokenizer
+
+N = 4
+
+WORDS = ['мороз', 'и', 'солнце', 'день', 'чудесный', 'ещё', 'ты',
+         'дремлешь', 'друг', 'прелестный', 'пора', 'красавица',
+         'проснись']
+
+
+def make_lines(number: int, seed: int = 0) -> list:
+    """Short poetry-style lines, some of them empty or one word long"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(number):
+        words = [rng.choice(WORDS) for _ in range(rng.choice(
+            [0, 1, 1, 2, 3, 5]))]
+        line = ' '.join(words)
+        if words and rng.random() < 0.3:
+            line = line.capitalize() + rng.choice(['.', ',', '!', ' —'])
+        lines.append(line)
+    return lines
+
+
+def reference_counts(lines: list, text_tokenizer) -> collections.Counter:
+    """K-grams of the concatenated corpus, as tuples of words"""
+    words = text_tokenizer.split('\n'.join(lines))
+    counts = collections.Counter()
+    for k in range(1, N + 1):
+        counts.update(tuple(words[i:i + k])
+                      for i in range(len(words) - k + 1))
+    return counts
+
+
+def model_counts(trained: model.Model) -> collections.Counter:
+    """K-grams of trained model, as tuples of words"""
+    words = trained._Model__lexicon.words()
+    return collections.Counter({
+        tuple(words[code] for code in kgram): frequency
+        for kgram, frequency in trained._Model__k_grams.items()})
+
+
+class TrainCountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = make_lines(500)
+
+    def check(self, train, **options):
+        text_tokenizer = tokenizer.Tokenizer(**options)
+        for compact in (False, True):
+            with self.subTest(compact=compact, **options):
+                trained = model.Model(N, compact=compact,
+                                      text_tokenizer=text_tokenizer)
+                train(trained)
+                self.assertEqual(
+                    model_counts(trained),
+                    reference_counts(self.lines, text_tokenizer))
+
+    def test_train(self):
+        def train(trained):
+            for line in self.lines:
+                trained.train(line)
+        self.check(train)
+        self.check(train, lower=True, sentence_end=True)
+
+    def test_train_lines(self):
+        for chunk_size in (1, 3, 7, 101):
+            def train(trained):
+                for begin in range(0, len(self.lines), chunk_size):
+                    trained.train_lines(
+                        self.lines[begin:begin + chunk_size])
+            self.check(train)
+            self.check(train, lower=True)
+
+    def test_reset_context(self):
+        trained = model.Model(N)
+        trained.train_lines(self.lines[:250])
+        trained.reset_context()
+        trained.train_lines(self.lines[250:])
+        text_tokenizer = tokenizer.Tokenizer()
+        self.assertEqual(
+            model_counts(trained),
+            reference_counts(self.lines[:250], text_tokenizer)
+            + reference_counts(self.lines[250:], text_tokenizer))
+
+
+class PruneTest(unittest.TestCase):
+
+    def test_no_known_words(self):
+        trained = model.Model(N)
+        trained.train_lines(make_lines(5))
+        with self.assertRaises(ValueError):
+            trained.prune(min_word_count=50)
+        # model is not changed
+        self.assertEqual(model_counts(trained),
+                         reference_counts(make_lines(5),
+                                          tokenizer.Tokenizer()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import collections
+import io
+import unittest
+
+import numpy
+
+import kgramstore
+import model
+import modelstore
+
+N = 3
+
+
+class VarintTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        values = [0, 1, 127, 128, 255, 300, 16383, 16384, 2 ** 32 - 1,
+                  2 ** 32, 2 ** 63 - 1, 2 ** 64 - 1]
+        data = modelstore.encode_varints(values)
+        # 7 bits per byte
+        self.assertEqual(len(modelstore.encode_varints([127])), 1)
+        self.assertEqual(len(modelstore.encode_varints([128])), 2)
+        self.assertEqual(len(modelstore.encode_varints([2 ** 64 - 1])),
+                         modelstore.VARINT_BYTES)
+        self.assertEqual(modelstore.decode_varints(data).tolist(), values)
+
+    def test_random(self):
+        rng = numpy.random.default_rng(0)
+        values = rng.integers(0, 2 ** 62, 1000) >> rng.integers(0, 62, 1000)
+        decoded = modelstore.decode_varints(
+            modelstore.encode_varints(values))
+        self.assertEqual(decoded.tolist(), values.tolist())
+
+    def test_empty(self):
+        self.assertEqual(modelstore.encode_varints([]), b'')
+        self.assertEqual(len(modelstore.decode_varints(b'')), 0)
+
+
+class BlockTest(unittest.TestCase):
+
+    def round_trip(self, kgrams, counts):
+        kgrams = numpy.asarray(kgrams, dtype=kgramstore.CODE_TYPE)
+        data = modelstore.encode_block(kgrams, numpy.asarray(counts))
+        decoded, decoded_counts = modelstore.decode_block(
+            data, kgrams.shape[1], len(kgrams))
+        self.assertEqual(decoded.tolist(), kgrams.tolist())
+        self.assertEqual(decoded_counts.tolist(), list(counts))
+
+    def test_shared_prefixes(self):
+        # codes decrease after prefix changes, so they are not deltas
+        self.round_trip([(0, 5, 9), (0, 5, 10), (0, 6, 1), (3, 0, 0),
+                         (3, 0, 7), (70000, 2 ** 32 - 1, 0)],
+                        [1, 2, 3, 4, 2 ** 40, 1])
+
+    def test_single(self):
+        self.round_trip([(2 ** 32 - 1,)], [7])
+
+    def test_random(self):
+        rng = numpy.random.default_rng(1)
+        for k in range(1, 6):
+            kgrams, counts = kgramstore.count_kgrams(
+                rng.integers(0, 50, (3000, k)),
+                rng.integers(1, 1000, 3000))
+            self.round_trip(kgrams, counts.tolist())
+
+
+class LegacySegmentTest(unittest.TestCase):
+
+    def test_read_version_0(self):
+        # file of version 0: pickled base segment and update
+        file = io.BytesIO()
+        file.write(modelstore.MAGIC[:-1] + bytes([0]))
+        modelstore.write_segment(file, 0, ['мороз', 'и', 'солнце'], {
+            (0,): 2, (1,): 1, (2,): 1, (0, 1): 1, (1, 2): 1}, N, version=0)
+        modelstore.write_segment(file, 3, ['день'], {
+            (0,): 1, (3,): 1, (3, 0): 1}, N, version=0)
+
+        file.seek(0)
+        self.assertTrue(modelstore.is_segmented_model(file))
+        self.assertEqual(modelstore.read_header(file), 0)
+        segments = list(modelstore.read_segments(file, N, version=0))
+        self.assertEqual([(first, words) for first, words, _ in segments],
+                         [(0, ['мороз', 'и', 'солнце']), (3, ['день'])])
+
+        file.seek(0)
+        loaded = model.Model(N)
+        loaded.load(file)
+        self.assertEqual(loaded.stored_segments(), 2)
+        self.assertEqual(loaded._Model__lexicon.words(),
+                         ['мороз', 'и', 'солнце', 'день'])
+        # frequencies are summed over segments
+        self.assertEqual(dict(loaded._Model__k_grams.items()), {
+            (0,): 3, (1,): 1, (2,): 1, (3,): 1, (0, 1): 1, (1, 2): 1,
+            (3, 0): 1})
+
+    def test_update_keeps_version(self):
+        file = io.BytesIO()
+        file.write(modelstore.MAGIC[:-1] + bytes([0]))
+        modelstore.write_segment(file, 0, ['мороз'], {(0,): 1}, N,
+                                 version=0)
+        file.seek(0)
+        updated = model.Model(N)
+        updated.load(file, lexicon_only=True)
+        updated.train_lines(['мороз день'])
+        file.seek(0, io.SEEK_END)
+        updated.store_update(file)
+
+        file.seek(0)
+        self.assertEqual(modelstore.read_header(file), 0)
+        file.seek(0)
+        loaded = model.Model(N)
+        loaded.load(file)
+        words = loaded._Model__lexicon.words()
+        counts = collections.Counter({
+            tuple(words[code] for code in kgram): count
+            for kgram, count in loaded._Model__k_grams.items()})
+        self.assertEqual(counts, collections.Counter({
+            ('мороз',): 2, ('день',): 1, ('мороз', 'день'): 1}))
+
+
+class SegmentTest(unittest.TestCase):
+
+    def test_dict_and_store(self):
+        kgrams = {(0,): 3, (1,): 2, (0, 1): 2, (1, 0): 1}
+        for stored in (kgrams, kgramstore.from_items(kgrams, N)):
+            file = io.BytesIO()
+            modelstore.write_header(file)
+            modelstore.write_segment(file, 0, ['а', 'б'], stored, N)
+            for compact in (False, True, None):
+                file.seek(0)
+                version = modelstore.read_header(file)
+                (first, words, read), = modelstore.read_segments(
+                    file, N, version=version, compact=compact)
+                self.assertEqual((first, words), (0, ['а', 'б']))
+                self.assertEqual(dict(read.items()), kgrams)
+
+
+if __name__ == '__main__':
+    unittest.main()
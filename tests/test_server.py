@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+import unittest.mock
+import urllib.parse
+
+import config
+import model
+import server
+
+
+class ServerTest(unittest.TestCase):
+
+    def requests(self, freq_model: model.Model, targets: list) -> list:
+        """
+        Starts local server with 'freq_model' and sends requests
+        through one connection.
+
+        :return: list of (status, text) of responses
+        """
+        async def run():
+            local = await asyncio.start_server(
+                server.handle_connection, 'localhost', 0)
+            port = local.sockets[0].getsockname()[1]
+            responses = []
+            async with local:
+                reader, writer = await asyncio.open_connection(
+                    'localhost', port)
+                for target in targets:
+                    writer.write(b'GET %s HTTP/1.1\r\n\r\n' %
+                                 target.encode('latin-1'))
+                    await writer.drain()
+                    status = int((await reader.readline()).split()[1])
+                    length = 0
+                    while True:
+                        header = await reader.readline()
+                        if header == b'\r\n':
+                            break
+                        if header.lower().startswith(b'content-length:'):
+                            length = int(header.split(b':')[1])
+                    text = (await reader.readexactly(length)).decode('utf-8')
+                    responses.append((status, text))
+                writer.close()
+                await writer.wait_closed()
+            return responses
+        with unittest.mock.patch.object(
+                server, 'generator', freq_model.make_generator(),
+                create=True):
+            return asyncio.run(run())
+
+    def trained_model(self) -> model.Model:
+        freq_model = model.Model(config.N_GRAM_SIZE)
+        freq_model.train_lines(['Мороз и солнце. День чудесный!'] * 5)
+        return freq_model
+
+    def test_statuses(self):
+        responses = self.requests(self.trained_model(), [
+            '/generate?length=5&rng=1',
+            '/generate?length=5&rng=1&seed=' + urllib.parse.quote('мороз'),
+            '/generate?length=-1',
+            '/generate?length=many',
+            '/generate',
+            '/unknown?length=5'])
+        self.assertEqual([status for status, _ in responses],
+                         [200, 200, 400, 400, 400, 404])
+        self.assertTrue(responses[0][1])
+        # the same rng gives the same text
+        self.assertEqual(responses[:1], self.requests(
+            self.trained_model(), ['/generate?length=5&rng=1']))
+
+    def test_long_text_is_cut(self):
+        with unittest.mock.patch.object(server, 'MAX_LENGTH', 3):
+            (status, text), = self.requests(
+                self.trained_model(), ['/generate?length=1000&rng=1'])
+        self.assertEqual(status, 200)
+        self.assertLessEqual(len(text.split()), 3)
+
+    def test_generation_error(self):
+        # empty model cannot begin text
+        freq_model = model.Model(config.N_GRAM_SIZE)
+        responses = self.requests(freq_model, ['/generate?length=5',
+                                               '/generate?length=5'])
+        # error is reported and the connection is kept
+        self.assertEqual([status for status, _ in responses], [500, 500])
+        self.assertTrue(responses[0][1].startswith('Cannot generate text'))
+
+
+if __name__ == '__main__':
+    unittest.main()
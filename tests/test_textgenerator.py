@@ -0,0 +1,128 @@
+import unittest
+
+import numpy
+
+import config
+import lexicon
+import model
+import textgenerator
+import tokenizer
+from tests.test_model import make_lines
+
+
+class BeginningTest(unittest.TestCase):
+
+    def generate(self, words: list, kgrams: dict) -> str:
+        generator = textgenerator.TextGenerator(
+            kgrams, lexicon.Lexicon(words), 3)
+        return ''.join(generator.iter_text(
+            5, rng=numpy.random.default_rng(0)))
+
+    def test_only_unknown_kgrams(self):
+        # known word is not in k-grams, text begins with it
+        text = self.generate(['мороз', config.UNKNOWN_WORD],
+                             {(1,): 10, (1, 1): 9})
+        self.assertTrue(text.lower().startswith('мороз'))
+        self.assertNotIn(config.UNKNOWN_WORD, text)
+
+    def test_only_sentence_ends(self):
+        text = self.generate([config.SENTENCE_END, 'солнце'],
+                             {(0,): 10, (0, 0): 9})
+        self.assertTrue(text.lower().startswith('солнце'))
+
+    def test_no_known_words(self):
+        with self.assertRaises(ValueError):
+            self.generate([config.SENTENCE_END, config.UNKNOWN_WORD],
+                          {(0,): 10, (1,): 5, (0, 1): 4})
+
+
+class EagerTest(unittest.TestCase):
+
+    def generate(self, eager: bool) -> str:
+        # 'сюда' is followed only by unknown word (as after pruning
+        # with top_k), 'икс сюда' is followed by 'бег'
+        words = ['сюда', 'бег', 'икс', config.UNKNOWN_WORD]
+        kgrams = {(0,): 6, (1,): 3, (2,): 3, (3,): 3, (0, 3): 3,
+                  (2, 0): 3, (1, 2): 3, (2, 0, 1): 3, (1, 2, 0): 3}
+        generator = textgenerator.TextGenerator(
+            kgrams, lexicon.Lexicon(words), 3, eager=eager)
+        return ''.join(generator.iter_text(
+            30, 'икс сюда', rng=numpy.random.default_rng(0)))
+
+    def test_suffix_without_known_continuations(self):
+        text = self.generate(True)
+        self.assertEqual(text, self.generate(False))
+        self.assertIn('сюда бег', text)
+
+
+class GenerationContextTest(unittest.TestCase):
+
+    def test_sample_nothing(self):
+        expected = textgenerator.GenerationContext(
+            numpy.random.default_rng(0))
+        context = textgenerator.GenerationContext(
+            numpy.random.default_rng(0))
+        self.assertEqual(context.sample(3), expected.sample(3))
+        self.assertEqual(context.sample(0), [])
+        # drawn numbers are not thrown away
+        self.assertEqual(context.sample(5), expected.sample(5))
+        self.assertEqual(context.random(), expected.random())
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = model.Model(
+            config.N_GRAM_SIZE, text_tokenizer=tokenizer.Tokenizer(
+                lower=True, sentence_end=True))
+        self.model.train_lines(make_lines(2000))
+
+    def test_batch_of_one_is_single_text(self):
+        # sequence of batch is generated like single text from the
+        # same random numbers
+        generator = self.model.make_generator()
+        for length in (1, 5, 40, 300):
+            for seed in (None, 'мороз', 'неизвестное'):
+                with self.subTest(length=length, seed=seed):
+                    text, = generator.generate_batch(
+                        [seed], length, numpy.random.default_rng(3))
+                    self.assertEqual(text, ''.join(generator.iter_text(
+                        length, seed, numpy.random.default_rng(3))))
+
+    def test_split_batch(self):
+        seeds = ['мороз', None] * textgenerator.BATCH_SIZE + ['день']
+        chunks = textgenerator.split_batch(seeds, 7)
+        self.assertEqual([len(chunk) for chunk, _ in chunks],
+                         [textgenerator.BATCH_SIZE] * 2 + [1])
+        self.assertEqual(sum((chunk for chunk, _ in chunks), []), seeds)
+        # seeds of chunks are reproducible and differ
+        states = [numpy.random.default_rng(sequence).random()
+                  for _, sequence in chunks]
+        self.assertEqual(states, [
+            numpy.random.default_rng(sequence).random()
+            for _, sequence in textgenerator.split_batch(seeds, 7)])
+        self.assertEqual(len(set(states)), len(states))
+        self.assertEqual(textgenerator.split_batch([], 7), [])
+
+    def test_model_batch(self):
+        seeds = ['мороз', None, 'день', 'ты'] * 100
+        texts = list(self.model.generate_batch(seeds, 60, random_seed=5))
+        self.assertEqual(len(texts), len(seeds))
+        self.assertEqual(texts, list(self.model.generate_batch(
+            seeds, 60, random_seed=5)))
+        self.assertEqual(texts, list(self.model.generate_batch(
+            seeds, 60, random_seed=5, eager=True)))
+        self.assertNotEqual(texts, list(self.model.generate_batch(
+            seeds, 60, random_seed=6)))
+        # chunks generated separately and in any order (as by worker
+        # processes of generate.py --jobs) give the same texts
+        generator = self.model.make_generator()
+        chunks = textgenerator.split_batch(seeds, 5)
+        generated = [generator.generate_batch(
+            chunk, 60, numpy.random.default_rng(sequence))
+            for chunk, sequence in reversed(chunks)]
+        self.assertEqual(texts, sum(reversed(generated), []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+import config
+import model
+import tokenizer
+import train
+from tests.test_model import make_lines, model_counts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class JobsTest(unittest.TestCase):
+    """train.py --jobs gives the same model as serial training"""
+
+    def setUp(self):
+        # train.py writes its log into working directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def train(self, jobs: int, *arguments, stdin=None) -> model.Model:
+        path = self.path('model-%d.pkl' % jobs)
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'train.py'),
+             '--model', path, '--jobs', str(jobs)] + list(arguments),
+            stdin=stdin, cwd=self.directory.name, check=True,
+            stdout=subprocess.DEVNULL)
+        trained = model.Model(config.N_GRAM_SIZE)
+        with open(path, 'rb') as file:
+            trained.load(file)
+        return trained
+
+    def assertSameModels(self, serial: model.Model, parallel: model.Model):
+        self.assertEqual(parallel._Model__lexicon.words(),
+                         serial._Model__lexicon.words())
+        self.assertEqual(model_counts(parallel), model_counts(serial))
+
+    def test_input_dir(self):
+        input_dir = self.path('input')
+        os.mkdir(input_dir)
+        for i in range(5):
+            with open(os.path.join(input_dir, '%d.txt' % i), 'w') as file:
+                file.write('\n'.join(make_lines(300, seed=i)) + '\n')
+        serial = self.train(1, '--input-dir', input_dir)
+        for jobs in (2, 3):
+            with self.subTest(jobs=jobs):
+                self.assertSameModels(
+                    serial, self.train(jobs, '--input-dir', input_dir))
+
+    def test_stdin(self):
+        # several tasks of config.TASK_CHUNKS chunks
+        lines = make_lines(
+            config.CHUNK_SIZE * config.TASK_CHUNKS * 2 + 1234)
+        with open(self.path('input.txt'), 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        with open(self.path('input.txt')) as file:
+            serial = self.train(1, stdin=file)
+        for jobs in (2, 3):
+            with self.subTest(jobs=jobs), \
+                    open(self.path('input.txt')) as file:
+                self.assertSameModels(serial, self.train(jobs, stdin=file))
+
+
+class StdinPipelineTest(unittest.TestCase):
+    """Pipeline of train.py --jobs on stdin, run in this process"""
+
+    def scan(self, lines: list, jobs: int,
+             text_tokenizer: tokenizer.Tokenizer) -> model.Model:
+        stdin = io.TextIOWrapper(
+            io.BytesIO(('\n'.join(lines) + '\n').encode('utf-8')),
+            encoding='utf-8')
+        trained = model.Model(config.N_GRAM_SIZE,
+                              text_tokenizer=text_tokenizer)
+        with unittest.mock.patch.object(sys, 'stdin', stdin), \
+                unittest.mock.patch.multiple(
+                    train, create=True, freq_model=trained,
+                    text_tokenizer=text_tokenizer):
+            train.scan_stdin_parallel(jobs)
+        return trained
+
+    def test_boundaries_inside_sentences(self):
+        # sentences span two lines, chunks of odd numbers of lines
+        # and tasks end inside them
+        lines = ['Мороз и солнце', 'день чудесный.',
+                 'Ещё ты дремлешь, друг', 'прелестный!'] * 40 \
+            + make_lines(300)
+        text_tokenizer = tokenizer.Tokenizer(lower=True, sentence_end=True)
+        serial = model.Model(config.N_GRAM_SIZE,
+                             text_tokenizer=text_tokenizer)
+        serial.train_lines(lines)
+        for chunk_size, task_chunks in ((3, 1), (5, 3), (7, 2)):
+            for jobs in (2, 3):
+                with self.subTest(chunk_size=chunk_size,
+                                  task_chunks=task_chunks, jobs=jobs), \
+                        unittest.mock.patch.multiple(
+                            config, CHUNK_SIZE=chunk_size,
+                            TASK_CHUNKS=task_chunks):
+                    parallel = self.scan(lines, jobs, text_tokenizer)
+                    self.assertEqual(parallel._Model__lexicon.words(),
+                                     serial._Model__lexicon.words())
+                    self.assertEqual(model_counts(parallel),
+                                     model_counts(serial))
+
+
+class UpdateTest(unittest.TestCase):
+    """train.py --update appends segments and compacts the file"""
+
+    def update(self, path: str, lines: list) -> model.Model:
+        """Trains on 'lines' like train.py --update and stores model"""
+        trained = model.Model(config.N_GRAM_SIZE)
+        with unittest.mock.patch.multiple(
+                train, create=True, freq_model=trained, memory_limit=None):
+            train.load_model(path)
+            trained.train_lines(lines)
+            train.store_model(path)
+        return trained
+
+    def load(self, path: str) -> model.Model:
+        loaded = model.Model(config.N_GRAM_SIZE)
+        with open(path, 'rb') as file:
+            loaded.load(file)
+        return loaded
+
+    def test_compaction(self):
+        documents = [make_lines(30, seed=i) for i in range(15)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.pkl')
+            segments = []
+            for lines in documents:
+                self.update(path, lines)
+                segments.append(self.load(path).stored_segments())
+            loaded = self.load(path)
+        # file is rewritten as one segment, when it has MAX_SEGMENTS
+        self.assertEqual(segments, [1, 2, 3, 4, 5, 6, 7, 8, 1, 2, 3, 4, 5,
+                                    6, 7])
+        # each update is a separate document
+        separate = model.Model(config.N_GRAM_SIZE)
+        for lines in documents:
+            separate.train_lines(lines)
+            separate.reset_context()
+        self.assertEqual(model_counts(loaded), model_counts(separate))
+        # continuous training counts also k-grams, which span
+        # boundaries of documents: k - 1 of each length k > 1
+        # (10 per boundary for 5-grams)
+        continuous = model.Model(config.N_GRAM_SIZE)
+        continuous.train_lines(sum(documents, []))
+        difference = model_counts(continuous)
+        difference.subtract(model_counts(loaded))
+        self.assertEqual(min(difference.values()), 0)
+        spanning = sum(k - 1 for k in range(2, config.N_GRAM_SIZE + 1))
+        self.assertEqual(sum(difference.values()),
+                         spanning * (len(documents) - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import http.server
+import threading
+import unittest
+import unittest.mock
+
+import webparser
+
+PAGE = '''<html><head><meta charset="utf-8">
+<title>Заголовок</title>
+<style>p { color: red; }</style>
+<script>var текст = "скрипт";</script>
+</head><body>
+<div>Первый блок
+  <p>Абзац с <strong>жирным <em>курсивом</em></strong> текстом</p>
+  хвост блока
+</div>
+<h6>Маленький заголовок</h6>
+<q>Цитата</q>
+<p>Ссылка <a href="/second">дальше</a>
+<script>document.write("нет")</script><noscript>нет</noscript></p>
+</body></html>'''
+
+BLOCKS = [
+    'Первый блок', 'Абзац с жирным курсивом текстом', 'хвост блока',
+    'Маленький заголовок', 'Цитата', 'Ссылка дальше'
+]
+
+
+def words(blocks: list) -> list:
+    return [' '.join(block.split()) for block in blocks]
+
+
+class ExtractTextTest(unittest.TestCase):
+
+    def backends(self):
+        """Runs the body with lxml (if installed) and StandardParser"""
+        if webparser.lxml is not None:
+            yield 'lxml'
+        with unittest.mock.patch.object(webparser, 'lxml', None):
+            yield 'standard'
+
+    def test_blocks(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                links = []
+                blocks = words(webparser.extract_text(PAGE, links))
+                self.assertEqual(blocks, BLOCKS)
+                self.assertEqual(links, ['/second'])
+
+    def test_no_duplicates(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                text = ' '.join(webparser.extract_text(PAGE))
+                for word in ('Абзац', 'жирным', 'курсивом', 'Цитата'):
+                    self.assertEqual(text.count(word), 1)
+                for hidden in ('color', 'скрипт', 'нет'):
+                    self.assertNotIn(hidden, text)
+
+    def test_pieces(self):
+        # page is fed to parser by pieces, blocks span them
+        for backend in self.backends():
+            with self.subTest(backend=backend), unittest.mock.patch.object(
+                    webparser, 'FEED_SIZE', 7):
+                self.assertEqual(words(webparser.extract_text(PAGE)),
+                                 BLOCKS)
+
+    def test_bytes(self):
+        for encoding in ('utf-8', 'cp1251'):
+            page = PAGE.replace('utf-8', encoding).encode(encoding)
+            for backend in self.backends():
+                with self.subTest(backend=backend, encoding=encoding):
+                    self.assertEqual(words(webparser.extract_text(
+                        page, encoding=encoding)), BLOCKS)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        # no charset in header, it is only in <meta>
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_web_parser(self):
+        stream = webparser.WebParser(self.url).parser_content_stream()
+        self.assertEqual(words(stream), BLOCKS)
+
+    def test_crawler(self):
+        crawler = webparser.Crawler([self.url], depth=1)
+        pages = list(crawler.crawl())
+        self.assertEqual(len(pages), 2)
+        for texts in pages:
+            self.assertEqual(words(texts), BLOCKS)
+
+    def test_page_encoding(self):
+        response = unittest.mock.Mock(
+            headers={'Content-Type': 'text/html; charset=windows-1251'},
+            content=PAGE.encode('utf-8'), apparent_encoding='ascii')
+        self.assertEqual(webparser.page_encoding(response), 'cp1251')
+        response.headers = {'Content-Type': 'text/html'}
+        self.assertEqual(webparser.page_encoding(response), 'utf-8')
+        response.content = b'<p>text</p>'
+        self.assertEqual(webparser.page_encoding(response), 'ascii')
+
+
+if __name__ == '__main__':
+    unittest.main()
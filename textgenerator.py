@@ -1,35 +1,162 @@
+import bisect
+import collections
+import itertools
 import os
-import random
 import sys
+import threading
 
 import numpy
 
+import config
 import debugging
-
-
-def reverse_dict(table: dict) -> dict:
-    return dict(zip(table.values(), table.keys()))
+import kgramstore
+import modelfile
+
+# size of chunks (in characters), in which generated text is written
+CHUNK_SIZE = 1 << 16
+# number of random numbers, which are drawn from generator at once
+RANDOM_BLOCK = 1 << 10
+# number of generated words, which are decoded at once
+DECODE_BLOCK = 1 << 6
+# number of contexts, which sampling tables are kept by lazy generator
+CACHE_SIZE = 1 << 16
+# number of sequences, which are generated in lockstep (see split_batch)
+BATCH_SIZE = 1 << 8
+# number of random k-grams, which are drawn to begin text, before
+# text begins with random known word (see __make_beginning)
+BEGINNING_DRAWS = 1 << 8
+
+
+def split_batch(seeds: list, random_seed: int = None) -> list:
+    """
+    Splits batch of seeds into chunks of BATCH_SIZE, each chunk gets
+    its own seed of random numbers, spawned from 'random_seed', so
+    texts do not depend on how chunks are shared among processes.
+
+    :param seeds: list of words (None - random beginning)
+    :param random_seed: seed of random numbers of the whole batch
+    :return: list of (seeds, numpy.random.SeedSequence)
+    """
+    chunks = [seeds[begin:begin + BATCH_SIZE]
+              for begin in range(0, len(seeds), BATCH_SIZE)]
+    return list(zip(chunks, numpy.random.SeedSequence(
+        random_seed).spawn(len(chunks))))
+
+
+class GenerationContext:
+    """
+    State of one generation call: random numbers generator.
+
+    Uniform numbers are drawn from numpy generator by blocks, so
+    each random choice costs one list pop.
+    """
+
+    def __init__(self, rng: numpy.random.Generator):
+        self.__rng = rng
+        # drawn numbers, which are not used yet
+        self.__numbers = []
+
+    def random(self) -> float:
+        """Gives next uniformly distributed number in [0, 1)"""
+        if not self.__numbers:
+            self.__numbers = self.__rng.random(RANDOM_BLOCK).tolist()
+        return self.__numbers.pop()
+
+    def sample(self, count: int) -> list:
+        """Gives 'count' uniformly distributed numbers in [0, 1)"""
+        if not count:
+            # slice [-0:] would take all drawn numbers
+            return []
+        if len(self.__numbers) < count:
+            self.__numbers += self.__rng.random(
+                max(count, RANDOM_BLOCK)).tolist()
+        numbers = self.__numbers[-count:]
+        del self.__numbers[-count:]
+        return numbers
+
+
+class TableCache:
+    """
+    LRU cache of sampling tables of contexts, shared by threads.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        # maximal number of tables, None - unlimited
+        self.__size = size
+        self.__tables = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, context: tuple, default=None):
+        with self.__lock:
+            table = self.__tables.get(context, default)
+            if table is not default:
+                self.__tables.move_to_end(context)
+            return table
+
+    def put(self, context: tuple, table):
+        if self.__size == 0:
+            return
+        with self.__lock:
+            self.__tables[context] = table
+            if self.__size is not None and len(self.__tables) > self.__size:
+                self.__tables.popitem(last=False)
 
 
 class TextGenerator:
-
-    def __init__(self, kgrams, code_table, max_gram):
-        # stores kgrams with frequencies
+    """
+    Generator of texts from k-gram frequencies.
+
+    By default sampling table of context is built, when the context
+    is met first time, and kept in LRU cache of 'cache_size' contexts,
+    so generation starts without processing of the whole model. Eager
+    generator builds tables of all contexts at once, which pays off
+    for long texts. Tables of binary model (see modelfile) are stored
+    in it and are cached the same way.
+    """
+
+    def __init__(self, kgrams, code_table, max_gram,
+                 cache_size: int = CACHE_SIZE, eager: bool = False):
+        # stores kgrams with frequencies, dict is packed into sorted
+        # arrays, where continuations of context are found by bisection
+        # (loaded models are packed already, see Model.load)
+        if not isinstance(kgrams, (modelfile.MappedModel,
+                                   kgramstore.KGramStore)):
+            kgrams = kgramstore.from_items(kgrams, max_gram)
         self.__frequency_model = kgrams
         # dict: word -> code (int)
         self.__code_table = code_table
         # length of n-gram
         self.__max_gram = max_gram
-        # probabilities model
-        self.__model = {}
         debugging.text_gen_logger.info("Model loaded.")
-        # count probabilities for all k-grams
-        self.__preprocess()
-        debugging.text_gen_logger.info("Model's frequency computed.")
-        # length of generated sequence
-        self.__sequence_length = 0
-
-    def generate_text(self, length: int, output: str, seed: str):
+        # code of token of sentence end (see tokenizer), it is
+        # generated as full-stop
+        self.__sentence_end = code_table.get(config.SENTENCE_END)
+        # code of word, which replaces pruned words, it is never
+        # generated (see Model.prune)
+        self.__unknown = code_table.get(config.UNKNOWN_WORD)
+        # probabilities model of eager generator (only): trie of
+        # reversed contexts, node is dict: code of word -> (child node,
+        # sampling table of context of the child)
+        self.__trie = None
+        # sampling tables of lazy generator
+        self.__cache = TableCache(cache_size)
+        if isinstance(kgrams, modelfile.MappedModel):
+            # stored model already has sampling tables and decoding table
+            self.__build_tables = kgrams.get_many
+            self.__decode_table = kgrams.words
+        else:
+            self.__build_tables = self.__make_variants
+            # lexicon decodes codes into words
+            self.__decode_table = code_table
+            if eager:
+                self.__trie = {}
+                # count probabilities for all k-grams
+                with debugging.phase('preprocess'):
+                    self.__preprocess()
+                debugging.text_gen_logger.info(
+                    "Model's frequency computed.")
+
+    def generate_text(self, length: int, output: str, seed: str, rng=None):
 
         """
         Public method
@@ -42,6 +169,7 @@ class TextGenerator:
             will be outputed
         :param length: length of generated sequence
         :param seed: word, from which sequence will be started
+        :param rng: numpy.random.Generator (see iter_text)
         :return: None
 
         THIS FUNCTION IS USED IN MODEL.PY (generate_text([...]))
@@ -55,13 +183,8 @@ class TextGenerator:
             :param output_stream:
             :return:
             """
-            if seed not in self.__code_table.keys():
-                debugging.text_gen_logger.warning("""
-                '%s' is unknown word, generation will start with random seed!
-                """ % seed)
-            text = self.__sentence_maker(length, seed=seed)
-            for sentence in text:
-                output_stream.write(sentence + '\n')
+            for chunk in self.iter_text(length, seed, rng):
+                output_stream.write(chunk)
 
         if output is not None:
             debugging.text_gen_logger.info("""
@@ -88,155 +211,506 @@ class TextGenerator:
         debugging.text_gen_logger.info(
             'Text generation ended successfully.')
 
-    def __update_model(self, kgram: tuple, frequency: float):
+    def iter_text(self, length: int, seed: str = None, rng=None):
         """
-        Private method
+        Public method
 
-        :param kgram:
-        :param frequency:
-        :return: None
+        Iterator over generated text: words are decoded as they are
+        sampled and yielded in chunks of about CHUNK_SIZE characters,
+        so memory does not depend on length of the text.
+        Sentences are separated with line breaks.
+
+        All state of generation is local to the call (see
+        GenerationContext), so one TextGenerator may be shared by many
+        threads, and text is reproducible from seed of 'rng'.
+
+        :param length: length of generated sequence
+        :param seed: word, from which sequence will be started
+        :param rng: numpy.random.Generator, e.g.
+            numpy.random.default_rng(42) (new unseeded one by default)
+        :return: generator of str
+
+        THIS FUNCTION IS USED IN MODEL.PY (iter_text([...]))
         """
-        sub_gram = kgram[:-1]
-        if not sub_gram:
-            return
-        if sub_gram in self.__model:
-            self.__model[sub_gram].append(
-                (kgram[-1], frequency / self.__frequency_model[sub_gram]))
-        else:
-            self.__model[sub_gram] = [
-                (kgram[-1], frequency / self.__frequency_model[sub_gram])]
+        if seed is not None and seed not in self.__code_table:
+            debugging.text_gen_logger.warning("""
+            '%s' is unknown word, generation will start with random seed!
+            """ % seed)
+        chunk, chunk_size = [], 0
+        if rng is None:
+            rng = numpy.random.default_rng()
+        context = GenerationContext(rng)
+        for piece in self.__sentence_maker(length, seed=seed,
+                                           context=context):
+            chunk.append(piece)
+            chunk_size += len(piece)
+            if chunk_size >= CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk, chunk_size = [], 0
+        if chunk:
+            yield ''.join(chunk)
+
+    def generate_batch(self, seeds: list, length: int, rng=None) -> list:
+        """
+        Public method
+
+        Generates independent sequence for each seed. Sequences are
+        advanced in lockstep, one word per step: sequences with the
+        same context share one lookup of its continuations and random
+        numbers of the step are drawn at once. Each sequence is made
+        of sentences like in 'iter_text'.
+
+        :param seeds: list of words, from which sequences will be
+            started (None - random beginning)
+        :param length: length of each sequence
+        :param rng: numpy.random.Generator (new unseeded one by default)
+        :return: list of str, texts in order of seeds
+
+        THIS FUNCTION IS USED IN MODEL.PY (generate_batch([...]))
+        """
+        if rng is None:
+            rng = numpy.random.default_rng()
+        context = GenerationContext(rng)
+        # codes of current sentence, its length in characters, length
+        # of finished sentences and their texts for each sequence
+        sentences = [[] for _ in seeds]
+        sentence_lens = [0] * len(seeds)
+        totals = [0] * len(seeds)
+        pieces = [[] for _ in seeds]
+
+        def measure(i, codes):
+            """Count length of words appended to sentence of 'i'"""
+            for code in codes:
+                # -1 is code of full-stop symbol
+                size = self.__decode_table.length(code) if code != -1 else 1
+                # words are separated with space
+                sentence_lens[i] += size + 1 if sentence_lens[i] else size
+
+        def settle(i):
+            """End sentence of 'i', if it cannot grow, check if 'i' grows"""
+            sentence = sentences[i]
+            if (not sentence or sentence[-1] != -1) and \
+                    sentence_lens[i] + totals[i] < length:
+                return True
+            stop = bool(sentence) and sentence[-1] == -1
+            codes = sentence[:-1] if stop else sentence
+            piece = self.__decode_table.decode(codes).capitalize() \
+                if codes else ''
+            debugging.count('tokens', len(codes))
+            if stop:
+                piece += ' .' if codes else '.'
+            else:
+                # add full-stop to the end
+                sentence_lens[i] += 1
+                piece += '.'
+            pieces[i].append(piece + '\n')
+            totals[i] += sentence_lens[i]
+            sentences[i], sentence_lens[i] = [], 0
+            return totals[i] < length
+
+        for i, seed in enumerate(seeds):
+            if seed is not None and seed in self.__code_table \
+                    and seed not in (config.UNKNOWN_WORD,
+                                     config.SENTENCE_END):
+                sentences[i].append(self.__code_table[seed])
+                measure(i, sentences[i])
+            elif seed is not None:
+                debugging.text_gen_logger.warning(
+                    "'%s' is unknown word, random seed is used." % seed)
+        active = [i for i in range(len(seeds)) if length > 0 and settle(i)]
+        while active:
+            for i in active:
+                if not sentences[i]:
+                    # sentence starts with random k-gram
+                    self.__make_beginning(sentences[i], context)
+                    measure(i, sentences[i])
+            codes = self.__choose_batch(
+                [sentences[i] for i in active], context)
+            for i, code in zip(active, codes):
+                sentences[i].append(code)
+                measure(i, (code,))
+            active = [i for i in active if settle(i)]
+        debugging.count('texts', len(seeds))
+        return [''.join(text) for text in pieces]
 
     def __preprocess(self):
         """
         Private method
 
-        Compute probabilities for all continuations of each kgram
+        Builds sampling table for all continuations of each kgram:
+        tuple of words and list of their cumulative frequencies, so
+        choice of continuation is one random draw and one bisection.
+        Continuations of context are neighbours in sorted k-grams,
+        so tables are cut from block of k-grams at once.
+
+        Tables are put into trie of reversed contexts: path from the
+        root goes through the last word of context, then through the
+        previous one and so on. Suffixes of context are contexts too,
+        and shorter contexts are added first, so parent of each node
+        is usually in the trie. It is not, if the suffix has only
+        unknown continuations (they may outnumber known ones, when
+        model is pruned with 'top_k'), then it is added without table.
 
         :return: None
         """
-        for kgram, frequency in self.__frequency_model.items():
-            self.__update_model(kgram, frequency)
+        for k in range(2, self.__max_gram + 1):
+            for keys, frequencies in self.__frequency_model.blocks(k):
+                codes = kgramstore.unpack(keys, k)
+                if self.__unknown is not None:
+                    known = (codes != self.__unknown).all(axis=1)
+                    codes, frequencies = codes[known], frequencies[known]
+                contexts = codes[:, :-1]
+                first = numpy.ones(len(codes), dtype=bool)
+                first[1:] = (contexts[1:] != contexts[:-1]).any(axis=1)
+                starts = numpy.flatnonzero(first)
+                cumulative = numpy.cumsum(frequencies)
+                # make cumulative frequencies start over in every context
+                cumulative -= numpy.repeat(
+                    cumulative[starts] - frequencies[starts],
+                    numpy.diff(numpy.append(starts, len(codes))))
+                words = codes[:, -1].tolist()
+                cumulative = cumulative.tolist()
+                ends = starts[1:].tolist() + [len(codes)]
+                debugging.count('tables_built', len(ends))
+                for context, begin, end in zip(contexts[starts].tolist(),
+                                               starts.tolist(), ends):
+                    parent = self.__trie
+                    for code in context[:0:-1]:
+                        parent = parent.setdefault(code, ({}, None))[0]
+                    # the longest contexts have no children, walk stops
+                    # at them
+                    parent[context[0]] = (
+                        {} if k < self.__max_gram else None,
+                        (tuple(words[begin:end]), cumulative[begin:end]))
+
+    def __find_table(self, buffer: list):
+        """
+        Private method
+
+        Finds the longest context at the end of 'buffer' (not longer
+        than n-gram without one word), which has continuations.
 
-    def __sentence_maker(self, length: int, **kwargs) -> str:
+        Eager generator walks down the trie word by word from the end
+        of buffer, until the next word leaves the trie, so no tuple
+        is made per window. The walk starts over for every word (the
+        trie goes from the last word of context back, so the path of
+        the previous word is not reused) and takes at most n - 1
+        lookups, the same number as lookups of windows. The trie only
+        stores tables of eager generator, generation is about as fast
+        as with dict of contexts.
+
+        Lazy and binary generators look windows up in cache from the
+        longest one: most of their time goes to building of tables,
+        which trie would not save, while nodes of trie cost
+        allocations.
+
+        :param buffer: buffer of generated sequence (sequence of codes)
+        :return: sampling table of the context, None if no context
+            has continuations
+        """
+        if self.__trie is not None:
+            node, table = self.__trie, None
+            for code in buffer[:-self.__max_gram:-1]:
+                entry = node.get(code)
+                if entry is None:
+                    break
+                node, found = entry
+                if found is not None:
+                    table = found
+            return table
+        for window in range(min(self.__max_gram - 1, len(buffer)), 0, -1):
+            table = self.__variants(tuple(buffer[len(buffer) - window:]))
+            if table is not None:
+                return table
+        return None
+
+    def __variants(self, context: tuple):
         """
         Private method
 
-        This is generator, which yields sentences to the generated text.
-        Generally, generated text is only one sentence, but if training
-        data is not big enough, there may be situations, when no word
-        to append. So generator yields current sequence and starts new
+        :param context: tuple of codes
+        :return: sampling table of 'context' (see '__preprocess'),
+            None if context has no continuations
+        """
+        table = self.__cache.get(context, self.__cache)
+        if table is self.__cache:
+            table = self.__build_tables([context])[0]
+            self.__cache.put(context, table)
+            debugging.count('tables_built')
+        return table
+
+    def __variants_many(self, contexts: list) -> list:
+        """
+        Private method
+
+        Gives sampling tables of 'contexts' like '__variants', tables,
+        which are not cached, are built for all contexts of the same
+        length at once.
+
+        :param contexts: list of tuples of codes
+        :return: list of tables or None
+        """
+        tables = [self.__cache.get(context, self.__cache)
+                  for context in contexts]
+        missing = collections.defaultdict(list)
+        for i, table in enumerate(tables):
+            if table is self.__cache:
+                missing[len(contexts[i])].append(i)
+        for indices in missing.values():
+            built = self.__build_tables([contexts[i] for i in indices])
+            for i, table in zip(indices, built):
+                tables[i] = table
+                self.__cache.put(contexts[i], table)
+            debugging.count('tables_built', len(indices))
+        return tables
+
+    def __make_variants(self, contexts: list) -> list:
+        """
+        Private method
+
+        Builds sampling tables of 'contexts' from their continuations
+        in the model, like '__preprocess' does for all contexts at once.
+
+        :param contexts: list of tuples of codes of the same length
+        :return: list of tuples of words and lists of their cumulative
+            frequencies, None for context without continuations
+        """
+        words, frequencies, offsets = \
+            self.__frequency_model.continuations(contexts)
+        if self.__unknown is not None:
+            known = words != self.__unknown
+            offsets = numpy.append(0, numpy.cumsum(known))[offsets]
+            words, frequencies = words[known], frequencies[known]
+        words, frequencies = words.tolist(), frequencies.tolist()
+        offsets = offsets.tolist()
+        return [(tuple(words[begin:end]),
+                 list(itertools.accumulate(frequencies[begin:end])))
+                if begin < end and self.__unknown not in context else None
+                for context, begin, end in zip(
+                    contexts, offsets[:-1], offsets[1:])]
+
+    def __sentence_maker(self, length: int, **kwargs):
+        """
+        Private method
+
+        This is generator, which yields the generated text by pieces:
+        blocks of words (with separating spaces), which are decoded at
+        once, full-stops and line breaks after sentences. Generally,
+        generated text is only one sentence, but if training data is
+        not big enough, there may be situations, when no word to
+        append. So generator ends current sentence and starts new
         randomly chosen word.
 
+        Only last words, needed to choose continuation, are kept.
+
         :param length:
         :param kwargs:
         :return:
         """
         seed = kwargs.get('seed')
-        self.__sequence_length, buffer = 0, []
-
-        if seed is not None:
-            seed = self.__code_table[seed]
-            buffer.append(seed)
-
-        # swap keys and values in code_table to decode
-        # words, when sequence was generated
-        self.__code_table = reverse_dict(self.__code_table)
-        # extend our code_table with full-stop symbol
-        self.__code_table[-1] = '.'
-
-        def buffer_to_str():
-            """Nested function to decode sequence to sentence"""
-            nonlocal buffer
-            sequence = list(map(lambda word: self.__code_table[word], buffer))
-            return " ".join(sequence).capitalize()
+        context = kwargs.get('context')
+        # length of generated sequence
+        sequence_length, buffer = 0, []
+
+        if seed is not None and seed in self.__code_table \
+                and seed not in (config.UNKNOWN_WORD, config.SENTENCE_END):
+            buffer.append(self.__code_table[seed])
+
+        # number of codes in buffer, which lengths are counted and
+        # which are decoded, length of current sentence, if words of
+        # current sentence were yielded
+        measured, decoded, sentence_len, started = 0, 0, 0, False
+
+        def measure_buffer():
+            """Count lengths of words appended to buffer since last call"""
+            nonlocal measured, sentence_len
+            for code in buffer[measured:]:
+                # -1 is code of full-stop symbol
+                size = self.__decode_table.length(code) if code != -1 else 1
+                # words are separated with space
+                sentence_len += size + 1 if sentence_len else size
+            measured = len(buffer)
+
+        def decode_buffer():
+            """Decode words appended to buffer since last call at once"""
+            nonlocal measured, decoded, started
+            codes, stop = buffer[decoded:], buffer[-1] == -1
+            if stop:
+                codes = codes[:-1]
+            piece = ''
+            if codes:
+                text = self.__decode_table.decode(codes)
+                piece = ' ' + text.lower() if started else text.capitalize()
+                started = True
+                debugging.count('tokens', len(codes))
+            if stop:
+                piece += ' .' if started else '.'
+            decoded = len(buffer)
+            if decoded > 2 * self.__max_gram:
+                # forget words, which are not needed for continuation
+                del buffer[:-self.__max_gram]
+                decoded = measured = len(buffer)
+            return piece
 
         def check_buffer():
             """Check buffer to stop adding new words into buffer"""
-            nonlocal buffer
-            sentence_len = len(buffer_to_str())
             # check if length of generated
             # sentence is bigger than required length
-            check_len = sentence_len + self.__sequence_length < length
+            check_len = sentence_len + sequence_length < length
             if (not buffer or buffer[-1] != -1) and check_len:
                 return True
             else:
                 return False
 
-        while self.__sequence_length < length:
+        while sequence_length < length:
+            measure_buffer()
             while check_buffer():
                 # add words while it's possible
-                self.__add_word(buffer)
-            sentence = list(map(lambda word: self.__code_table[word], buffer))
-            sentence = " ".join(sentence).capitalize()
-            if sentence[-1] != '.':
+                self.__add_word(buffer, context)
+                measure_buffer()
+                if len(buffer) - decoded >= DECODE_BLOCK:
+                    yield decode_buffer()
+            yield decode_buffer()
+            if buffer[-1] != -1:
                 # add full-stop to the end
-                sentence += '.'
-            yield sentence
+                sentence_len += 1
+                yield '.'
+            yield '\n'
             # update length of generated
-            self.__sequence_length += len(sentence)
-            buffer = []
+            sequence_length += sentence_len
+            buffer, measured, decoded = [], 0, 0
+            sentence_len, started = 0, False
 
-    def __add_word(self, buffer: list):
+    def __add_word(self, buffer: list, context: GenerationContext):
         """
         Private method
 
         Append word(s) to the sentence, according to the current
-        lass k-gram. Firstly, check with bigger on, then with
-        smaller ones. If continuation was not found - end sentence.
+        last k-gram: the longest one, which has continuations (see
+        '__find_table'). If continuation was not found - end sentence.
 
         :param buffer:
+        :param context: state of generation call
         :return:
         """
         if not buffer:
             # if seed is undefined or generating new sentence
-            self.__make_beginning(buffer)
-        # compute size of window
-        kgramsize = min(self.__max_gram, len(buffer))
-        for k in range(0, kgramsize):
-            beginfrom = len(buffer) - kgramsize + k
-            # choose randomly candidate for continuation
-            candidate = self.__make_choice(buffer[beginfrom:])
-            if candidate != -1:
-                # Continuation was found, append it and stop search
-                buffer.append(candidate)
-                return
-        buffer.append(-1)
+            self.__make_beginning(buffer, context)
+        # choose randomly candidate for continuation of the longest
+        # known context
+        candidate = self.__make_choice(self.__find_table(buffer), context)
+        if candidate == self.__sentence_end:
+            candidate = -1
+        buffer.append(candidate)
+
+    def __choose_batch(self, sentences: list, context: GenerationContext):
+        """
+        Private method
+
+        Chooses next word of each sentence like '__add_word' does,
+        numbers are drawn for sentences in their order.
+
+        :param sentences: list of sentences (lists of codes)
+        :param context: state of generation call
+        :return: list of codes of chosen words, -1 (full-stop) for
+            sentences, which have no continuation
+        """
+        if self.__trie is not None:
+            tables = [self.__find_table(sentence) for sentence in sentences]
+        else:
+            tables = self.__find_tables(sentences)
+        chosen = [-1] * len(sentences)
+        found = [j for j, variants in enumerate(tables)
+                 if variants is not None]
+        for j, number in zip(found, context.sample(len(found))):
+            words, cumulative = tables[j]
+            candidate = words[bisect.bisect_right(
+                cumulative, number * cumulative[-1])]
+            if candidate != self.__sentence_end:
+                chosen[j] = candidate
+        return chosen
+
+    def __find_tables(self, sentences: list):
+        """
+        Private method
+
+        Finds tables like '__find_table' does for lazy generator:
+        sentences are grouped by context, so continuations of context
+        are looked up once, and backed off to shorter contexts together.
 
-    def __make_beginning(self, buffer: list):
+        :param sentences: list of sentences (lists of codes)
+        :return: list of tables, None for sentences, which have no
+            continuation
+        """
+        tables = [None] * len(sentences)
+        windows = [min(self.__max_gram - 1, len(sentence))
+                   for sentence in sentences]
+        pending = range(len(sentences))
+        while pending:
+            groups = collections.defaultdict(list)
+            for j in pending:
+                sentence = sentences[j]
+                groups[tuple(sentence[len(sentence) - windows[j]:])].append(j)
+            pending = []
+            for members, variants in zip(
+                    groups.values(), self.__variants_many(list(groups))):
+                if variants is not None:
+                    for j in members:
+                        tables[j] = variants
+                    continue
+                # back off to shorter context
+                for j in members:
+                    windows[j] -= 1
+                    if windows[j]:
+                        pending.append(j)
+        return tables
+
+    def __make_beginning(self, buffer: list, context: GenerationContext):
         """
         Private method
 
-        Append several random words if seed is not defined
+        Append several random words if seed is not defined:
+        k-gram of the model, all k-grams are equiprobable. If drawn
+        k-grams have only pruned words and sentence ends, text begins
+        with random known word.
 
         :param buffer: buffer of generated sequence (sequence of codes)
+        :param context: state of generation call
         :return: None
+        :raise ValueError: if the model has no known words
         """
-        buffer += list(random.choice(list(self.__frequency_model.keys())))
+        for _ in range(BEGINNING_DRAWS):
+            kgram = self.__frequency_model.random_kgram(context.random())
+            if self.__unknown is not None and self.__unknown in kgram:
+                # pruned words are not generated, draw again
+                continue
+            if self.__sentence_end in kgram:
+                # sentence begins after the last end in k-gram
+                kgram = kgram[len(kgram) - kgram[::-1].index(
+                    self.__sentence_end):]
+            if kgram:
+                buffer += kgram
+                return
+        known = [code for code in range(len(self.__code_table))
+                 if code != self.__unknown and code != self.__sentence_end]
+        if not known:
+            raise ValueError('model has no known words to begin text')
+        buffer.append(known[int(context.random() * len(known))])
 
-    def __make_choice(self, kgram: list):
+    def __make_choice(self, variants, context: GenerationContext):
         """
         Private method
 
-        Chooses randomly next word to continue sequence,
-        using numpy.random.choice of words (sequence of words)
-        according to their probabilities
+        Chooses randomly next word to continue sequence: draws point
+        in [0, total frequency) and finds its word in cumulative
+        frequencies of continuations with bisection.
 
-        :param kgram: last k-ths words of the sequence
-        :return: None
+        :param variants: sampling table of context or None
+        :param context: state of generation call
+        :return: code of chosen word or -1 (full-stop)
         """
-        variants = self.__model.get(tuple(kgram))
         if variants is None:
             return -1  # return full-stop if no continuation
-        words, probabilities = [], []
-        for word, probability in variants:
-            words.append(word)
-            probabilities.append(probability)
-
-        if words:
-            probabilities = numpy.array(probabilities)
-            # to avoid probabilities to sum up to
-            probabilities /= probabilities.sum()
-            result = numpy.random.choice(words, 1, p=probabilities)[0]
-        else:
-            result = -1
-        return result
+        words, cumulative = variants
+        point = context.random() * cumulative[-1]
+        return words[bisect.bisect_right(cumulative, point)]
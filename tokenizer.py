@@ -0,0 +1,78 @@
+import re
+
+import config
+
+"""
+
+    Tokenizer splits text into words of the model: characters of
+    chosen alphabets are kept, whitespace separates words, other
+    characters are removed by one substitution of precompiled
+    pattern. Ends of sentences may be kept as config.SENTENCE_END
+    tokens.
+
+"""
+
+
+class Tokenizer:
+
+    def __init__(self, alphabets: tuple = config.DEFAULT_ALPHABETS,
+                 lower: bool = False, sentence_end: bool = False):
+        # names of alphabets (see config.ALPHABETS), kept for pickling
+        self.__alphabets = tuple(alphabets)
+        self.__lower = lower
+        self.__sentence_end = sentence_end
+        letters = ''.join(config.ALPHABETS[name] for name in alphabets)
+        ends = re.escape(config.SENTENCE_END_CHARS)
+        if sentence_end:
+            # characters out of alphabets are removed, except ends
+            self.__removed = re.compile(
+                '[^%s%s\\s]+' % (re.escape(letters), ends))
+            # several marks in a row ('?!', '...') end one sentence
+            self.__ends = re.compile('[%s][%s\\s]*' % (ends, ends))
+        else:
+            self.__removed = re.compile(
+                '[^%s\\s]+' % re.escape(letters))
+
+    def split(self, text: str) -> list:
+        """
+        Public method
+
+        Splits text into words, line breaks are kept as separators,
+        so words of different lines are not glued.
+
+        :param text: text to split
+        :return: list of words (and sentence ends)
+
+        THIS FUNCTION IS USED IN MODEL.PY
+        """
+        text = self.__removed.sub('', text)
+        if self.__lower:
+            text = text.lower()
+        if self.__sentence_end:
+            text = self.__ends.sub(' %s ' % config.SENTENCE_END, text)
+        return text.split()
+
+    def __getstate__(self):
+        # compiled patterns are rebuilt after unpickling
+        return self.__alphabets, self.__lower, self.__sentence_end
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def from_arguments(namespace) -> Tokenizer:
+    """
+    Creates tokenizer from options of train.py
+
+    :param namespace: parsed arguments of train.py
+    :return: Tokenizer
+    :raise KeyError: if alphabet is unknown
+    """
+    alphabets = config.DEFAULT_ALPHABETS
+    if namespace.alphabet is not None:
+        alphabets = tuple(namespace.alphabet.split(','))
+        for name in alphabets:
+            if name not in config.ALPHABETS:
+                raise KeyError(name)
+    return Tokenizer(alphabets, lower=namespace.lc is not None,
+                     sentence_end=namespace.sentence_end is not None)
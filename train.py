@@ -1,68 +1,334 @@
 import argparse
+import collections
+import functools
+import itertools
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+import time
 
 import config
 import model
+import tokenizer
 import webparser
 import debugging
 
 
 @debugging.scan_dir
 def scan_dir(path):
-    for entry in os.scandir(path):
-        if not entry.is_file():
-            continue
+    entries = [entry for entry in os.scandir(path) if entry.is_file()]
+    if parser_namespace.jobs > 1:
+        scan_files_parallel(entries, parser_namespace.jobs)
+        return
+    for entry in entries:
         with open(entry.path, "r") as file:
             debugging.train_logger.info("\tparsing %s..." % entry.name)
-            for line in file:
-                train(line)
+            for lines in read_chunks(file):
+                train_chunk(lines)
+        # k-grams do not span documents
+        freq_model.reset_context()
+
+
+def scan_files_parallel(entries, jobs):
+    """
+    Counts k-grams of each file in worker processes and merges
+    shards into the model in order of files, so the result is the
+    same as in serial scan.
+    """
+    count = functools.partial(count_file, text_tokenizer=text_tokenizer)
+    with multiprocessing.Pool(jobs) as pool:
+        shards = pool.imap(count, [entry.path for entry in entries])
+        for entry, shard in zip(entries, shards):
+            debugging.train_logger.info("\tmerging %s..." % entry.name)
+            freq_model.merge(shard)
+
+
+def count_file(path, text_tokenizer):
+    """
+    Trains separate model (shard) on one file in worker process,
+    shard has its own lexicon.
+    """
+    shard = model.Model(config.N_GRAM_SIZE, text_tokenizer=text_tokenizer)
+    with open(path, "r") as file:
+        for lines in read_chunks(file):
+            shard.train_lines(lines)
+    return shard
+
+
+def read_chunks(file):
+    """Yields lists of config.CHUNK_SIZE lines of 'file'"""
+    while True:
+        lines = list(itertools.islice(file, config.CHUNK_SIZE))
+        if not lines:
+            return
+        yield lines
 
 
 @debugging.scan_stdin
 def scan_stdin():
-    for line in sys.stdin:
-        train(line)
+    # lines are split in bytes, so encoding must keep '\n' as it is
+    if parser_namespace.jobs > 1 and \
+            '\n'.encode(sys.stdin.encoding) == b'\n':
+        scan_stdin_parallel(parser_namespace.jobs)
+        return
+    for lines in read_chunks(sys.stdin):
+        train_chunk(lines)
+
+
+def scan_stdin_parallel(jobs):
+    """
+    Pipeline of training on stdin: reader thread splits stream into
+    tasks of config.TASK_CHUNKS chunks of lines (the same chunks as
+    in serial scan), worker processes decode and encode words of
+    tasks with their own lexicons, codes are translated to codes of
+    the model in order of tasks (words, carried from the previous
+    task, are prepended), then workers count k-grams of tasks and
+    counted k-grams are added to the model. Queue of read tasks and
+    numbers of tasks in workers are bounded, so reading waits for
+    merging. The model is the same as in serial scan.
+    """
+    encode = functools.partial(encode_chunks, text_tokenizer=text_tokenizer,
+                               encoding=sys.stdin.encoding,
+                               errors=sys.stdin.errors)
+    count = functools.partial(model.count_codes, n=config.N_GRAM_SIZE)
+    tasks = queue.Queue(jobs)
+    # results of workers in order of tasks and numbers of their lines
+    encoded, counted = collections.deque(), collections.deque()
+    # workers are forked before reader thread is started
+    with multiprocessing.Pool(jobs) as pool:
+        reader = threading.Thread(target=read_tasks,
+                                  args=(sys.stdin.buffer, tasks),
+                                  daemon=True)
+        reader.start()
+        while True:
+            task = tasks.get()
+            if isinstance(task, Exception):
+                raise task
+            if task is None:
+                break
+            chunks, lines = task
+            encoded.append((pool.apply_async(encode, (chunks,)), lines))
+            if len(encoded) > jobs:
+                count_task(pool, count, *encoded.popleft(), counted)
+            if len(counted) > jobs:
+                merge_task(*counted.popleft())
+        while encoded:
+            count_task(pool, count, *encoded.popleft(), counted)
+        while counted:
+            merge_task(*counted.popleft())
+    reader.join()
+
+
+def read_tasks(stream, tasks):
+    """
+    Puts tasks of binary 'stream' into queue 'tasks': lists of
+    config.TASK_CHUNKS chunks (bytes of config.CHUNK_SIZE lines) and
+    their numbers of lines. None is put at the end of stream,
+    exception is put, if reading fails.
+    """
+    try:
+        while True:
+            chunks, lines = [], 0
+            while len(chunks) < config.TASK_CHUNKS:
+                chunk = list(itertools.islice(stream, config.CHUNK_SIZE))
+                if not chunk:
+                    break
+                chunks.append(b''.join(chunk))
+                lines += len(chunk)
+            if not chunks:
+                break
+            tasks.put((chunks, lines))
+    except Exception as error:
+        tasks.put(error)
+        return
+    tasks.put(None)
+
+
+def encode_chunks(chunks, text_tokenizer, encoding, errors):
+    """Decodes and encodes chunks of stdin in worker process"""
+    return model.encode_texts(
+        (chunk.decode(encoding, errors) for chunk in chunks),
+        text_tokenizer)
+
+
+def count_task(pool, count, result, lines, counted):
+    words, codes = result.get()
+    codes, carried = freq_model.continue_text(codes, words)
+    counted.append((pool.apply_async(count, (codes, carried)), lines))
+
+
+def merge_task(result, lines):
+    freq_model.add_counted(result.get())
+    debugging.count('lines', lines)
 
 
 def parse_site(url):
     stream = webparser.WebParser(url).parser_content_stream()
-    for line in stream:
-        train(line)
+    with debugging.phase('train'):
+        for line in stream:
+            train(line)
+
+
+def crawl_sites(urls):
+    crawler = webparser.Crawler(urls.split(','), **crawl_options)
+    started = time.perf_counter()
+    with debugging.phase('train'):
+        for texts in crawler.crawl():
+            train_chunk(texts)
+            # k-grams do not span pages
+            freq_model.reset_context()
+    elapsed = time.perf_counter() - started
+    debugging.count('pages', crawler.pages)
+    debugging.webparser_logger.info(
+        "Crawled %d pages in %.1f s (%.1f pages/second)." % (
+            crawler.pages, elapsed, crawler.pages / max(elapsed, 1e-9)))
 
 
 def train(line):
-    if parser_namespace.lc is not None:
-        line = line.lower()
     freq_model.train(line)
+    debugging.count('lines')
+
+
+def train_chunk(lines):
+    freq_model.train_lines(lines)
+    debugging.count('lines', len(lines))
+
+
+@debugging.load_model
+def load_model(model_path):
+    """
+
+    Loads lexicon of stored model to continue its training.
+
+    :param model_path: path where model ('model.pkl') was stored
+    :return: None
+    """
+    with open(model_path, "rb") as file:
+        freq_model.load(file, lexicon_only=True)
 
 
 @debugging.store_model
 def store_model(model_path):
     """
 
-    Stores model.
+    Stores model. Updated model is appended to its file as a segment,
+    file with too many segments is rewritten as one. Model, trained
+    with --memory-budget, is stored in binary format (see convert.py),
+    which is written from k-grams spilled to disk by blocks.
 
     :param model_path: path where model (as 'model.pkl') will be stored
     :return: None
     """
-    with open(model_path, "wb") as file:
-        freq_model.store(file)
+    segments = freq_model.stored_segments()
+    if memory_limit is not None:
+        with open(model_path, "wb") as file:
+            freq_model.store_mapped(file)
+    elif not segments:
+        with open(model_path, "wb") as file:
+            freq_model.store(file)
+    elif segments < config.MAX_SEGMENTS:
+        with open(model_path, "ab") as file:
+            freq_model.store_update(file)
+    else:
+        compact_model(model_path)
 
 
-if __name__ == '__main__':
+def compact_model(model_path):
+    """
+    Sums all segments of stored model with the update and
+    replaces model file with a single segment one.
+    """
+    debugging.train_logger.info("Compacting model %s..." % model_path)
+    full_model = model.Model(config.N_GRAM_SIZE)
+    with open(model_path, "rb") as file:
+        full_model.load(file)
+    full_model.merge(freq_model)
+    with open(model_path + '.tmp', "wb") as file:
+        full_model.store(file)
+    os.replace(model_path + '.tmp', model_path)
 
-    freq_model = model.Model(config.N_GRAM_SIZE)
+
+if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     for argument, description in config.train_args.items():
         parser.add_argument(argument, help=description)
     parser_namespace, _ = parser.parse_known_args()
 
+    try:
+        # texts are split into words (and lowercased with --lc) by
+        # the same tokenizer in all ways of training
+        text_tokenizer = tokenizer.from_arguments(parser_namespace)
+    except KeyError as error:
+        print("Unknown alphabet %s" % error)
+        sys.exit(1)
+
+    try:
+        debugging.enable_metrics(parser_namespace.metrics,
+                                 parser_namespace.metrics_format,
+                                 parser_namespace.profile)
+    except ValueError:
+        print("Unknown metrics format %s" % parser_namespace.metrics_format)
+        sys.exit(1)
+
+    memory_limit = None
+    if parser_namespace.memory_budget is not None:
+        try:
+            memory_limit = int(
+                float(parser_namespace.memory_budget) * 2 ** 20)
+        except ValueError:
+            print("Cannot parse memory budget")
+            sys.exit(1)
+
+    freq_model = model.Model(config.N_GRAM_SIZE,
+                             compact=parser_namespace.compact is not None,
+                             text_tokenizer=text_tokenizer,
+                             memory_limit=memory_limit,
+                             spill_dir=parser_namespace.spill_dir)
+
     if parser_namespace.model is None:
         print('Model is undefined, terminating...')
         sys.exit(1)
 
+    try:
+        parser_namespace.jobs = int(parser_namespace.jobs or 1)
+    except ValueError:
+        print("Cannot parse number of jobs")
+        sys.exit(1)
+
+    try:
+        crawl_options = {
+            'depth': int(parser_namespace.depth or 2),
+            'max_pages': int(parser_namespace.max_pages or 100),
+            'connections': int(parser_namespace.connections or 8),
+            'per_host': int(parser_namespace.per_host or 4)
+        }
+    except ValueError:
+        print("Cannot parse crawling options")
+        sys.exit(1)
+
+    try:
+        prune = model.prune_options(parser_namespace)
+    except ValueError:
+        print("Cannot parse pruning options")
+        sys.exit(1)
+    if prune and parser_namespace.update is not None:
+        # pruning renumbers words, so it cannot be appended as update
+        print("Pruning is not supported with --update, "
+              "prune the model with convert.py")
+        sys.exit(1)
+    if memory_limit is not None and (
+            prune or parser_namespace.update is not None):
+        # model is stored in binary format, which is not updated
+        print("--memory-budget is not supported with --update "
+              "and pruning options")
+        sys.exit(1)
+
+    if parser_namespace.update is not None:
+        load_model(parser_namespace.model)
+
     trained = False
     if parser_namespace.input_dir is not None:
         scan_dir(parser_namespace.input_dir)
@@ -70,7 +336,16 @@ if __name__ == '__main__':
     if parser_namespace.webparse is not None:
         parse_site(parser_namespace.webparse)
         trained = True
+    if parser_namespace.crawl is not None:
+        crawl_sites(parser_namespace.crawl)
+        trained = True
     if not trained:
         scan_stdin()  # accord to the --help
 
+    if prune:
+        try:
+            freq_model.prune(**prune)
+        except ValueError as error:
+            print("Cannot prune model: %s" % error)
+            sys.exit(1)
     store_model(parser_namespace.model)
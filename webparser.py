@@ -1,16 +1,44 @@
+import codecs
+import collections
+import concurrent.futures
+import html.parser
+import re
 import sys
+import urllib.parse
 
 import requests
+import requests.adapters
+import urllib3.util
 
-from bs4 import BeautifulSoup
+try:
+    import lxml.etree
+except ImportError:
+    # pure python parser of the standard library is used instead
+    lxml = None
 
 import debugging
 
 tags = [
-    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6' 'q',
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'q',
     'blockquote', 'strong', 'em', 'del', 'ins',
     'blink', 'marquee', 'div'
 ]
+# tags, which do not break text of enclosing block
+inline_tags = {
+    'q', 'strong', 'em', 'del', 'ins', 'blink', 'a', 'b', 'i', 'u', 's',
+    'span', 'small', 'big', 'sub', 'sup', 'code', 'abbr', 'cite', 'mark',
+    'font', 'tt', 'kbd', 'var', 'time', 'label', 'wbr'
+}
+# tags, which text is not shown
+hidden_tags = {'script', 'style', 'noscript', 'template'}
+# size of pieces, in which page is fed to parser
+FEED_SIZE = 1 << 16
+# charset in Content-Type header and in <meta> tag of page
+HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+META_CHARSET = re.compile(
+    rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.I)
+# number of first bytes of page, where <meta> with charset is looked for
+META_SIZE = 4096
 
 """
 
@@ -25,10 +53,158 @@ tags = [
     
     
     The general idea of this parser's work is check only
-    tags, which were listed in list 'tags'.
+    tags, which were listed in list 'tags'. Page is parsed in one
+    pass: text goes to the innermost block, so text of nested tags
+    is taken once.
+
+    Crawler walks through pages of the site: it fetches pages
+    concurrently through a pool of keep-alive connections and
+    follows links to pages of the same sites.
 
 """
 
+# statuses, on which request is retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TextCollector:
+    """
+    Target of html parser: collects text of 'tags' by blocks and
+    links of the page.
+
+    Text is collected, while some tag from 'tags' is open. Start or
+    end of any tag except inline ones ends current block, so each
+    text node gets into exactly one block.
+    """
+
+    def __init__(self):
+        # number of open tags from 'tags' and hidden tags
+        self.__open = 0
+        self.__hidden = 0
+        # text pieces of current block
+        self.__pieces = []
+        # finished blocks and links, which are not taken yet
+        self.blocks = []
+        self.links = []
+
+    def start(self, tag, attributes):
+        if tag not in inline_tags:
+            self.__end_block()
+        if tag in tags:
+            self.__open += 1
+        elif tag in hidden_tags:
+            self.__hidden += 1
+        elif tag == 'a' and attributes.get('href'):
+            self.links.append(attributes['href'])
+
+    def end(self, tag):
+        if tag not in inline_tags:
+            self.__end_block()
+        if tag in tags:
+            self.__open = max(self.__open - 1, 0)
+        elif tag in hidden_tags:
+            self.__hidden = max(self.__hidden - 1, 0)
+
+    def data(self, text):
+        if self.__open and not self.__hidden:
+            self.__pieces.append(text)
+
+    def close(self):
+        self.__end_block()
+
+    def __end_block(self):
+        if self.__pieces:
+            text = ''.join(self.__pieces)
+            self.__pieces = []
+            if not text.isspace():
+                self.blocks.append(text)
+
+
+class StandardParser(html.parser.HTMLParser):
+    """
+    Html parser of the standard library, which calls methods of
+    'target' like parser of lxml does.
+    """
+
+    def __init__(self, target: TextCollector):
+        super().__init__()
+        self.__target = target
+
+    def handle_starttag(self, tag, attributes):
+        self.__target.start(tag, dict(attributes))
+
+    def handle_startendtag(self, tag, attributes):
+        self.__target.start(tag, dict(attributes))
+        self.__target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.__target.end(tag)
+
+    def handle_data(self, text):
+        self.__target.data(text)
+
+    def close(self):
+        super().close()
+        self.__target.close()
+
+
+def page_encoding(response) -> str:
+    """
+    Encoding of fetched page: charset of Content-Type header, else
+    charset of <meta> tag, else guessed from content of the page
+    (requests falls back to ISO-8859-1 for html without charset in
+    header, so its 'text' is not used).
+
+    :param response: requests.Response
+    :return: name of encoding
+    """
+    found = [HEADER_CHARSET.search(response.headers.get('Content-Type', '')),
+             META_CHARSET.search(response.content[:META_SIZE])]
+    for charset in found:
+        if charset is None:
+            continue
+        encoding = charset.group(1)
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode('ascii')
+        try:
+            return codecs.lookup(encoding).name
+        except LookupError:
+            continue
+    return response.apparent_encoding or 'utf-8'
+
+
+def extract_text(page_content, links: list = None, encoding: str = None):
+    """
+    Yields text of blocks of the page in one pass: page is fed to
+    parser by pieces and blocks are yielded as soon as they end.
+    Parser of lxml is used if it is installed.
+
+    :param page_content: html of the page, str or bytes
+    :param links: list, to which values of 'href' are appended
+    :param encoding: encoding of bytes of the page (see
+        'page_encoding'), if None, lxml reads it from <meta> tag
+    :return: generator of strings
+    """
+    collector = TextCollector()
+    if lxml is not None:
+        parser = lxml.etree.HTMLParser(
+            target=collector,
+            encoding=encoding if isinstance(page_content, bytes) else None)
+    else:
+        parser = StandardParser(collector)
+        if isinstance(page_content, bytes):
+            page_content = page_content.decode(encoding or 'utf-8',
+                                               'replace')
+    for begin in range(0, len(page_content), FEED_SIZE):
+        parser.feed(page_content[begin:begin + FEED_SIZE])
+        yield from collector.blocks
+        collector.blocks.clear()
+    if page_content:
+        parser.close()
+    yield from collector.blocks
+    if links is not None:
+        links += collector.links
+
 
 class WebParser:
 
@@ -49,18 +225,144 @@ class WebParser:
         This method creates generator, which takes content for web-page,
         checks tags from 'tags' and yields text data from them.
 
-        This method uses 'bs4' to parse text content from successful request,
-        'requests' is used to get request from site.
+        This method uses 'extract_text' to parse text content from
+        successful request, 'requests' is used to get request from site.
 
         :return: None
 
         THIS FUNCTION IS USED IN TRAIN.PY
         """
         page_content = self.__request.content
-        soup = BeautifulSoup(page_content, 'html.parser')
+        encoding = page_encoding(self.__request)
         debugging.webparser_logger.info("Parser created data stream.")
         debugging.webparser_logger.info("Parsing started.")
-        for tag in tags:
-            for elem in soup.find_all(tag):
-                yield elem.get_text()
+        yield from extract_text(page_content, encoding=encoding)
         debugging.webparser_logger.info("Parsing finished.")
+
+
+class Crawler:
+    """
+    Concurrent crawler of sites.
+
+    Pages are fetched by pool of threads through one requests.Session,
+    which keeps alive connections to each host (connection pooling)
+    and retries failed requests. Links are followed breadth first,
+    only to hosts of start pages, until 'depth' links from the start
+    page or 'max_pages' fetched pages. At most 'per_host' requests
+    go to one host at the same time.
+    """
+
+    def __init__(self, urls: list, depth: int = 2, max_pages: int = 100,
+                 connections: int = 8, per_host: int = 4,
+                 retries: int = 3, timeout: float = 10):
+        # pages, from which crawling is started
+        self.__urls = [self.__normalize(url) for url in urls]
+        # sites, which links are followed to
+        self.__hosts = {urllib.parse.urlsplit(url).netloc
+                        for url in self.__urls}
+        self.__depth = depth
+        self.__max_pages = max_pages
+        self.__connections = connections
+        self.__per_host = per_host
+        self.__timeout = timeout
+        self.__session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.__hosts), pool_maxsize=connections,
+            max_retries=urllib3.util.Retry(
+                total=retries, backoff_factor=0.5,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False))
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+        # number of fetched pages
+        self.pages = 0
+
+    def crawl(self):
+        """
+        Public method
+
+        This method creates generator, which fetches pages and yields
+        text data of each page as soon as it is parsed, so training
+        goes while next pages are downloaded.
+
+        :return: generator of lists of strings, one list per page
+
+        THIS FUNCTION IS USED IN TRAIN.PY
+        """
+        seen = set(self.__urls)
+        # pages to fetch: (url, depth), grouped by host
+        queued = collections.defaultdict(collections.deque)
+        for url in self.__urls:
+            queued[urllib.parse.urlsplit(url).netloc].append((url, 0))
+        running = collections.Counter()
+        futures = {}
+        scheduled = 0
+        with concurrent.futures.ThreadPoolExecutor(
+                self.__connections) as pool:
+            while True:
+                # fill free connections with pages of not busy hosts
+                for host, pages in queued.items():
+                    while pages and running[host] < self.__per_host \
+                            and len(futures) < self.__connections \
+                            and scheduled < self.__max_pages:
+                        url, depth = pages.popleft()
+                        futures[pool.submit(self.__fetch, url)] = \
+                            host, depth
+                        running[host] += 1
+                        scheduled += 1
+                if not futures:
+                    break
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    host, depth = futures.pop(future)
+                    running[host] -= 1
+                    texts, links = future.result()
+                    if texts is None:
+                        continue
+                    self.pages += 1
+                    if depth < self.__depth:
+                        for link in links:
+                            link_host = urllib.parse.urlsplit(link).netloc
+                            if link not in seen and \
+                                    link_host in self.__hosts:
+                                seen.add(link)
+                                queued[link_host].append((link, depth + 1))
+                    yield texts
+        self.__session.close()
+
+    def __fetch(self, url: str):
+        """
+        Private method
+
+        Downloads and parses page, runs in thread of pool.
+
+        :param url: address of page
+        :return: texts and absolute links of the page,
+            (None, None) if page cannot be fetched or is not html
+        """
+        try:
+            response = self.__session.get(url, timeout=self.__timeout)
+        except requests.RequestException as error:
+            debugging.webparser_logger.warning(
+                "Cannot fetch %s: %s" % (url, error))
+            return None, None
+        content_type = response.headers.get('Content-Type', 'text/html')
+        if response.status_code != 200 or 'html' not in content_type:
+            debugging.webparser_logger.warning(
+                "Skipped %s: status %d, %s" % (
+                    url, response.status_code, content_type))
+            return None, None
+        hrefs = []
+        texts = list(extract_text(response.content, hrefs,
+                                  page_encoding(response)))
+        links = [self.__normalize(urllib.parse.urljoin(url, href))
+                 for href in hrefs]
+        links = [link for link in links
+                 if link.startswith(('http://', 'https://'))]
+        return texts, links
+
+    @staticmethod
+    def __normalize(url: str) -> str:
+        """Removes fragment, so links to parts of page are one page"""
+        return urllib.parse.urldefrag(url)[0]